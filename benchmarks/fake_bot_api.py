@@ -0,0 +1,123 @@
+"""
+Локальная замена Telegram Bot API для бенчмарков
+
+Отвечает на любые методы бота правдоподобными ответами, умеет добавлять
+задержку, случайные 429 и ограничение частоты сообщений в один чат.
+"""
+import asyncio
+import json
+import random
+import time
+from collections import Counter
+
+from aiohttp import web
+
+# Методы, которые считаются отправкой сообщения
+SEND_METHODS = {
+    'sendmessage', 'sendphoto', 'sendvideo', 'sendvoice',
+    'sendsticker', 'sendmediagroup', 'copymessage', 'forwardmessage'
+}
+
+
+class FakeBotAPI:
+    """Фейковый сервер Bot API
+
+    Args:
+        latency: Задержка ответа в секундах
+        error_rate: Доля запросов, на которые отвечать 429
+        per_chat_rate: Сколько сообщений в секунду принимать в один чат (0 - без ограничения)
+        retry_after: Что возвращать в parameters.retry_after
+    """
+
+    def __init__(self, latency: float = 0.05, error_rate: float = 0.0,
+                 per_chat_rate: float = 0, retry_after: int = 1):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.per_chat_rate = per_chat_rate
+        self.retry_after = retry_after
+        self._last_sent = {}
+        self._message_id = 0
+        self._runner = None
+        self.url = None
+        self.reset()
+
+    def reset(self):
+        """Обнулить счетчики перед очередным замером"""
+        self.requests = Counter()
+        self.messages = 0
+        self.flood_errors = 0
+        self._last_sent.clear()
+
+    async def start(self, host: str = '127.0.0.1', port: int = 0):
+        """Запустить сервер; при port=0 выбирается свободный порт"""
+        app = web.Application()
+        app.router.add_post('/bot{token}/{method}', self.handle)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.url = f"http://{host}:{port}"
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+
+    def _flood(self, method: str) -> web.Response:
+        self.flood_errors += 1
+        return web.json_response({
+            'ok': False,
+            'error_code': 429,
+            'description': f"Too Many Requests: retry after {self.retry_after}",
+            'parameters': {'retry_after': self.retry_after}
+        })
+
+    def _message(self, chat_id: int, **fields) -> dict:
+        self._message_id += 1
+        return {
+            'message_id': self._message_id,
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private'},
+            **fields
+        }
+
+    async def handle(self, request: web.Request) -> web.Response:
+        method = request.match_info['method'].lower()
+        data = await request.post()
+        self.requests[method] += 1
+
+        await asyncio.sleep(self.latency)
+
+        if method == 'getme':
+            return web.json_response({'ok': True, 'result': {
+                'id': 1, 'is_bot': True, 'first_name': 'Bench', 'username': 'bench_bot'
+            }})
+
+        if method not in SEND_METHODS:
+            chat_id = int(data.get('chat_id') or 0)
+            return web.json_response({'ok': True, 'result': self._message(chat_id, text='')})
+
+        chat_id = int(data['chat_id'])
+
+        if self.error_rate and random.random() < self.error_rate:
+            return self._flood(method)
+
+        if self.per_chat_rate:
+            now = time.monotonic()
+            last = self._last_sent.get(chat_id)
+            if last is not None and now - last < 1 / self.per_chat_rate:
+                return self._flood(method)
+            self._last_sent[chat_id] = now
+
+        if method == 'sendmediagroup':
+            media = json.loads(data['media'])
+            self.messages += len(media)
+            result = [self._message(chat_id, photo=[{
+                'file_id': item['media'], 'file_unique_id': item['media'],
+                'width': 1, 'height': 1
+            }]) for item in media]
+            return web.json_response({'ok': True, 'result': result})
+
+        self.messages += 1
+        return web.json_response({'ok': True, 'result': self._message(chat_id, text=data.get('text', ''))})
@@ -0,0 +1,211 @@
+"""
+Бенчмарк путей доставки на фейковом Bot API
+
+Запуск:
+    python -m benchmarks.run --users 500 --photos 40 --latency 0.05 --error-rate 0.01
+
+Для каждого пути (рассылка, поздравления, новые фото, альбом) поднимается
+свежая синтетическая БД, бот направляется на локальный фейковый сервер, и
+печатаются время, число сообщений, скорость, количество ответов 429 и
+сколько осталось недоставленным.
+"""
+import argparse
+import asyncio
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+from unittest import mock
+
+# Настройки читаются при импорте, поэтому окружение готовим заранее:
+# фейковый токен, две тестовые учетки админов и временная БД
+BENCH_DIR = Path(tempfile.mkdtemp(prefix="vika-bench-"))
+os.environ["BOT_TOKEN"] = "123456:BENCHMARK"
+os.environ["ADMIN_IDS"] = "1,2"
+os.environ["DATABASE_PATH"] = str(BENCH_DIR / "bench.db")
+
+import aiosqlite
+from aiogram import Bot
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+
+from benchmarks.fake_bot_api import FakeBotAPI
+from config.settings import DATABASE_PATH
+from handlers import admin, utils  # admin регистрирует отправителя рассылки
+from services.database import db_pool
+from services.delivery import create_delivery_job, run_delivery_job
+from services.migrations import run_background_migrations
+from services.outbound import outbound_limiter
+from services.write_queue import write_queue
+
+logger = logging.getLogger(__name__)
+
+FIRST_USER_ID = 1000
+
+
+async def seed_database(users: int, photos: int, videos: int, wishes: int):
+    """Создать синтетическую БД с пользователями, поздравлениями и альбомом"""
+    for suffix in ("", "-wal", "-shm"):
+        Path(f"{DATABASE_PATH}{suffix}").unlink(missing_ok=True)
+
+    await utils.init_database()
+
+    user_ids = range(FIRST_USER_ID, FIRST_USER_ID + users)
+    async with aiosqlite.connect(DATABASE_PATH) as db:
+        await db.executemany(
+            "INSERT INTO users (user_id, username, first_name) VALUES (?, ?, ?)",
+            [(user_id, f"user{user_id}", f"Гость {user_id}") for user_id in user_ids]
+        )
+        await db.executemany(
+            "INSERT INTO wishes (user_id, content_type, content) VALUES (?, 'text', ?)",
+            [(FIRST_USER_ID + i % max(users, 1), f"Поздравление #{i}") for i in range(wishes)]
+        )
+        await db.executemany(
+            "INSERT INTO album_files (user_id, file_id, file_type) VALUES (?, ?, ?)",
+            [(FIRST_USER_ID, f"photo-{i}", 'photo') for i in range(photos)]
+            + [(FIRST_USER_ID, f"video-{i}", 'video') for i in range(videos)]
+        )
+        await db.commit()
+
+    return list(user_ids)
+
+
+async def count_rows(sql: str) -> int:
+    """Количество строк результата запроса"""
+    async with db_pool.acquire() as db:
+        async with db.execute(f"SELECT COUNT(*) FROM ({sql})") as cursor:
+            return (await cursor.fetchone())[0]
+
+
+# Каждый путь возвращает, сколько осталось недоставленным: получателей
+# задания, поздравлений или пар (пользователь, фото)
+async def bench_broadcast(bot: Bot, user_ids) -> int:
+    """Путь /broadcast"""
+    job_id = await create_delivery_job('broadcast', {'text': "Бенчмарк рассылки"}, user_ids)
+    stats = await run_delivery_job(bot, job_id)
+    return stats['total'] - stats['sent']
+
+
+async def bench_birthday_wishes(bot: Bot, user_ids) -> int:
+    """Доставка поздравлений в день рождения"""
+    await utils.send_birthday_wishes(bot)
+    return await count_rows("SELECT id FROM wishes WHERE delivered = 0")
+
+
+async def bench_new_photos(bot: Bot, user_ids) -> int:
+    """Ежечасная отправка новых фото"""
+    # Путь работает только до архивного режима, а даты в настройках реальные
+    with mock.patch.object(utils, 'is_archive_mode', return_value=False):
+        await utils.send_new_photos_to_users(bot)
+    return await count_rows(utils.HOT_QUERIES['missing_photos'])
+
+
+async def bench_album(bot: Bot, user_ids) -> int:
+    """Создание и рассылка альбома"""
+    await utils.create_album(bot)
+    return await count_rows("SELECT chat_id FROM delivery_recipients WHERE status != 'sent'")
+
+
+PATHS = {
+    'broadcast': bench_broadcast,
+    'wishes': bench_birthday_wishes,
+    'new_photos': bench_new_photos,
+    'album': bench_album,
+}
+
+
+async def run_path(name: str, server: FakeBotAPI, bot: Bot, args) -> dict:
+    """Замерить один путь доставки на свежей БД"""
+    user_ids = await seed_database(args.users, args.photos, args.videos, args.wishes)
+    await db_pool.open()
+    await write_queue.start()
+    try:
+        await run_background_migrations(pause=0)
+        outbound_limiter.reset()
+        server.reset()
+
+        started = time.monotonic()
+        undelivered = await PATHS[name](bot, user_ids)
+        elapsed = time.monotonic() - started
+    finally:
+        await write_queue.close()
+        await db_pool.close()
+
+    return {
+        'path': name,
+        'elapsed': elapsed,
+        'messages': server.messages,
+        'requests': sum(server.requests.values()),
+        'rate': server.messages / elapsed if elapsed > 0 else 0.0,
+        'flood_errors': server.flood_errors,
+        'undelivered': undelivered,
+    }
+
+
+def print_report(results, args):
+    print(
+        f"\nПользователей: {args.users}, фото: {args.photos}, видео: {args.videos}, "
+        f"поздравлений: {args.wishes}, задержка API: {args.latency * 1000:.0f} мс, "
+        f"429: {args.error_rate:.1%}, лимит на чат: {args.per_chat_rate or '-'}"
+    )
+    print(
+        f"{'путь':<12}{'время, с':>10}{'сообщений':>11}{'запросов':>10}{'сообщ./с':>10}"
+        f"{'429':>7}{'не доставлено':>15}"
+    )
+    for result in results:
+        print(
+            f"{result['path']:<12}{result['elapsed']:>10.2f}{result['messages']:>11}"
+            f"{result['requests']:>10}{result['rate']:>10.1f}{result['flood_errors']:>7}"
+            f"{result['undelivered']:>15}"
+        )
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк путей доставки на фейковом Bot API")
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--photos', type=int, default=30)
+    parser.add_argument('--videos', type=int, default=2)
+    parser.add_argument('--wishes', type=int, default=100)
+    parser.add_argument('--latency', type=float, default=0.05, help="Задержка ответа API, с")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="Доля случайных ответов 429")
+    parser.add_argument('--per-chat-rate', type=float, default=0, help="Сообщений в секунду на чат (0 - без лимита)")
+    parser.add_argument('--retry-after', type=int, default=1)
+    parser.add_argument('--paths', nargs='+', choices=list(PATHS), default=list(PATHS))
+    parser.add_argument('--verbose', action='store_true')
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        level=logging.INFO if args.verbose else logging.CRITICAL,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        stream=sys.stderr
+    )
+
+    server = FakeBotAPI(
+        latency=args.latency,
+        error_rate=args.error_rate,
+        per_chat_rate=args.per_chat_rate,
+        retry_after=args.retry_after
+    )
+    await server.start()
+    bot = Bot(
+        token=os.environ["BOT_TOKEN"],
+        session=AiohttpSession(api=TelegramAPIServer.from_base(server.url))
+    )
+
+    results = []
+    try:
+        for name in args.paths:
+            results.append(await run_path(name, server, bot, args))
+    finally:
+        await bot.session.close()
+        await server.stop()
+        shutil.rmtree(BENCH_DIR, ignore_errors=True)
+
+    print_report(results, args)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -30,8 +30,38 @@ ADMIN_IDS = [
 if len(ADMIN_IDS) != 2:
     raise ValueError("Должно быть указано ровно 2 ADMIN_IDS в .env файле!")
 
+# Режим получения обновлений: "polling" (getUpdates) или "webhook"
+BOT_MODE = os.getenv("BOT_MODE", "polling").strip().lower()
+if BOT_MODE not in ("polling", "webhook"):
+    raise ValueError("BOT_MODE должен быть polling или webhook!")
+
+# Webhook: Telegram присылает обновления на WEBHOOK_URL + WEBHOOK_PATH
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "").rstrip("/")
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
+
+if BOT_MODE == "webhook" and not (WEBHOOK_URL and WEBHOOK_SECRET):
+    raise ValueError("Для BOT_MODE=webhook нужны WEBHOOK_URL и WEBHOOK_SECRET в .env файле!")
+
+# Обновления разных чатов обрабатываются параллельно, одного чата - по очереди
+UPDATE_MAX_CONCURRENCY = 50   # Сколько обновлений обрабатывать одновременно
+
+# Встроенный веб-сервер (webhook и /health)
+WEB_SERVER_HOST = os.getenv("WEB_SERVER_HOST", "0.0.0.0")
+WEB_SERVER_PORT = int(os.getenv("WEB_SERVER_PORT", "8000"))
+
 # База данных
-DATABASE_PATH = DATA_DIR / "bot.db"
+DATABASE_PATH = Path(os.getenv("DATABASE_PATH", DATA_DIR / "bot.db"))
+DATABASE_POOL_SIZE = 4        # Количество долгоживущих соединений с БД
+WRITE_QUEUE_FLUSH_INTERVAL = 0.01  # Сколько секунд копить записи перед коммитом
+WRITE_QUEUE_MAX_BATCH = 100   # Максимум записей в одной транзакции
+DATABASE_CACHE_SIZE_KB = 8192 # Размер страничного кэша SQLite на соединение (КБ)
+DATABASE_MMAP_SIZE = 64 * 1024 * 1024  # Сколько байт БД отображать в память
+DATABASE_BUSY_TIMEOUT_MS = 5000  # Сколько ждать снятия блокировки записи
+FSM_CACHE_SIZE = 1000         # Сколько состояний FSM держать в памяти
+FSM_STATE_TTL = 7 * 24 * 3600  # Через сколько секунд удалять заброшенное состояние FSM
+BACKGROUND_MIGRATION_BATCH_SIZE = 500  # Строк за одну пачку фоновой миграции
+BACKGROUND_MIGRATION_PAUSE = 0.05  # Пауза между пачками (секунды)
 
 # Логирование
 ERROR_LOG_PATH = LOGS_DIR / "error.log"
@@ -47,8 +77,27 @@ ARCHIVE_DATE = "2025-10-31"   # Дата перехода в архивный р
 
 # Ограничения
 MAX_FILES_PER_USER = 5        # Максимум файлов на пользователя в альбоме
-RATE_LIMIT_MESSAGES = 5       # Лимит сообщений в минуту
+RATE_LIMIT_MESSAGES = 20      # Лимит сообщений и нажатий кнопок в минуту
 RATE_LIMIT_WINDOW = 60        # Окно для rate limit в секундах
+RATE_LIMIT_MAX_USERS = 10000  # Сколько пользователей помнить в rate limit
+ADMIN_LIST_PAGE_SIZE = 10     # Строк на странице админских списков
+
+# Лимиты Telegram Bot API для исходящих сообщений
+TELEGRAM_GLOBAL_RATE = 30     # Сообщений в секунду на бота
+TELEGRAM_PER_CHAT_RATE = 1    # Сообщений в секунду в один чат
+TELEGRAM_MAX_RETRIES = 3      # Повторов после flood control (RetryAfter)
+TELEGRAM_MIN_GLOBAL_RATE = 5  # Ниже этой скорости адаптивный лимит не опускается
+TELEGRAM_RATE_BACKOFF = 2     # Во сколько раз снижать скорость при глобальном flood control
+TELEGRAM_RATE_RECOVERY = 1    # На сколько сообщ./с за секунду скорость возвращается к лимиту
+TELEGRAM_GLOBAL_FLOOD_CHATS = 5     # Столько разных чатов с 429 ...
+TELEGRAM_GLOBAL_FLOOD_WINDOW = 1    # ... за это окно (секунды) - это глобальный flood control
+
+# Рассылки
+BROADCAST_CONCURRENCY = 20    # Сколько чатов обслуживать одновременно
+BROADCAST_PROGRESS_INTERVAL = 3  # Как часто обновлять статус рассылки (секунды)
+DELIVERY_MAX_ATTEMPTS = 3     # Сколько раз пытаться доставить одному получателю
+DELIVERY_RETRY_DELAY = 5      # Пауза перед повтором временных ошибок (секунды, удваивается)
+ALBUM_FANOUT_CONCURRENCY = 40  # Сколько получателей альбома обслуживать одновременно
 
 # Настройки альбома
 ALBUM_DELAY_DAYS = 7          # Через сколько дней после ДР показать альбом
@@ -308,6 +308,13 @@ ARCHIVE_MODE = """
 Спасибо за участие в праздновании дня рождения Вики! 🎂❤️
 """
 
+ARCHIVE_START = "📦 Бот в архивном режиме. Доступны только базовые функции."
+
+# Кнопки, которые остаются в архивном режиме
+ARCHIVE_MENU_BUTTONS = [
+    ["🔮 Вика-гадалка", "🎁 Вишлист"]
+]
+
 # === ОШИБКИ ===
 ERROR_MESSAGE = """
 ❌ Произошла ошибка!
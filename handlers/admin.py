@@ -1,7 +1,9 @@
 """
 Админские команды
 """
+import asyncio
 import logging
+import re
 from datetime import datetime
 
 from aiogram import Router, F
@@ -17,10 +19,16 @@ from config.texts import (
     ALBUM_SENT,
     STATS_MESSAGE
 )
+from handlers.pagination import register_list_view, send_list, shorten
 from handlers.utils import (
-    send_birthday_wishes, create_album, get_confirmed_guests_list, get_all_users_stats,
-    add_wishlist_item, get_wishlist_items, delete_wishlist_item, format_wishlist
+    send_birthday_wishes, create_album, get_all_users_stats,
+    add_wishlist_item, get_wishlist_items, delete_wishlist_item, format_wishlist,
+    send_new_photos_to_users, get_stats_counters, repair_stats_counters
 )
+from services.database import db_pool
+from services.broadcast import format_broadcast_progress
+from services.delivery import register_sender, create_delivery_job, run_delivery_job, cancel_delivery_job
+from services.jobs import job_queue, register_job, format_job
 
 router = Router()
 logger = logging.getLogger(__name__)
@@ -32,14 +40,171 @@ class WishlistStates(StatesGroup):
     waiting_for_delete_id = State()
 
 
+async def send_broadcast_to_chat(bot: Bot, chat_id: int, payload: dict, call):
+    """Отправить сообщение рассылки одному получателю (задание доставки 'broadcast')"""
+    await call(lambda: bot.send_message(chat_id, payload['text']))
+
+
+register_sender('broadcast', send_broadcast_to_chat)
+
+
+async def run_open_presents_job(bot: Bot, params: dict, report) -> str:
+    """Задание 'open_presents': отправить все поздравления"""
+    await send_birthday_wishes(bot)
+    return "Все поздравления отправлены"
+
+
+async def run_get_album_job(bot: Bot, params: dict, report) -> str:
+    """Задание 'get_album': создать и разослать альбом"""
+    debug_mode = params.get('debug', False)
+    await create_album(bot, debug_mode=debug_mode)
+    return "Альбом отправлен админам (дебаг режим)" if debug_mode else "Альбом создан и отправлен"
+
+
+async def run_send_new_photos_job(bot: Bot, params: dict, report) -> str:
+    """Задание 'send_new_photos': досылка новых фото пользователям"""
+    await send_new_photos_to_users(bot)
+    return "Проверка и отправка новых фото завершена"
+
+
+async def run_broadcast_job(bot: Bot, params: dict, report) -> str:
+    """Задание 'broadcast': рассылка текста всем пользователям
+    
+    Сама рассылка - задание доставки, так что после перезапуска она
+    продолжится с того же места; отмена через /cancel_job снимает и его.
+    """
+    async with db_pool.acquire() as db:
+        async with db.execute("SELECT user_id FROM users") as cursor:
+            user_ids = [row[0] for row in await cursor.fetchall()]
+    
+    delivery_job_id = await create_delivery_job('broadcast', {'text': params['text']}, user_ids)
+    try:
+        stats = await run_delivery_job(bot, delivery_job_id, on_progress=report)
+    except asyncio.CancelledError:
+        if not job_queue.is_closing:
+            await cancel_delivery_job(delivery_job_id)
+        raise
+    
+    return f"Отправлено: {stats['sent']}, ошибок: {stats['failed']}"
+
+
+register_job('open_presents', run_open_presents_job, "Поздравления")
+register_job('get_album', run_get_album_job, "Альбом")
+register_job('send_new_photos', run_send_new_photos_job, "Новые фото")
+register_job('broadcast', run_broadcast_job, "Рассылка", format_progress=format_broadcast_progress)
+
+
+# === ПОСТРАНИЧНЫЕ СПИСКИ ===
+def format_song_request_item(number: int, row) -> str:
+    _, track, first_name, username, timestamp = row
+    user_name = first_name or username or "Аноним"
+    return f"{number}. <b>{shorten(track)}</b>\n   👤 {shorten(user_name)}\n   📅 {timestamp}"
+
+
+def format_debug_wish_item(number: int, row) -> str:
+    _, author_id, content_type, content, first_name, username, timestamp = row
+    user_name = first_name or username or "Нет имени"
+    return (
+        f"👤 <b>User ID:</b> {author_id}\n"
+        f"📝 <b>Имя:</b> {shorten(user_name)}\n"
+        f"📄 <b>Тип:</b> {content_type}\n"
+        f"💬 <b>Содержимое:</b> {shorten(content, 50)}\n"
+        f"📅 <b>Время:</b> {timestamp}"
+    )
+
+
+def format_guest_item(number: int, row) -> str:
+    confirmed_at, _, first_name, last_name, username = row
+    display_name = first_name or "Неизвестно"
+    if last_name:
+        display_name += f" {last_name}"
+    if username:
+        display_name += f" (@{username})"
+    return f"{number}. {shorten(display_name)}\n   📅 {confirmed_at[:16]}"
+
+
+def guest_key(row) -> tuple:
+    """Ключ гостя: время подтверждения цифрами (ГГГГММДДччммсс) и user_id"""
+    return int(re.sub(r"\D", "", row[0])), row[1]
+
+
+def parse_guest_key(values) -> tuple:
+    confirmed_at = datetime.strptime(str(values[0]), "%Y%m%d%H%M%S").strftime("%Y-%m-%d %H:%M:%S")
+    return confirmed_at, values[1]
+
+
+def format_wishlist_admin_item(number: int, row) -> str:
+    item_id, text, timestamp = row
+    return f"<b>ID {item_id}:</b> {shorten(text)}\n📅 {timestamp[:16]}"
+
+
+register_list_view(
+    'song_requests', "🎵 <b>Предложения треков</b>",
+    """
+        SELECT sr.id, sr.track_text, u.first_name, u.username, sr.timestamp
+        FROM song_requests sr
+        LEFT JOIN users u ON sr.user_id = u.user_id
+    """,
+    key=("sr.id",), descending=True, format_item=format_song_request_item,
+    empty_text="📭 Пока нет предложений треков."
+)
+register_list_view(
+    'debug_wishes', "🔍 <b>Последние поздравления</b>",
+    """
+        SELECT w.id, w.user_id, w.content_type, w.content, u.first_name, u.username, w.timestamp
+        FROM wishes w
+        LEFT JOIN users u ON w.user_id = u.user_id
+    """,
+    key=("w.id",), descending=True, format_item=format_debug_wish_item,
+    empty_text="📭 Нет сохраненных поздравлений."
+)
+register_list_view(
+    'guests', "👥 <b>Подтвердили участие</b>",
+    """
+        SELECT gc.confirmed_at, gc.user_id, u.first_name, u.last_name, u.username
+        FROM guest_confirmations gc
+        JOIN users u ON gc.user_id = u.user_id
+    """,
+    key=("gc.confirmed_at", "gc.user_id"), format_item=format_guest_item,
+    empty_text="👥 Пока никто не подтвердил участие в вечеринке",
+    key_of=guest_key, parse_key=parse_guest_key
+)
+register_list_view(
+    'wishlist_admin', "🎁 <b>Вишлист Вики (админ-режим)</b>",
+    "SELECT id, text, timestamp FROM wishlist_items",
+    key=("id",), format_item=format_wishlist_admin_item,
+    empty_text="📭 Вишлист пуст.",
+    footer="💡 <b>Команды:</b>\n/add_wishlist_item - добавить элемент\n/delete_wishlist_item - удалить элемент"
+)
+
+
 def is_admin(user_id: int) -> bool:
     """Проверить, является ли пользователь администратором"""
     logger.info(f"Проверка админа: user_id={user_id}, ADMIN_IDS={ADMIN_IDS}, результат={user_id in ADMIN_IDS}")
     return user_id in ADMIN_IDS
 
 
+async def submit_admin_job(message: Message, kind: str, params: dict = None):
+    """Поставить задание в очередь и сразу ответить админу
+    
+    Ответ - единственное статусное сообщение задания: задания с
+    format_progress (рассылка) правят его по ходу выполнения.
+    """
+    status_message = await message.answer("📥 Ставим задание в очередь...")
+    job_id, created = await job_queue.submit(
+        kind, params, created_by=message.from_user.id, chat_id=message.chat.id,
+        status_message_id=status_message.message_id
+    )
+    
+    if created:
+        await status_message.edit_text(f"📥 Задание #{job_id} поставлено в очередь. Статус: /jobs")
+        logger.info(f"Админ {message.from_user.id} поставил задание #{job_id} ({kind})")
+    else:
+        await status_message.edit_text(f"⚠️ Такое задание уже выполняется: #{job_id}. Статус: /jobs")
+
+
 @router.message(F.text == "/open_presents")
-async def cmd_open_presents(message: Message, bot: Bot):
+async def cmd_open_presents(message: Message):
     """Вручную отправить все поздравления"""
     try:
         user_id = message.from_user.id
@@ -48,14 +213,7 @@ async def cmd_open_presents(message: Message, bot: Bot):
             await message.answer(ADMIN_ONLY)
             return
         
-        await message.answer("📦 Отправляю все поздравления...")
-        
-        # Отправляем поздравления
-        await send_birthday_wishes(bot)
-        
-        await message.answer("✅ Все поздравления отправлены!")
-        
-        logger.info(f"Админ {user_id} вручную отправил поздравления")
+        await submit_admin_job(message, 'open_presents')
         
     except Exception as e:
         logger.error(f"Ошибка в cmd_open_presents: {e}")
@@ -63,7 +221,7 @@ async def cmd_open_presents(message: Message, bot: Bot):
 
 
 @router.message(F.text.startswith("/get_album"))
-async def cmd_get_album(message: Message, bot: Bot):
+async def cmd_get_album(message: Message):
     """Получить собранный альбом
     
     Использование:
@@ -81,20 +239,7 @@ async def cmd_get_album(message: Message, bot: Bot):
         command_parts = message.text.split()
         debug_mode = len(command_parts) > 1 and command_parts[1].lower() == "debug"
         
-        if debug_mode:
-            await message.answer("📸 Создаю альбом в дебаг режиме (только для админов)...")
-        else:
-            await message.answer("📸 Создаю альбом...")
-        
-        # Создаем альбом
-        await create_album(bot, debug_mode=debug_mode)
-        
-        if debug_mode:
-            await message.answer("✅ Альбом создан и отправлен в дебаг режиме!")
-            logger.info(f"Админ {user_id} вручную создал альбом в дебаг режиме")
-        else:
-            await message.answer("✅ Альбом создан и отправлен!")
-            logger.info(f"Админ {user_id} вручную создал альбом")
+        await submit_admin_job(message, 'get_album', {'debug': debug_mode})
         
     except Exception as e:
         logger.error(f"Ошибка в cmd_get_album: {e}")
@@ -102,7 +247,7 @@ async def cmd_get_album(message: Message, bot: Bot):
 
 
 @router.message(F.text == "/send_new_photos")
-async def cmd_send_new_photos(message: Message, bot: Bot):
+async def cmd_send_new_photos(message: Message):
     """Вручную отправить новые фото пользователям"""
     try:
         user_id = message.from_user.id
@@ -111,21 +256,63 @@ async def cmd_send_new_photos(message: Message, bot: Bot):
             await message.answer(ADMIN_ONLY)
             return
         
-        await message.answer("📸 Проверяю новые фото и отправляю пользователям...")
+        await submit_admin_job(message, 'send_new_photos')
         
-        # Импортируем функцию из utils
-        from handlers.utils import send_new_photos_to_users
+    except Exception as e:
+        logger.error(f"Ошибка в cmd_send_new_photos: {e}")
+        await message.answer("❌ Произошла ошибка при отправке новых фото.")
+
+
+@router.message(F.text == "/jobs")
+async def cmd_jobs(message: Message):
+    """Показать очередь админских заданий и последние завершенные"""
+    try:
+        user_id = message.from_user.id
         
-        # Отправляем новые фото
-        await send_new_photos_to_users(bot)
+        if not is_admin(user_id):
+            await message.answer(ADMIN_ONLY)
+            return
         
-        await message.answer("✅ Проверка и отправка новых фото завершена!")
+        jobs = await job_queue.list_jobs()
         
-        logger.info(f"Админ {user_id} вручную запустил отправку новых фото")
+        if not jobs:
+            await message.answer("🗂 Заданий пока не было.")
+            return
+        
+        text = "🗂 <b>Задания</b>\n\n" + "\n".join(format_job(job) for job in jobs)
+        text += "\n\nОтменить: /cancel_job ID"
+        await message.answer(text, parse_mode="HTML")
         
     except Exception as e:
-        logger.error(f"Ошибка в cmd_send_new_photos: {e}")
-        await message.answer("❌ Произошла ошибка при отправке новых фото.")
+        logger.error(f"Ошибка в cmd_jobs: {e}")
+        await message.answer("❌ Произошла ошибка.")
+
+
+@router.message(F.text.startswith("/cancel_job"))
+async def cmd_cancel_job(message: Message):
+    """Отменить задание из очереди или выполняющееся"""
+    try:
+        user_id = message.from_user.id
+        
+        if not is_admin(user_id):
+            await message.answer(ADMIN_ONLY)
+            return
+        
+        arg = message.text.replace("/cancel_job", "").strip()
+        
+        if not arg.isdigit():
+            await message.answer("❌ Укажите номер задания.\nПример: /cancel_job 3")
+            return
+        
+        if await job_queue.cancel(int(arg)):
+            await message.answer(f"🚫 Задание #{arg} отменяется.")
+            logger.info(f"Админ {user_id} отменил задание #{arg}")
+        else:
+            await message.answer(f"❌ Задание #{arg} не найдено или уже завершено.")
+        
+    except Exception as e:
+        logger.error(f"Ошибка в cmd_cancel_job: {e}")
+        await message.answer("❌ Произошла ошибка.")
 
 
 @router.message(F.text == "/stats")
@@ -161,36 +348,15 @@ async def cmd_stats(message: Message):
 async def get_bot_stats() -> dict:
     """Получить статистику бота"""
     try:
-        import aiosqlite
-        from config.settings import DATABASE_PATH
-        
-        async with aiosqlite.connect(DATABASE_PATH) as db:
-            # Количество пользователей
-            async with db.execute("SELECT COUNT(*) FROM users") as cursor:
-                users_row = await cursor.fetchone()
-                users = users_row[0] if users_row else 0
-            
-            # Количество поздравлений
-            async with db.execute("SELECT COUNT(*) FROM wishes") as cursor:
-                wishes_row = await cursor.fetchone()
-                wishes = wishes_row[0] if wishes_row else 0
-            
-            # Количество файлов в альбоме
-            async with db.execute("SELECT COUNT(*) FROM album_files") as cursor:
-                files_row = await cursor.fetchone()
-                files = files_row[0] if files_row else 0
-            
-            # Количество предложений треков
-            async with db.execute("SELECT COUNT(*) FROM song_requests") as cursor:
-                songs_row = await cursor.fetchone()
-                songs = songs_row[0] if songs_row else 0
-            
-            return {
-                'users': users,
-                'wishes': wishes,
-                'files': files,
-                'songs': songs
-            }
+        # Счетчики ведут триггеры, так что это одно чтение вместо COUNT(*) по таблицам
+        counters = await get_stats_counters()
+        
+        return {
+            'users': counters['users'],
+            'wishes': counters['wishes'],
+            'files': counters['album_files'],
+            'songs': counters['song_requests']
+        }
             
     except Exception as e:
         logger.error(f"Ошибка получения статистики: {e}")
@@ -202,6 +368,31 @@ async def get_bot_stats() -> dict:
         }
 
 
+@router.message(F.text == "/repair_stats")
+async def cmd_repair_stats(message: Message):
+    """Пересчитать счетчики статистики с нуля"""
+    try:
+        user_id = message.from_user.id
+        
+        if not is_admin(user_id):
+            await message.answer(ADMIN_ONLY)
+            return
+        
+        drift = await repair_stats_counters()
+        
+        if drift:
+            lines = [f"• {name}: {old} → {new}" for name, (old, new) in drift.items()]
+            await message.answer("🔧 Счетчики пересчитаны, исправлено:\n" + "\n".join(lines))
+        else:
+            await message.answer("✅ Счетчики пересчитаны, расхождений нет.")
+        
+        logger.info(f"Админ {user_id} пересчитал счетчики статистики")
+        
+    except Exception as e:
+        logger.error(f"Ошибка в cmd_repair_stats: {e}")
+        await message.answer("❌ Произошла ошибка при пересчете статистики.")
+
+
 @router.message(F.text == "/test")
 async def cmd_test(message: Message):
     """Тестовая команда для проверки работы роутера"""
@@ -235,6 +426,7 @@ async def cmd_admin_help(message: Message):
 📊 <b>Статистика:</b>
 /stats - Общая статистика бота
 /users - Подробная статистика пользователей  
+/repair_stats - Пересчитать счетчики статистики
 /guests - Список подтвердивших участие
 
 🔍 <b>Отладка:</b>
@@ -246,6 +438,8 @@ async def cmd_admin_help(message: Message):
 /get_album debug - Получить альбом только админам (дебаг режим)
 /send_new_photos - Отправить новые фото пользователям (вручную)
 /get_song_requests - Предложения треков
+/jobs - Очередь заданий и их прогресс
+/cancel_job &lt;id&gt; - Отменить задание
 
 🎁 <b>Управление вишлистом:</b>
 /add_wishlist_item - Добавить элемент в вишлист
@@ -286,29 +480,7 @@ async def cmd_broadcast(message: Message):
             await message.answer("❌ Укажите текст для рассылки.\nПример: /broadcast Привет всем!")
             return
         
-        # Получаем список всех пользователей
-        import aiosqlite
-        from config.settings import DATABASE_PATH
-        
-        async with aiosqlite.connect(DATABASE_PATH) as db:
-            async with db.execute("SELECT user_id FROM users") as cursor:
-                user_ids = await cursor.fetchall()
-        
-        # Отправляем сообщение всем пользователям
-        sent = 0
-        failed = 0
-        
-        for user_id_tuple in user_ids:
-            try:
-                await message.bot.send_message(user_id_tuple[0], text)
-                sent += 1
-            except Exception as e:
-                logger.error(f"Ошибка отправки рассылки пользователю {user_id_tuple[0]}: {e}")
-                failed += 1
-        
-        await message.answer(f"✅ Рассылка завершена!\nОтправлено: {sent}\nОшибок: {failed}")
-        
-        logger.info(f"Админ {user_id} отправил рассылку: {sent} успешно, {failed} ошибок")
+        await submit_admin_job(message, 'broadcast', {'text': text})
         
     except Exception as e:
         logger.error(f"Ошибка в cmd_broadcast: {e}")
@@ -399,7 +571,7 @@ async def cmd_get_start_photos(message: Message):
 
 @router.message(F.text == "/get_song_requests")
 async def cmd_get_song_requests(message: Message):
-    """Показать все предложения треков"""
+    """Показать предложения треков (постранично)"""
     try:
         user_id = message.from_user.id
         
@@ -407,25 +579,7 @@ async def cmd_get_song_requests(message: Message):
             await message.answer(ADMIN_ONLY)
             return
         
-        from handlers.utils import get_all_song_requests
-        
-        requests = await get_all_song_requests()
-        
-        if not requests:
-            await message.answer("📭 Пока нет предложений треков.")
-            return
-        
-        response = "🎵 <b>Предложения треков:</b>\n\n"
-        
-        for i, (track, first_name, username, timestamp) in enumerate(requests, 1):
-            user_name = first_name or username or "Аноним"
-            response += f"{i}. <b>{track}</b>\n"
-            response += f"   👤 {user_name}\n"
-            response += f"   📅 {timestamp}\n\n"
-        
-        response += f"<b>Всего предложений:</b> {len(requests)}"
-        
-        await message.answer(response)
+        await send_list(message, 'song_requests')
         
     except Exception as e:
         logger.error(f"Ошибка в cmd_get_song_requests: {e}")
@@ -434,7 +588,7 @@ async def cmd_get_song_requests(message: Message):
 
 @router.message(F.text == "/debug_wishes")
 async def cmd_debug_wishes(message: Message):
-    """Показать сохраненные поздравления для отладки"""
+    """Показать сохраненные поздравления для отладки (постранично, новые сверху)"""
     try:
         user_id = message.from_user.id
         
@@ -442,37 +596,7 @@ async def cmd_debug_wishes(message: Message):
             await message.answer(ADMIN_ONLY)
             return
         
-        import aiosqlite
-        from config.settings import DATABASE_PATH
-        
-        async with aiosqlite.connect(DATABASE_PATH) as db:
-            async with db.execute("""
-                SELECT w.user_id, w.content_type, w.content, u.first_name, u.username, w.timestamp
-                FROM wishes w
-                LEFT JOIN users u ON w.user_id = u.user_id
-                ORDER BY w.timestamp DESC
-                LIMIT 10
-            """) as cursor:
-                wishes = await cursor.fetchall()
-        
-        if not wishes:
-            await message.answer("📭 Нет сохраненных поздравлений.")
-            return
-        
-        response = "🔍 <b>Последние поздравления:</b>\n\n"
-        
-        for wish in wishes:
-            user_id_db, content_type, content, first_name, username, timestamp = wish
-            user_name = first_name or username or "Нет имени"
-            content_preview = content[:50] + "..." if len(content) > 50 else content
-            
-            response += f"👤 <b>User ID:</b> {user_id_db}\n"
-            response += f"📝 <b>Имя:</b> {user_name}\n"
-            response += f"📄 <b>Тип:</b> {content_type}\n"
-            response += f"💬 <b>Содержимое:</b> {content_preview}\n"
-            response += f"📅 <b>Время:</b> {timestamp}\n\n"
-        
-        await message.answer(response)
+        await send_list(message, 'debug_wishes')
         
     except Exception as e:
         logger.error(f"Ошибка в cmd_debug_wishes: {e}")
@@ -481,44 +605,13 @@ async def cmd_debug_wishes(message: Message):
 
 @router.message(F.text == "/guests")
 async def cmd_guests_list(message: Message):
-    """Показать список пользователей, подтвердивших участие"""
+    """Показать список пользователей, подтвердивших участие (постранично)"""
     if not is_admin(message.from_user.id):
         await message.answer(ADMIN_ONLY)
         return
     
     try:
-        guests = await get_confirmed_guests_list()
-        
-        if not guests:
-            await message.answer("👥 Пока никто не подтвердил участие в вечеринке")
-            return
-        
-        text = f"👥 Подтвердили участие ({len(guests)} чел.):\n\n"
-        
-        for i, guest in enumerate(guests, 1):
-            text += f"{i}. {guest['display_name']}\n"
-            text += f"   📅 {guest['confirmed_at'][:16]}\n\n"
-        
-        # Разбиваем на части если слишком длинно
-        if len(text) > 4000:
-            parts = []
-            lines = text.split('\n\n')
-            current_part = f"👥 Подтвердили участие ({len(guests)} чел.):\n\n"
-            
-            for line in lines[1:]:  # Пропускаем заголовок
-                if len(current_part + line + '\n\n') > 3800:
-                    parts.append(current_part)
-                    current_part = line + '\n\n'
-                else:
-                    current_part += line + '\n\n'
-            
-            if current_part.strip():
-                parts.append(current_part)
-            
-            for part in parts:
-                await message.answer(part)
-        else:
-            await message.answer(text)
+        await send_list(message, 'guests')
         
         logger.info(f"Админ {message.from_user.id} запросил список гостей")
         
@@ -629,7 +722,7 @@ async def handle_add_wishlist_item(message: Message, state: FSMContext):
 
 @router.message(F.text == "/show_wishlist_admin")
 async def cmd_show_wishlist_admin(message: Message):
-    """Показать вишлист с ID элементов для админа"""
+    """Показать вишлист с ID элементов для админа (постранично)"""
     try:
         user_id = message.from_user.id
         
@@ -637,24 +730,7 @@ async def cmd_show_wishlist_admin(message: Message):
             await message.answer(ADMIN_ONLY)
             return
         
-        items = await get_wishlist_items()
-        
-        if not items:
-            await message.answer("📭 Вишлист пуст.")
-            return
-        
-        response = "🎁 <b>Вишлист Вики (админ-режим):</b>\n\n"
-        
-        for item_id, text, timestamp in items:
-            response += f"<b>ID {item_id}:</b> {text}\n"
-            response += f"📅 {timestamp[:16]}\n\n"
-        
-        response += f"<b>Всего элементов:</b> {len(items)}\n\n"
-        response += "💡 <b>Команды:</b>\n"
-        response += "/add_wishlist_item - добавить элемент\n"
-        response += "/delete_wishlist_item - удалить элемент"
-        
-        await message.answer(response)
+        await send_list(message, 'wishlist_admin')
         
     except Exception as e:
         logger.error(f"Ошибка в cmd_show_wishlist_admin: {e}")
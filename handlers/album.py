@@ -19,7 +19,10 @@ from config.texts import (
     MAIN_MENU_BUTTON
 )
 from config.settings import MAX_FILES_PER_USER, ALBUM_DELAY_DAYS
-from handlers.utils import add_user, is_after_birthday, get_days_until_birthday
+from handlers.utils import add_user, get_days_until_birthday
+from services.cache import TTLCache
+from services.database import db_pool
+from services.write_queue import write_queue
 
 router = Router()
 logger = logging.getLogger(__name__)
@@ -30,27 +33,14 @@ class AlbumStates(StatesGroup):
     uploading_files = State()
 
 
-# Словарь для отслеживания пользователей, которые загружают файлы
-album_uploaders = {}
-
-# Словарь для отслеживания последних уведомлений (избегаем спам)
-last_notifications = {}
+# Кому недавно подтверждали сохранение файла (избегаем спам). Кто сейчас
+# загружает файлы, знает FSM: состояние AlbumStates.uploading_files
+recent_notifications = TTLCache(maxsize=10000, ttl=3)
 
 
 async def start_album_upload(message: Message, user_id: int, from_user=None, state: FSMContext = None):
     """Начать загрузку файлов в альбом"""
     try:
-        # Очищаем состояние поздравлений если пользователь был в процессе отправки
-        from handlers.wishes import wish_collectors
-        if user_id in wish_collectors:
-            wish_collectors.pop(user_id, None)
-            logger.info(f"📸 Очищено состояние поздравлений для пользователя {user_id}")
-        
-        # Проверяем, наступил ли день рождения
-        if not is_after_birthday():
-            await message.answer("📸 Загрузка фото пока недоступна! Альбом откроется 26 сентября 2025 года.")
-            return
-        
         # Используем from_user если передан, иначе message.from_user
         user_info = from_user or message.from_user
         
@@ -81,15 +71,12 @@ async def start_album_upload(message: Message, user_id: int, from_user=None, sta
             reply_markup=builder.as_markup()
         )
         
-        # Отмечаем, что пользователь загружает файлы
-        album_uploaders[user_id] = True
-        
-        # Устанавливаем состояние FSM
+        # Устанавливаем состояние FSM (оно же заменяет незаконченное поздравление)
         if state:
             await state.set_state(AlbumStates.uploading_files)
             logger.info(f"📸 Состояние FSM установлено для пользователя {user_id}")
         
-        logger.info(f"📸 Пользователь {user_id} начал загрузку в альбом, album_uploaders={album_uploaders}")
+        logger.info(f"📸 Пользователь {user_id} начал загрузку в альбом")
         
     except Exception as e:
         logger.error(f"Ошибка в start_album_upload: {e}")
@@ -97,13 +84,14 @@ async def start_album_upload(message: Message, user_id: int, from_user=None, sta
 
 
 @router.callback_query(F.data == "cancel_album")
-async def cancel_album_upload(callback: CallbackQuery):
+async def cancel_album_upload(callback: CallbackQuery, state: FSMContext):
     """Отменить загрузку в альбом"""
     try:
         user_id = callback.from_user.id
         
-        # Убираем пользователя из списка загружающих
-        album_uploaders.pop(user_id, None)
+        # Выходим из режима загрузки
+        if await state.get_state() == AlbumStates.uploading_files.state:
+            await state.clear()
         
         await callback.message.edit_text("❌ Загрузка в альбом отменена.")
         await callback.answer()
@@ -115,18 +103,29 @@ async def cancel_album_upload(callback: CallbackQuery):
         await callback.answer("❌ Ошибка", show_alert=True)
 
 
+async def notify_file_saved(message: Message, user_id: int):
+    """Подтвердить сохранение, но не чаще раза в 3 секунды"""
+    if user_id in recent_notifications:
+        return
+    recent_notifications.set(user_id, True)
+    
+    # Создаем клавиатуру с кнопкой возврата в меню
+    from handlers.menu import get_back_to_menu_keyboard
+    
+    # Просто подтверждаем сохранение
+    await message.answer(
+        "✅ Файл сохранен в альбом!",
+        reply_markup=get_back_to_menu_keyboard()
+    )
+
+
 @router.message(F.photo, AlbumStates.uploading_files)
 async def handle_album_photo(message: Message, state: FSMContext):
     """Обработать фото для альбома"""
     try:
         user_id = message.from_user.id
         
-        logger.info(f"📸 DEBUG: Получено фото от пользователя {user_id}, album_uploaders={album_uploaders}")
-        
-        # Проверяем, загружает ли пользователь файлы
-        if user_id not in album_uploaders:
-            logger.info(f"📸 DEBUG: Пользователь {user_id} не в списке загружающих")
-            return
+        logger.info(f"📸 DEBUG: Получено фото от пользователя {user_id}")
         
         # Получаем file_id самого большого фото
         photo = message.photo[-1]
@@ -135,25 +134,7 @@ async def handle_album_photo(message: Message, state: FSMContext):
         # Сохраняем файл в БД
         await save_album_file(user_id, 'photo', file_id)
         
-        # Отправляем уведомление только если прошло больше 3 секунд с последнего
-        import time
-        current_time = time.time()
-        should_notify = True
-        
-        if user_id in last_notifications:
-            if current_time - last_notifications[user_id] < 3:  # 3 секунды
-                should_notify = False
-        
-        if should_notify:
-            # Создаем клавиатуру с кнопкой возврата в меню
-            from handlers.menu import get_back_to_menu_keyboard
-            
-            # Просто подтверждаем сохранение
-            await message.answer(
-                "✅ Файл сохранен в альбом!",
-                reply_markup=get_back_to_menu_keyboard()
-            )
-            last_notifications[user_id] = current_time
+        await notify_file_saved(message, user_id)
         
         logger.info(f"Пользователь {user_id} загрузил фото в альбом")
         
@@ -162,41 +143,19 @@ async def handle_album_photo(message: Message, state: FSMContext):
         await message.answer("❌ Произошла ошибка при сохранении фото.")
 
 
-@router.message(F.video)
-async def handle_album_video(message: Message):
+@router.message(F.video, AlbumStates.uploading_files)
+async def handle_album_video(message: Message, state: FSMContext):
     """Обработать видео для альбома"""
     try:
         user_id = message.from_user.id
         
-        # Проверяем, загружает ли пользователь файлы
-        if user_id not in album_uploaders:
-            return
-        
         # Получаем file_id видео
         file_id = message.video.file_id
         
         # Сохраняем файл в БД
         await save_album_file(user_id, 'video', file_id)
         
-        # Отправляем уведомление только если прошло больше 3 секунд с последнего
-        import time
-        current_time = time.time()
-        should_notify = True
-        
-        if user_id in last_notifications:
-            if current_time - last_notifications[user_id] < 3:  # 3 секунды
-                should_notify = False
-        
-        if should_notify:
-            # Создаем клавиатуру с кнопкой возврата в меню
-            from handlers.menu import get_back_to_menu_keyboard
-            
-            # Просто подтверждаем сохранение
-            await message.answer(
-                "✅ Файл сохранен в альбом!",
-                reply_markup=get_back_to_menu_keyboard()
-            )
-            last_notifications[user_id] = current_time
+        await notify_file_saved(message, user_id)
         
         logger.info(f"Пользователь {user_id} загрузил видео в альбом")
         
@@ -205,41 +164,19 @@ async def handle_album_video(message: Message):
         await message.answer("❌ Произошла ошибка при сохранении видео.")
 
 
-@router.message(F.voice)
-async def handle_album_voice(message: Message):
+@router.message(F.voice, AlbumStates.uploading_files)
+async def handle_album_voice(message: Message, state: FSMContext):
     """Обработать голосовое сообщение для альбома"""
     try:
         user_id = message.from_user.id
         
-        # Проверяем, загружает ли пользователь файлы
-        if user_id not in album_uploaders:
-            return
-        
         # Получаем file_id голосового сообщения
         file_id = message.voice.file_id
         
         # Сохраняем файл в БД
         await save_album_file(user_id, 'voice', file_id)
         
-        # Отправляем уведомление только если прошло больше 3 секунд с последнего
-        import time
-        current_time = time.time()
-        should_notify = True
-        
-        if user_id in last_notifications:
-            if current_time - last_notifications[user_id] < 3:  # 3 секунды
-                should_notify = False
-        
-        if should_notify:
-            # Создаем клавиатуру с кнопкой возврата в меню
-            from handlers.menu import get_back_to_menu_keyboard
-            
-            # Просто подтверждаем сохранение
-            await message.answer(
-                "✅ Файл сохранен в альбом!",
-                reply_markup=get_back_to_menu_keyboard()
-            )
-            last_notifications[user_id] = current_time
+        await notify_file_saved(message, user_id)
         
         logger.info(f"Пользователь {user_id} загрузил голосовое в альбом")
         
@@ -251,10 +188,7 @@ async def handle_album_voice(message: Message):
 async def get_user_files_count(user_id: int) -> int:
     """Получить количество файлов пользователя в альбоме"""
     try:
-        import aiosqlite
-        from config.settings import DATABASE_PATH
-        
-        async with aiosqlite.connect(DATABASE_PATH) as db:
+        async with db_pool.acquire() as db:
             async with db.execute("""
                 SELECT COUNT(*) FROM album_files WHERE user_id = ?
             """, (user_id,)) as cursor:
@@ -269,15 +203,11 @@ async def get_user_files_count(user_id: int) -> int:
 async def save_album_file(user_id: int, file_type: str, file_id: str):
     """Сохранить файл альбома в БД"""
     try:
-        import aiosqlite
-        from config.settings import DATABASE_PATH
-        
-        async with aiosqlite.connect(DATABASE_PATH) as db:
-            await db.execute("""
-                INSERT INTO album_files (user_id, file_id, file_type)
-                VALUES (?, ?, ?)
-            """, (user_id, file_id, file_type))
-            await db.commit()
+        # Запись уходит в общую пачку, ждем коммита
+        await write_queue.execute("""
+            INSERT INTO album_files (user_id, file_id, file_type)
+            VALUES (?, ?, ?)
+        """, (user_id, file_id, file_type))
             
     except Exception as e:
         logger.error(f"Ошибка сохранения файла альбома: {e}")
@@ -285,14 +215,12 @@ async def save_album_file(user_id: int, file_type: str, file_id: str):
 
 
 @router.message(Command("cancel"))
-async def cmd_cancel_album(message: Message):
+async def cmd_cancel_album(message: Message, state: FSMContext):
     """Команда отмены загрузки в альбом"""
     try:
-        user_id = message.from_user.id
-        
-        # Убираем пользователя из списка загружающих
-        if user_id in album_uploaders:
-            album_uploaders.pop(user_id, None)
+        # Выходим из режима загрузки
+        if await state.get_state() == AlbumStates.uploading_files.state:
+            await state.clear()
             await message.answer("❌ Загрузка в альбом отменена.")
         else:
             await message.answer("❌ Нет активных операций для отмены.")
@@ -17,18 +17,16 @@ from config.texts import (
     WHAT_TO_BRING,
     WISHLIST,
     ALBUM_NOT_READY,
-    ARCHIVE_MODE,
     GUEST_CONFIRMED,
     GUEST_ALREADY_CONFIRMED
 )
 from handlers.utils import (
     get_days_until_birthday,
-    is_archive_mode,
     is_after_birthday,
     get_guest_count,
-    confirm_guest_participation,
-    is_guest_confirmed
+    confirm_guest_participation
 )
+from services.event_calendar import event_calendar
 
 router = Router()
 logger = logging.getLogger(__name__)
@@ -41,56 +39,73 @@ def get_back_to_menu_keyboard():
     return builder.as_markup()
 
 
+# callback_data кнопок главного меню (тексты - в MAIN_MENU_BUTTONS)
+MAIN_MENU_CALLBACKS = {
+    "📍 Где будет тусовка?": "party_location",
+    "🕐 Во сколько начало?": "party_time",
+    "🎒 Что взять с собой?": "what_to_bring",
+    "🎁 Вишлист": "wishlist",
+    "💌 Поздравить Вику (тайно!)": "send_wish",
+    "📸 Загрузи фотки с тусовки!": "album_not_ready",
+    "🔮 Вика-гадалка": "fortune",
+    "👥 Я буду!": "confirm_attendance",
+    "🎵 Предложить трек для караоке": "song_request",
+    "⏳ До ДР: {days} дней": "birthday_timer",
+}
+
+# После дня рождения часть кнопок ведет в другое место
+MAIN_MENU_AFTER_BIRTHDAY_CALLBACKS = {
+    "📸 Загрузи фотки с тусовки!": "upload_photos",
+}
+
+# Готовые клавиатуры на сегодня: (days_left, after_birthday) -> InlineKeyboardMarkup
+_main_menu_keyboards = {}
+# День, для которого собраны клавиатуры (в полночь кэш сбрасывается)
+_main_menu_day = None
+
+
+def build_main_menu_keyboard(days_left: int, after_birthday: bool):
+    """Собрать клавиатуру главного меню по таблице кнопок"""
+    callbacks = MAIN_MENU_CALLBACKS
+    if after_birthday:
+        callbacks = {**MAIN_MENU_CALLBACKS, **MAIN_MENU_AFTER_BIRTHDAY_CALLBACKS}
+    
+    builder = InlineKeyboardBuilder()
+    for row in MAIN_MENU_BUTTONS:
+        for button_text in row:
+            callback_data = callbacks.get(button_text)
+            if callback_data is None:
+                logger.warning(f"Для кнопки меню '{button_text}' не задан callback_data")
+                continue
+            builder.button(text=button_text.format(days=days_left), callback_data=callback_data)
+    
+    builder.adjust(2)
+    return builder.as_markup()
+
+
+def get_main_menu_keyboard():
+    """Клавиатура главного меню с таймером на сегодня (из кэша)"""
+    global _main_menu_day
+    
+    today = event_calendar.today
+    if today != _main_menu_day:
+        # Наступили новые сутки: старые клавиатуры больше не понадобятся
+        _main_menu_keyboards.clear()
+        _main_menu_day = today
+    
+    key = (get_days_until_birthday(), is_after_birthday())
+    keyboard = _main_menu_keyboards.get(key)
+    if keyboard is None:
+        keyboard = _main_menu_keyboards[key] = build_main_menu_keyboard(*key)
+    return keyboard
+
+
 async def show_main_menu(message: Message, user_id: int):
     """Показать главное меню"""
     try:
-        # Проверяем архивный режим
-        if is_archive_mode():
-            await message.answer(ARCHIVE_MODE)
-            return
-        
-        # Получаем количество дней до дня рождения
-        days_left = get_days_until_birthday()
-        
-        # Создаем клавиатуру с обновленным таймером
-        builder = InlineKeyboardBuilder()
-        
-        for row in MAIN_MENU_BUTTONS:
-            for button_text in row:
-                # Заменяем плейсхолдер для таймера
-                if "{days}" in button_text:
-                    button_text = button_text.format(days=days_left)
-                
-                # Определяем callback_data для каждой кнопки
-                if "Где будет тусовка?" in button_text:
-                    builder.button(text=button_text, callback_data="party_location")
-                elif "Во сколько начало?" in button_text:
-                    builder.button(text=button_text, callback_data="party_time")
-                elif "Что взять с собой?" in button_text:
-                    builder.button(text=button_text, callback_data="what_to_bring")
-                elif "Вишлист" in button_text:
-                    builder.button(text=button_text, callback_data="wishlist")
-                elif "Поздравить Вику" in button_text:
-                    builder.button(text=button_text, callback_data="send_wish")
-                elif "фотки" in button_text:
-                    if is_after_birthday():
-                        builder.button(text=button_text, callback_data="upload_photos")
-                    else:
-                        builder.button(text=button_text, callback_data="album_not_ready")
-                elif "Вика-гадалка" in button_text:
-                    builder.button(text=button_text, callback_data="fortune")
-                elif "Я буду" in button_text:
-                    builder.button(text=button_text, callback_data="confirm_attendance")
-                elif "Предложить трек" in button_text or "караоке" in button_text:
-                    builder.button(text=button_text, callback_data="song_request")
-                elif "До ДР:" in button_text:
-                    builder.button(text=button_text, callback_data="birthday_timer")
-        
-        builder.adjust(2)
-        
         await message.answer(
             MAIN_MENU_MESSAGE,
-            reply_markup=builder.as_markup()
+            reply_markup=get_main_menu_keyboard()
         )
         
     except Exception as e:
@@ -239,22 +254,18 @@ async def confirm_attendance(callback: CallbackQuery):
     try:
         user_id = callback.from_user.id
         
-        # Проверяем, подтвердил ли уже пользователь участие
-        already_confirmed = await is_guest_confirmed(user_id)
-        count = await get_guest_count()
+        # Проверка "уже подтверждал" и запись - одна операция
+        confirmed = await confirm_guest_participation(user_id)
         
-        if already_confirmed:
-            # Пользователь уже подтвердил участие
-            message_text = GUEST_ALREADY_CONFIRMED.format(count=count)
-        else:
+        if confirmed is None:
+            message_text = "❌ Произошла ошибка при подтверждении участия"
+        elif confirmed:
             # Новое подтверждение
-            success = await confirm_guest_participation(user_id)
-            if success:
-                count = await get_guest_count()  # Обновляем счетчик
-                message_text = GUEST_CONFIRMED.format(count=count)
-                logger.info(f"Пользователь {user_id} подтвердил участие в вечеринке")
-            else:
-                message_text = "❌ Произошла ошибка при подтверждении участия"
+            message_text = GUEST_CONFIRMED.format(count=get_guest_count())
+            logger.info(f"Пользователь {user_id} подтвердил участие в вечеринке")
+        else:
+            # Пользователь уже подтвердил участие
+            message_text = GUEST_ALREADY_CONFIRMED.format(count=get_guest_count())
         
         await callback.message.edit_text(
             message_text,
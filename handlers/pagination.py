@@ -0,0 +1,181 @@
+"""
+Постраничные списки для админских команд
+
+Каждая страница - один запрос с условием по ключу последней показанной
+строки (keyset), а не OFFSET и не выборка всей таблицы, поэтому листание
+одинаково быстрое на любой странице. Список - одно сообщение с кнопками
+◀️/▶️, которые редактируют его на месте.
+"""
+import html
+import logging
+from collections import namedtuple
+from typing import Optional
+
+from aiogram import Router
+from aiogram.filters.callback_data import CallbackData
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import Message, CallbackQuery
+from aiogram.utils.keyboard import InlineKeyboardBuilder
+
+from config.settings import ADMIN_IDS, ADMIN_LIST_PAGE_SIZE
+from config.texts import ADMIN_ONLY
+from services.database import db_pool
+
+router = Router()
+logger = logging.getLogger(__name__)
+
+# select - SELECT ... FROM ... без WHERE и ORDER BY;
+# key - колонки ключа сортировки (уникального в совокупности);
+# descending - новые сверху; key_of(row) -> значения ключа в виде целых чисел,
+# parse_key(ints) -> параметры запроса; format_item(номер, row) -> текст строки
+ListView = namedtuple("ListView", [
+    "title", "select", "key", "descending", "format_item", "empty_text", "footer",
+    "key_of", "parse_key"
+])
+
+# Зарегистрированные списки: name -> ListView
+LIST_VIEWS = {}
+
+
+class ListPage(CallbackData, prefix="lp"):
+    """Кнопка листания: список, направление, ключ крайней строки и номер страницы"""
+    view: str
+    direction: str
+    cursor: str
+    page: int
+
+
+def register_list_view(name: str, title: str, select: str, key: tuple, format_item,
+                       empty_text: str, descending: bool = False, footer: str = "",
+                       key_of=None, parse_key=None):
+    """Зарегистрировать постраничный список
+
+    По умолчанию ключ - целые колонки, которые идут в выборке первыми.
+    """
+    LIST_VIEWS[name] = ListView(
+        title, select, key, descending, format_item, empty_text, footer,
+        key_of or (lambda row: row[:len(key)]),
+        parse_key or (lambda values: values)
+    )
+
+
+def shorten(text, limit: int = 200) -> str:
+    """Обрезать пользовательский текст и экранировать его для HTML"""
+    text = str(text) if text is not None else ""
+    if len(text) > limit:
+        text = text[:limit] + "..."
+    return html.escape(text)
+
+
+def page_query(view: ListView, with_cursor: bool, forward: bool = True) -> str:
+    """SQL страницы: параметры - ключ крайней строки (если with_cursor) и LIMIT"""
+    # Идем по индексу в ту сторону, куда листаем
+    ascending = forward != view.descending
+    direction = "ASC" if ascending else "DESC"
+    order = ", ".join(f"{column} {direction}" for column in view.key)
+
+    sql = view.select
+    if with_cursor:
+        columns = ", ".join(view.key)
+        placeholders = ", ".join("?" * len(view.key))
+        sql += f" WHERE ({columns}) {'>' if ascending else '<'} ({placeholders})"
+    return sql + f" ORDER BY {order} LIMIT ?"
+
+
+async def fetch_page(view: ListView, after: Optional[tuple] = None, forward: bool = True) -> tuple:
+    """Строки одной страницы в порядке списка
+
+    Возвращает (rows, has_more): has_more - есть ли еще строки за страницей
+    в направлении листания.
+    """
+    sql = page_query(view, after is not None, forward)
+    params = tuple(view.parse_key(after)) if after is not None else ()
+
+    async with db_pool.acquire() as db:
+        async with db.execute(sql, params + (ADMIN_LIST_PAGE_SIZE + 1,)) as cursor:
+            rows = await cursor.fetchall()
+
+    has_more = len(rows) > ADMIN_LIST_PAGE_SIZE
+    rows = rows[:ADMIN_LIST_PAGE_SIZE]
+    if not forward:
+        rows.reverse()
+    return rows, has_more
+
+
+def encode_cursor(view: ListView, row) -> str:
+    """Ключ строки для callback_data: целые числа через '_'"""
+    return "_".join(str(int(value)) for value in view.key_of(row))
+
+
+def decode_cursor(cursor: str) -> tuple:
+    """Обратное к encode_cursor"""
+    return tuple(int(value) for value in cursor.split("_"))
+
+
+async def render_page(name: str, cursor: str = None, forward: bool = True,
+                      page: int = 1) -> tuple:
+    """Текст и клавиатура страницы списка name"""
+    view = LIST_VIEWS[name]
+    rows, has_more = await fetch_page(view, decode_cursor(cursor) if cursor else None, forward)
+
+    if not rows:
+        return view.empty_text, None
+
+    first_number = (page - 1) * ADMIN_LIST_PAGE_SIZE + 1
+    items = [view.format_item(number, row) for number, row in enumerate(rows, first_number)]
+    parts = [f"{view.title} (стр. {page})", "\n\n".join(items)]
+    if view.footer:
+        parts.append(view.footer)
+    text = "\n\n".join(parts)
+
+    # Назад можно, если это не первая страница, вперед - если за ней что-то есть
+    has_prev = page > 1 if forward else has_more
+    has_next = has_more if forward else True
+
+    builder = InlineKeyboardBuilder()
+    if has_prev:
+        builder.button(text="◀️", callback_data=ListPage(
+            view=name, direction="prev", cursor=encode_cursor(view, rows[0]), page=page - 1
+        ))
+    if has_next:
+        builder.button(text="▶️", callback_data=ListPage(
+            view=name, direction="next", cursor=encode_cursor(view, rows[-1]), page=page + 1
+        ))
+    keyboard = builder.as_markup() if has_prev or has_next else None
+    return text, keyboard
+
+
+async def send_list(message: Message, name: str):
+    """Отправить первую страницу списка"""
+    text, keyboard = await render_page(name)
+    await message.answer(text, reply_markup=keyboard)
+
+
+@router.callback_query(ListPage.filter())
+async def turn_page(callback: CallbackQuery, callback_data: ListPage):
+    """Перелистнуть список на месте"""
+    try:
+        if callback.from_user.id not in ADMIN_IDS:
+            await callback.answer(ADMIN_ONLY, show_alert=True)
+            return
+
+        if callback_data.view not in LIST_VIEWS:
+            await callback.answer("Список устарел", show_alert=True)
+            return
+
+        text, keyboard = await render_page(
+            callback_data.view,
+            cursor=callback_data.cursor,
+            forward=callback_data.direction == "next",
+            page=max(callback_data.page, 1)
+        )
+        try:
+            await callback.message.edit_text(text, reply_markup=keyboard)
+        except TelegramBadRequest:
+            # Страница не изменилась (двойное нажатие)
+            pass
+        await callback.answer()
+
+    except Exception as e:
+        logger.error(f"Ошибка в turn_page: {e}")
+        await callback.answer("❌ Ошибка", show_alert=True)
@@ -15,7 +15,7 @@ from config.texts import (
     DONT_REMEMBER_VIKA_MESSAGE,
     START_BUTTONS
 )
-from handlers.utils import is_archive_mode, save_user_choice, add_user
+from handlers.utils import save_user_choice, add_user
 
 router = Router()
 logger = logging.getLogger(__name__)
@@ -27,11 +27,6 @@ async def cmd_start(message: Message):
     try:
         user_id = message.from_user.id
         
-        # Проверяем архивный режим
-        if is_archive_mode():
-            await message.answer("📦 Бот в архивном режиме. Доступны только базовые функции.")
-            return
-        
         # Создаем клавиатуру
         builder = InlineKeyboardBuilder()
         for row in START_BUTTONS:
@@ -2,10 +2,11 @@
 Утилиты для бота: таймер, счетчик, гадалка, база данных
 """
 import asyncio
+import json
 import logging
 import random
 import aiosqlite
-from datetime import datetime, date
+from datetime import date
 from pathlib import Path
 
 from aiogram import Bot, Router, F
@@ -17,14 +18,14 @@ router = Router()
 
 from config.settings import (
     DATABASE_PATH,
-    BIRTHDAY_DATE,
+    BIRTHDAY_TIME,
     REMINDER_DATE,
     REMINDER_TIME,
     SONG_RESULTS_DATE,
     SONG_RESULTS_TIME,
-    ARCHIVE_DATE,
     SCHEDULER_TIMEZONE,
-    ADMIN_IDS
+    ADMIN_IDS,
+    ALBUM_FANOUT_CONCURRENCY
 )
 from config.texts import (
     FORTUNE_LIST,
@@ -33,177 +34,145 @@ from config.texts import (
     PRESENTS_SENT,
     ALBUM_SENT
 )
+from handlers.pagination import LIST_VIEWS, page_query
+from services.database import db_pool, configure_connection, explain_query_plan
+from services.delivery import register_sender, create_delivery_job, run_delivery_job, cancel_delivery_job
+from services.event_calendar import event_calendar
+from services.jobs import job_queue
+from services.broadcast import broadcast
+from services.metrics import DB_QUERY_SECONDS, timed_query
+from services.migrations import run_migrations, is_background_migration_done
+from services.write_queue import write_queue
 
 logger = logging.getLogger(__name__)
 
 
+# Горячие запросы: используются в коде и проверяются на индексы при старте
+HOT_QUERIES = {
+    'missing_photos': """
+        SELECT u.user_id, a.id, a.file_id
+        FROM users u
+        JOIN album_files a ON a.file_type = 'photo'
+        WHERE NOT EXISTS (
+            SELECT 1 FROM photo_deliveries d
+            WHERE d.user_id = u.user_id AND d.photo_id = a.id
+        )
+        ORDER BY u.user_id, a.timestamp
+    """,
+    'undelivered_wishes': """
+        SELECT w.*, u.first_name, u.username
+        FROM wishes w
+        JOIN users u ON w.user_id = u.user_id
+        WHERE w.delivered = 0
+    """,
+    'wish_authors': "SELECT DISTINCT user_id FROM wishes",
+}
+
+# Запросы, которым полный обход таблицы нужен по смыслу (каждый пользователь)
+FULL_SCAN_EXPECTED = {'missing_photos'}
+
+
 # === БАЗА ДАННЫХ ===
 async def init_database():
     """Инициализация базы данных"""
     try:
         async with aiosqlite.connect(DATABASE_PATH) as db:
-            # Таблица пользователей
-            await db.execute("""
-                CREATE TABLE IF NOT EXISTS users (
-                    user_id INTEGER PRIMARY KEY,
-                    username TEXT,
-                    first_name TEXT,
-                    last_name TEXT,
-                    remembers_vika BOOLEAN DEFAULT NULL,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            """)
-            
-            # Таблица поздравлений
-            await db.execute("""
-                CREATE TABLE IF NOT EXISTS wishes (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    user_id INTEGER,
-                    content_type TEXT,
-                    content TEXT,
-                    is_anonymous BOOLEAN DEFAULT 0,
-                    timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    delivered BOOLEAN DEFAULT 0,
-                    FOREIGN KEY (user_id) REFERENCES users (user_id)
-                )
-            """)
-            
-            # Таблица файлов альбома
-            await db.execute("""
-                CREATE TABLE IF NOT EXISTS album_files (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    user_id INTEGER,
-                    file_id TEXT,
-                    file_type TEXT,
-                    timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (user_id) REFERENCES users (user_id)
-                )
-            """)
-            
-            # Таблица предложений треков
-            await db.execute("""
-                CREATE TABLE IF NOT EXISTS song_requests (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    user_id INTEGER,
-                    track_text TEXT,
-                    timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (user_id) REFERENCES users (user_id)
-                )
-            """)
+            # WAL сохраняется в файле БД: читатели больше не ждут писателей
+            async with db.execute("PRAGMA journal_mode = WAL") as cursor:
+                journal_mode = (await cursor.fetchone())[0]
+            if journal_mode.lower() != 'wal':
+                logger.warning(f"⚠️ Не удалось включить WAL, режим журнала: {journal_mode}")
+            await configure_connection(db)
             
-            # Таблица подтверждения участия
-            await db.execute("""
-                CREATE TABLE IF NOT EXISTS guest_confirmations (
-                    user_id INTEGER PRIMARY KEY,
-                    confirmed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            """)
-            
-            # Таблица элементов вишлиста
-            await db.execute("""
-                CREATE TABLE IF NOT EXISTS wishlist_items (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    text TEXT NOT NULL,
-                    added_by INTEGER,
-                    timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (added_by) REFERENCES users (user_id)
-                )
-            """)
-            
-            # Таблица стартовых фото
-            await db.execute("""
-                CREATE TABLE IF NOT EXISTS start_photos (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    response_type TEXT,  -- 'yes' или 'no'
-                    file_id TEXT,
-                    caption TEXT,
-                    is_active BOOLEAN DEFAULT 1,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            """)
-            
-            # Старая таблица guest_counter больше не нужна
-            # Создаем новую таблицу для подтверждений участия
-            
-            await db.commit()
-            
-            # Проверяем и добавляем новое поле remembers_vika если его нет
-            try:
-                # Проверяем, есть ли уже поле remembers_vika
-                cursor = await db.execute("PRAGMA table_info(users)")
-                columns = await cursor.fetchall()
-                column_names = [column[1] for column in columns]
-                
-                if 'remembers_vika' not in column_names:
-                    logger.info("Добавляем поле remembers_vika в таблицу users")
-                    await db.execute("ALTER TABLE users ADD COLUMN remembers_vika BOOLEAN DEFAULT NULL")
-                    await db.commit()
-                    logger.info("Поле remembers_vika добавлено успешно")
-                    
-            except Exception as migration_error:
-                logger.error(f"Ошибка миграции БД: {migration_error}")
+            # Применяем только недостающие миграции (схема и индексы)
+            schema_version = await run_migrations(db)
+            await db.execute("PRAGMA optimize")
             
-            # Проверяем и добавляем новое поле sent_to_users в таблицу album_files если его нет
-            try:
-                cursor = await db.execute("PRAGMA table_info(album_files)")
-                columns = await cursor.fetchall()
-                column_names = [column[1] for column in columns]
-                
-                if 'sent_to_users' not in column_names:
-                    logger.info("Добавляем поле sent_to_users в таблицу album_files")
-                    await db.execute("ALTER TABLE album_files ADD COLUMN sent_to_users BOOLEAN DEFAULT 0")
-                    await db.commit()
-                    logger.info("Поле sent_to_users добавлено успешно")
-                    
-            except Exception as migration_error:
-                logger.error(f"Ошибка миграции album_files: {migration_error}")
+            # Пока фоновая миграция строит индексы, отчет состоял бы из полных сканов
+            async with db.execute(
+                "SELECT 1 FROM background_migrations WHERE name = 'hot_query_indexes'"
+            ) as cursor:
+                indexes_built = await cursor.fetchone() is not None
+            if indexes_built:
+                await report_query_plans(db)
+            else:
+                logger.info("🔎 Индексы под горячие запросы строятся в фоне, планы проверим при следующем запуске")
             
-            logger.info("База данных инициализирована")
+            logger.info(f"База данных инициализирована (схема v{schema_version})")
             
     except Exception as e:
         logger.error(f"Ошибка инициализации БД: {e}")
         raise
 
 
+def iter_hot_queries():
+    """Горячие запросы для проверки планов: (имя, sql, параметры)
+
+    Кроме HOT_QUERIES это страницы админских списков (запрос следующей
+    страницы, значения параметров на план не влияют).
+    """
+    for name, sql in HOT_QUERIES.items():
+        yield name, sql, ()
+    for name, view in LIST_VIEWS.items():
+        yield f"list:{name}", page_query(view, with_cursor=True), (0,) * (len(view.key) + 1)
+
+
+async def report_query_plans(db):
+    """Залогировать, какие индексы используют горячие запросы"""
+    for name, sql, params in iter_hot_queries():
+        try:
+            plan = await explain_query_plan(db, sql, params)
+        except Exception as e:
+            logger.error(f"Ошибка проверки плана запроса {name}: {e}")
+            continue
+        
+        indexes = [step.split(' INDEX ', 1)[1] for step in plan if ' INDEX ' in step]
+        full_scans = [step for step in plan if step.startswith('SCAN') and ' INDEX ' not in step]
+        
+        if full_scans and name not in FULL_SCAN_EXPECTED:
+            logger.warning(f"⚠️ Запрос {name} сканирует таблицу целиком: {'; '.join(plan)}")
+        else:
+            logger.info(f"🔎 Запрос {name} использует индексы: {', '.join(indexes) or 'PRIMARY KEY'}")
+
+
+@timed_query
 async def add_user(user_id: int, username: str = None, first_name: str = None, last_name: str = None):
     """Добавить пользователя в БД"""
     try:
-        async with aiosqlite.connect(DATABASE_PATH) as db:
-            await db.execute("""
-                INSERT OR REPLACE INTO users (user_id, username, first_name, last_name)
-                VALUES (?, ?, ?, ?)
-            """, (user_id, username, first_name, last_name))
-            await db.commit()
+        # UPSERT, а не REPLACE: ответ на "помнишь Вику?" и дата регистрации
+        # сохраняются, а триггеры счетчиков не видят лишнего удаления
+        await write_queue.execute("""
+            INSERT INTO users (user_id, username, first_name, last_name)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT (user_id) DO UPDATE SET
+                username = excluded.username,
+                first_name = excluded.first_name,
+                last_name = excluded.last_name
+        """, (user_id, username, first_name, last_name))
     except Exception as e:
         logger.error(f"Ошибка добавления пользователя: {e}")
 
 
+@timed_query
 async def save_user_choice(user_id: int, remembers_vika: bool):
     """Сохранить выбор пользователя (помнит ли Вику)"""
     try:
-        async with aiosqlite.connect(DATABASE_PATH) as db:
-            # Обновляем поле remembers_vika для существующего пользователя
-            await db.execute("""
-                UPDATE users SET remembers_vika = ? WHERE user_id = ?
-            """, (remembers_vika, user_id))
-            
-            # Если пользователя нет, создаем запись
-            if db.total_changes == 0:
-                await db.execute("""
-                    INSERT INTO users (user_id, remembers_vika)
-                    VALUES (?, ?)
-                """, (user_id, remembers_vika))
-            
-            await db.commit()
-            logger.info(f"Сохранен выбор пользователя {user_id}: {'помнит' if remembers_vika else 'не помнит'} Вику")
+        # Обновляем ответ существующего пользователя или создаем запись
+        await write_queue.execute("""
+            INSERT INTO users (user_id, remembers_vika)
+            VALUES (?, ?)
+            ON CONFLICT (user_id) DO UPDATE SET remembers_vika = excluded.remembers_vika
+        """, (user_id, remembers_vika))
+        logger.info(f"Сохранен выбор пользователя {user_id}: {'помнит' if remembers_vika else 'не помнит'} Вику")
     except Exception as e:
         logger.error(f"Ошибка сохранения выбора пользователя: {e}")
 
 
+@timed_query
 async def get_user_choice(user_id: int) -> bool:
     """Получить выбор пользователя"""
     try:
-        async with aiosqlite.connect(DATABASE_PATH) as db:
+        async with db_pool.acquire() as db:
             async with db.execute("""
                 SELECT remembers_vika FROM users WHERE user_id = ?
             """, (user_id,)) as cursor:
@@ -215,169 +184,184 @@ async def get_user_choice(user_id: int) -> bool:
 
 
 # === СТАРТОВЫЕ ФОТО ===
+# Активные стартовые фото: response_type -> (file_id, caption). Меняются
+# только через set_start_photo, поэтому кэш живет до перезапуска
+_start_photos = {}
+
+
 async def get_start_photo(response_type: str) -> tuple:
     """Получить стартовое фото для ответа (yes/no)"""
+    cached = _start_photos.get(response_type)
+    if cached is not None:
+        return cached
+    
     try:
-        async with aiosqlite.connect(DATABASE_PATH) as db:
-            async with db.execute("""
-                SELECT file_id, caption FROM start_photos 
-                WHERE response_type = ? AND is_active = 1
-                ORDER BY created_at DESC
-                LIMIT 1
-            """, (response_type,)) as cursor:
-                row = await cursor.fetchone()
-                return row if row else (None, None)
+        # Время считаем только для промахов кэша: попадания в БД не ходят
+        with DB_QUERY_SECONDS.time(helper="get_start_photo"):
+            async with db_pool.acquire() as db:
+                async with db.execute("""
+                    SELECT file_id, caption FROM start_photos 
+                    WHERE response_type = ? AND is_active = 1
+                    ORDER BY created_at DESC
+                    LIMIT 1
+                """, (response_type,)) as cursor:
+                    row = await cursor.fetchone()
+        # Отсутствие фото тоже запоминаем
+        photo = _start_photos[response_type] = tuple(row) if row else (None, None)
+        return photo
     except Exception as e:
         logger.error(f"Ошибка получения стартового фото: {e}")
         return (None, None)
 
 
+async def load_start_photos():
+    """Загрузить стартовые фото в кэш (при запуске бота)"""
+    _start_photos.clear()
+    for response_type in ("yes", "no"):
+        await get_start_photo(response_type)
+
+
+@timed_query
 async def set_start_photo(response_type: str, file_id: str, caption: str = None):
     """Установить стартовое фото для ответа"""
     try:
-        async with aiosqlite.connect(DATABASE_PATH) as db:
+        await write_queue.transaction([
             # Деактивируем старые фото этого типа
-            await db.execute("""
+            ("""
                 UPDATE start_photos SET is_active = 0 WHERE response_type = ?
-            """, (response_type,))
-            
+            """, (response_type,)),
             # Добавляем новое фото
-            await db.execute("""
+            ("""
                 INSERT INTO start_photos (response_type, file_id, caption)
                 VALUES (?, ?, ?)
-            """, (response_type, file_id, caption))
-            await db.commit()
+            """, (response_type, file_id, caption)),
+        ])
+        
+        # Новое фото сразу видно всем, без повторного чтения из БД
+        _start_photos[response_type] = (file_id, caption)
     except Exception as e:
+        # Состояние БД неизвестно: перечитаем при следующем запросе
+        _start_photos.pop(response_type, None)
         logger.error(f"Ошибка установки стартового фото: {e}")
 
 
 # === СЧЕТЧИК ГОСТЕЙ ===
-async def confirm_guest_participation(user_id: int) -> bool:
-    """Подтвердить участие пользователя. Возвращает True если это новое подтверждение"""
-    try:
-        async with aiosqlite.connect(DATABASE_PATH) as db:
-            # Проверяем, не подтвердил ли уже пользователь участие
-            async with db.execute("SELECT user_id FROM guest_confirmations WHERE user_id = ?", (user_id,)) as cursor:
-                existing = await cursor.fetchone()
-                
-            if existing:
-                return False  # Уже подтвердил
-            
-            # Добавляем новое подтверждение
-            await db.execute("INSERT INTO guest_confirmations (user_id) VALUES (?)", (user_id,))
-            await db.commit()
-            return True  # Новое подтверждение
-    except Exception as e:
-        logger.error(f"Ошибка подтверждения участия: {e}")
-        return False
+# Число подтвердивших участие: загружается при запуске из счетчиков
+# статистики и дальше растет вместе с подтверждениями
+_guest_count = 0
 
 
-async def get_guest_count() -> int:
-    """Получить количество подтвердивших участие"""
+@timed_query
+async def load_guest_count():
+    """Загрузить число подтвердивших участие (при запуске и после /repair_stats)"""
+    global _guest_count
     try:
-        async with aiosqlite.connect(DATABASE_PATH) as db:
-            async with db.execute("SELECT COUNT(*) FROM guest_confirmations") as cursor:
-                result = await cursor.fetchone()
-                return result[0] if result else 0
+        async with db_pool.acquire() as db:
+            async with db.execute(
+                "SELECT value FROM stats_counters WHERE name = 'guest_confirmations'"
+            ) as cursor:
+                row = await cursor.fetchone()
+        _guest_count = row[0] if row else 0
     except Exception as e:
-        logger.error(f"Ошибка получения количества гостей: {e}")
-        return 0
+        logger.error(f"Ошибка загрузки количества гостей: {e}")
 
 
-async def is_guest_confirmed(user_id: int) -> bool:
-    """Проверить, подтвердил ли пользователь участие"""
+@timed_query
+async def confirm_guest_participation(user_id: int):
+    """Подтвердить участие пользователя
+    
+    Возвращает True, если это новое подтверждение, False - если пользователь
+    уже подтверждал, None - при ошибке. Проверка и вставка - один запрос,
+    так что двойное нажатие не создаст второе подтверждение.
+    """
+    global _guest_count
     try:
-        async with aiosqlite.connect(DATABASE_PATH) as db:
-            async with db.execute("SELECT user_id FROM guest_confirmations WHERE user_id = ?", (user_id,)) as cursor:
-                result = await cursor.fetchone()
-                return result is not None
+        # Одновременные нажатия уходят в БД одной пачкой
+        row_id = await write_queue.execute("""
+            INSERT INTO guest_confirmations (user_id) VALUES (?)
+            ON CONFLICT (user_id) DO NOTHING
+        """, (user_id,))
     except Exception as e:
-        logger.error(f"Ошибка проверки подтверждения: {e}")
+        logger.error(f"Ошибка подтверждения участия: {e}")
+        return None
+    
+    if row_id is None:
         return False
+    _guest_count += 1
+    return True
 
 
-async def get_confirmed_guests_list():
-    """Получить список пользователей, подтвердивших участие, с их именами"""
-    try:
-        async with aiosqlite.connect(DATABASE_PATH) as db:
-            async with db.execute("""
-                SELECT u.user_id, u.first_name, u.last_name, u.username, gc.confirmed_at
-                FROM guest_confirmations gc
-                JOIN users u ON gc.user_id = u.user_id
-                ORDER BY gc.confirmed_at ASC
-            """) as cursor:
-                results = await cursor.fetchall()
-                
-                guests = []
-                for row in results:
-                    user_id, first_name, last_name, username, confirmed_at = row
-                    
-                    # Формируем отображаемое имя
-                    display_name = first_name or "Неизвестно"
-                    if last_name:
-                        display_name += f" {last_name}"
-                    
-                    if username:
-                        display_name += f" (@{username})"
-                    
-                    guests.append({
-                        'user_id': user_id,
-                        'display_name': display_name,
-                        'confirmed_at': confirmed_at
-                    })
-                
-                return guests
-    except Exception as e:
-        logger.error(f"Ошибка получения списка гостей: {e}")
-        return []
+def get_guest_count() -> int:
+    """Получить количество подтвердивших участие"""
+    return _guest_count
+
+
+# Счетчики статистики: имя -> запрос для полного пересчета. В обычной работе
+# их ведут триггеры (миграция 8), пересчет нужен только для /repair_stats
+STATS_COUNTERS = {
+    'users': "SELECT COUNT(*) FROM users",
+    'remembers_vika': "SELECT COUNT(*) FROM users WHERE remembers_vika = 1",
+    'not_remembers_vika': "SELECT COUNT(*) FROM users WHERE remembers_vika = 0",
+    'wishes': "SELECT COUNT(*) FROM wishes",
+    'album_files': "SELECT COUNT(*) FROM album_files",
+    'song_requests': "SELECT COUNT(*) FROM song_requests",
+    'guest_confirmations': "SELECT COUNT(*) FROM guest_confirmations",
+}
+
+
+@timed_query
+async def get_stats_counters() -> dict:
+    """Все счетчики статистики одним запросом"""
+    async with db_pool.acquire() as db:
+        async with db.execute("SELECT name, value FROM stats_counters") as cursor:
+            counters = dict(await cursor.fetchall())
+    return {name: counters.get(name, 0) for name in STATS_COUNTERS}
+
+
+@timed_query
+async def repair_stats_counters() -> dict:
+    """Пересчитать счетчики с нуля. Возвращает расхождения: имя -> (было, стало)"""
+    # Сохраненные значения и настоящие количества - одним запросом, то есть
+    # из одного снимка БД, иначе параллельная вставка выглядела бы расхождением
+    comparison = " UNION ALL ".join(
+        f"SELECT ?, (SELECT value FROM stats_counters WHERE name = ?), ({query})"
+        for query in STATS_COUNTERS.values()
+    )
+    params = tuple(value for name in STATS_COUNTERS for value in (name, name))
+    async with db_pool.acquire() as db:
+        async with db.execute(comparison, params) as cursor:
+            rows = await cursor.fetchall()
+    drift = {name: (stored, actual) for name, stored, actual in rows if stored != actual}
+    
+    # Подсчет и запись одним запросом, чтобы не потерять параллельную вставку
+    await write_queue.transaction([
+        (f"INSERT OR REPLACE INTO stats_counters (name, value) VALUES (?, ({query}))", (name,))
+        for name, query in STATS_COUNTERS.items()
+    ])
+    
+    await load_guest_count()
+    
+    if drift:
+        logger.warning(f"📊 Счетчики статистики пересчитаны, расхождения: {drift}")
+    return drift
 
 
 async def get_all_users_stats():
     """Получить статистику по всем пользователям бота"""
     try:
-        async with aiosqlite.connect(DATABASE_PATH) as db:
-            # Общее количество пользователей
-            async with db.execute("SELECT COUNT(*) FROM users") as cursor:
-                total_users = (await cursor.fetchone())[0]
-            
-            # Пользователи, которые помнят Вику
-            async with db.execute("SELECT COUNT(*) FROM users WHERE remembers_vika = 1") as cursor:
-                remembers_count = (await cursor.fetchone())[0]
-            
-            # Пользователи, которые не помнят Вику
-            async with db.execute("SELECT COUNT(*) FROM users WHERE remembers_vika = 0") as cursor:
-                not_remembers_count = (await cursor.fetchone())[0]
-            
-            # Пользователи без ответа
-            async with db.execute("SELECT COUNT(*) FROM users WHERE remembers_vika IS NULL") as cursor:
-                no_answer_count = (await cursor.fetchone())[0]
-            
-            # Количество поздравлений
-            async with db.execute("SELECT COUNT(*) FROM wishes") as cursor:
-                wishes_count = (await cursor.fetchone())[0]
-            
-            # Количество файлов в альбоме
-            async with db.execute("SELECT COUNT(*) FROM album_files") as cursor:
-                album_files_count = (await cursor.fetchone())[0]
-            
-            # Количество предложений треков
-            async with db.execute("SELECT COUNT(*) FROM song_requests") as cursor:
-                songs_count = (await cursor.fetchone())[0]
-            
-            # Количество подтвердивших участие
-            async with db.execute("SELECT COUNT(*) FROM guest_confirmations") as cursor:
-                confirmed_guests_count = (await cursor.fetchone())[0]
-            
-            return {
-                'total_users': total_users,
-                'remembers_vika': remembers_count,
-                'not_remembers_vika': not_remembers_count,
-                'no_answer': no_answer_count,
-                'wishes_count': wishes_count,
-                'album_files_count': album_files_count,
-                'songs_count': songs_count,
-                'confirmed_guests_count': confirmed_guests_count
-            }
+        counters = await get_stats_counters()
+        
+        return {
+            'total_users': counters['users'],
+            'remembers_vika': counters['remembers_vika'],
+            'not_remembers_vika': counters['not_remembers_vika'],
+            # Без ответа - все остальные
+            'no_answer': counters['users'] - counters['remembers_vika'] - counters['not_remembers_vika'],
+            'wishes_count': counters['wishes'],
+            'album_files_count': counters['album_files'],
+            'songs_count': counters['song_requests'],
+            'confirmed_guests_count': counters['guest_confirmations']
+        }
     except Exception as e:
         logger.error(f"Ошибка получения статистики пользователей: {e}")
         return None
@@ -386,30 +370,17 @@ async def get_all_users_stats():
 # === ТАЙМЕР ДО ДНЯ РОЖДЕНИЯ ===
 def get_days_until_birthday() -> int:
     """Получить количество дней до дня рождения"""
-    try:
-        birthday = datetime.strptime(BIRTHDAY_DATE, "%Y-%m-%d").date()
-        today = date.today()
-        delta = birthday - today
-        return delta.days
-    except Exception as e:
-        logger.error(f"Ошибка расчета дней до ДР: {e}")
-        return 0
+    return event_calendar.days_until_birthday
 
 
 def is_after_birthday() -> bool:
     """Проверить, прошла ли дата дня рождения"""
-    return get_days_until_birthday() <= 0
+    return event_calendar.is_after_birthday
 
 
 def is_archive_mode() -> bool:
     """Проверить, включен ли архивный режим"""
-    try:
-        archive_date = datetime.strptime(ARCHIVE_DATE, "%Y-%m-%d").date()
-        today = date.today()
-        return today >= archive_date
-    except Exception as e:
-        logger.error(f"Ошибка проверки архивного режима: {e}")
-        return False
+    return event_calendar.is_archive_mode
 
 
 # === ГАДАЛКА ===
@@ -423,15 +394,37 @@ def get_random_fortune() -> str:
 
 
 # === SCHEDULED JOBS ===
+async def submit_scheduled_job(kind: str, params: dict = None):
+    """Поставить задание по расписанию в очередь админских заданий
+
+    Так оно не пересечется с таким же заданием, запущенным админом: задания
+    выполняются по одному, а одинаковое, уже стоящее в очереди или
+    выполняющееся, второй раз не ставится.
+    """
+    try:
+        job_id, created = await job_queue.submit(kind, params)
+        if created:
+            logger.info(f"⏰ Задание по расписанию #{job_id} ({kind}) поставлено в очередь")
+        else:
+            logger.info(f"⏰ Задание {kind} уже в очереди или выполняется (#{job_id}), пропускаем")
+    except Exception as e:
+        logger.error(f"Ошибка постановки задания по расписанию {kind}: {e}")
+
+
 async def setup_scheduler_jobs(scheduler: AsyncIOScheduler, bot: Bot):
-    """Настройка запланированных задач"""
+    """Настройка запланированных задач
+
+    Долгие задачи идут через очередь админских заданий (виды заданий
+    регистрирует handlers.admin), поэтому очередь должна быть запущена
+    раньше планировщика.
+    """
     try:
         # Отправка поздравлений в день рождения
         scheduler.add_job(
-            send_birthday_wishes,
+            submit_scheduled_job,
             'date',
-            run_date=f"{BIRTHDAY_DATE} 00:01:00",
-            args=[bot],
+            run_date=event_calendar.at(event_calendar.birthday, BIRTHDAY_TIME),
+            args=['open_presents'],
             id='birthday_wishes',
             timezone=SCHEDULER_TIMEZONE
         )
@@ -440,7 +433,7 @@ async def setup_scheduler_jobs(scheduler: AsyncIOScheduler, bot: Bot):
         scheduler.add_job(
             send_reminder,
             'date',
-            run_date=f"{REMINDER_DATE} {REMINDER_TIME}:00",
+            run_date=event_calendar.at(date.fromisoformat(REMINDER_DATE), REMINDER_TIME),
             args=[bot],
             id='reminder',
             timezone=SCHEDULER_TIMEZONE
@@ -449,25 +442,22 @@ async def setup_scheduler_jobs(scheduler: AsyncIOScheduler, bot: Bot):
         # Результаты голосования больше не нужны (система треков заменена на предложения)
         
         # Создание альбома через неделю после ДР
-        from datetime import timedelta
-        album_date = datetime.strptime(BIRTHDAY_DATE, "%Y-%m-%d") + timedelta(days=7)
         scheduler.add_job(
-            create_album,
+            submit_scheduled_job,
             'date',
-            run_date=album_date,
-            args=[bot],
+            run_date=event_calendar.at(event_calendar.album_date),
+            args=['get_album', {'debug': False}],
             id='create_album',
             timezone=SCHEDULER_TIMEZONE
         )
         
         # Автоматическая отправка новых фото каждый час (только после дня рождения)
-        birthday_datetime = datetime.strptime(BIRTHDAY_DATE, "%Y-%m-%d")
-        if datetime.now() >= birthday_datetime:
+        if event_calendar.is_after_birthday:
             scheduler.add_job(
-                send_new_photos_to_users,
+                submit_scheduled_job,
                 'interval',
                 hours=1,
-                args=[bot],
+                args=['send_new_photos'],
                 id='auto_send_photos',
                 timezone=SCHEDULER_TIMEZONE
             )
@@ -482,15 +472,13 @@ async def setup_scheduler_jobs(scheduler: AsyncIOScheduler, bot: Bot):
 
 
 async def send_birthday_wishes(bot: Bot):
-    """Отправить все поздравления в день рождения"""
+    """Отправить все поздравления в день рождения
+    
+    Ошибки пробрасываются дальше, чтобы задание open_presents завершилось как failed.
+    """
     try:
-        async with aiosqlite.connect(DATABASE_PATH) as db:
-            async with db.execute("""
-                SELECT w.*, u.first_name, u.username
-                FROM wishes w
-                JOIN users u ON w.user_id = u.user_id
-                WHERE w.delivered = 0
-            """) as cursor:
+        async with db_pool.acquire() as db:
+            async with db.execute(HOT_QUERIES['undelivered_wishes']) as cursor:
                 wishes = await cursor.fetchall()
         
         count = 0
@@ -512,9 +500,7 @@ async def send_birthday_wishes(bot: Bot):
                             await bot.send_sticker(admin_id, wish[3])
                 
                 # Отмечаем как доставленное
-                async with aiosqlite.connect(DATABASE_PATH) as db:
-                    await db.execute("UPDATE wishes SET delivered = 1 WHERE id = ?", (wish[0],))
-                    await db.commit()
+                await write_queue.execute("UPDATE wishes SET delivered = 1 WHERE id = ?", (wish[0],))
                 
                 count += 1
                 
@@ -529,13 +515,14 @@ async def send_birthday_wishes(bot: Bot):
         
     except Exception as e:
         logger.error(f"Ошибка отправки поздравлений: {e}")
+        raise
 
 
 async def send_reminder(bot: Bot):
     """Отправить напоминание всем, кто отправил поздравление"""
     try:
-        async with aiosqlite.connect(DATABASE_PATH) as db:
-            async with db.execute("SELECT DISTINCT user_id FROM wishes") as cursor:
+        async with db_pool.acquire() as db:
+            async with db.execute(HOT_QUERIES['wish_authors']) as cursor:
                 user_ids = await cursor.fetchall()
         
         for user_id_tuple in user_ids:
@@ -552,17 +539,52 @@ async def send_reminder(bot: Bot):
 
 
 
+@timed_query
+async def record_photo_deliveries(chat_id: int, photo_ids):
+    """Отметить в журнале, что фото доставлены получателю"""
+    if not photo_ids:
+        return
+    await write_queue.execute("""
+        INSERT OR IGNORE INTO photo_deliveries (photo_id, user_id)
+        SELECT value, ? FROM json_each(?)
+    """, (chat_id, json.dumps(list(photo_ids))))
+
+
+async def send_album_to_chat(bot: Bot, chat_id: int, payload: dict, call):
+    """Отправить альбом одному получателю (задание доставки 'album')"""
+    photos = payload['photos']
+    
+    # Отправляем фото частями по 10 штук (лимит Telegram для media_group)
+    for i in range(0, len(photos), 10):
+        photo_chunk = photos[i:i+10]
+        await call(lambda: bot.send_media_group(chat_id, [{"type": "photo", "media": photo} for photo in photo_chunk]))
+    
+    # Отправляем видео по одному
+    for video in payload['videos']:
+        await call(lambda: bot.send_video(chat_id, video))
+    
+    # Отправляем текстовое сообщение
+    if payload['message']:
+        await call(lambda: bot.send_message(chat_id, payload['message']))
+    
+    # Получивший альбом больше не получит эти фото как новые
+    await record_photo_deliveries(chat_id, payload.get('photo_ids', []))
+
+
 async def create_album(bot: Bot, debug_mode: bool = False):
     """Создать альбом из всех загруженных файлов
     
     Args:
         bot: Экземпляр бота
         debug_mode: Если True, отправляет альбом только админам (без уведомления пользователей)
+    
+    Ошибки пробрасываются дальше, чтобы задание get_album завершилось как failed.
     """
+    admin_job_id = user_job_id = None
     try:
-        async with aiosqlite.connect(DATABASE_PATH) as db:
+        async with db_pool.acquire() as db:
             async with db.execute("""
-                SELECT file_id, file_type
+                SELECT id, file_id, file_type
                 FROM album_files
                 ORDER BY timestamp
             """) as cursor:
@@ -570,275 +592,205 @@ async def create_album(bot: Bot, debug_mode: bool = False):
         
         # Инициализируем списки файлов
         photos = []
+        photo_ids = []
         videos = []
         
         if not files:
             message = "Альбом пуст - никто не загрузил фото с тусовки 😢"
         else:
             # Группируем файлы по типам для создания альбома
-            photos = [f[0] for f in files if f[1] == 'photo']
-            videos = [f[0] for f in files if f[1] == 'video']
+            photos = [f[1] for f in files if f[2] == 'photo']
+            photo_ids = [f[0] for f in files if f[2] == 'photo']
+            videos = [f[1] for f in files if f[2] == 'video']
             
             message = f"🎉 Альбом с тусовки готов!\n\nВсего файлов: {len(files)}"
         
-        # Отправляем альбом админам (всегда)
-        for admin_id in ADMIN_IDS:
-            try:
-                # Отправляем фото частями по 10 штук (лимит Telegram для media_group)
-                if photos:
-                    for i in range(0, len(photos), 10):
-                        photo_chunk = photos[i:i+10]
-                        await bot.send_media_group(admin_id, [{"type": "photo", "media": photo} for photo in photo_chunk])
-                        # Небольшая задержка между частями для избежания rate limiting
-                        if i + 10 < len(photos):
-                            await asyncio.sleep(0.5)
-                
-                # Отправляем видео по одному
-                if videos:
-                    for video in videos:
-                        await bot.send_video(admin_id, video)
-                        
-                logger.info(f"✅ Альбом успешно отправлен админу {admin_id}")
-                        
-            except Exception as e:
-                # Более информативное логирование ошибок для админов
-                if "chat not found" in str(e).lower():
-                    logger.warning(f"⚠️ Админ {admin_id} недоступен (возможно, заблокировал бота или неверный ID)")
-                elif "flood control" in str(e).lower():
-                    logger.warning(f"⏳ Rate limiting при отправке админу {admin_id}: {e}")
-                else:
-                    logger.error(f"Ошибка отправки альбома админу {admin_id}: {e}")
+        album = {
+            'photos': photos,
+            'photo_ids': photo_ids,
+            'videos': videos,
+        }
+        
+        # Альбом админам (всегда), в дебаг режиме - с пометкой
+        admin_job_id = await create_delivery_job('album', {
+            **album,
+            'message': f"🔧 DEBUG MODE\n\n{message}" if debug_mode else None
+        }, ADMIN_IDS)
         
         # В дебаг режиме уведомляем только админов, иначе всех пользователей
         if debug_mode:
-            # В дебаг режиме отправляем сообщение только админам
-            for admin_id in ADMIN_IDS:
-                try:
-                    debug_message = f"🔧 DEBUG MODE\n\n{message}"
-                    await bot.send_message(admin_id, debug_message)
-                except Exception as e:
-                    logger.error(f"Ошибка отправки дебаг сообщения админу {admin_id}: {e}")
+            await run_delivery_job(bot, admin_job_id)
             logger.info("Альбом создан и отправлен в дебаг режиме (только админам)")
-        else:
-            # Обычный режим - отправляем альбом всем пользователям
-            async with aiosqlite.connect(DATABASE_PATH) as db:
-                async with db.execute("SELECT user_id FROM users") as cursor:
-                    user_ids = await cursor.fetchall()
-            
-            for user_id_tuple in user_ids:
-                try:
-                    user_id = user_id_tuple[0]
-                    
-                    # Отправляем фото частями по 10 штук (лимит Telegram для media_group)
-                    if photos:
-                        for i in range(0, len(photos), 10):
-                            photo_chunk = photos[i:i+10]
-                            await bot.send_media_group(user_id, [{"type": "photo", "media": photo} for photo in photo_chunk])
-                            # Небольшая задержка между частями для избежания rate limiting
-                            if i + 10 < len(photos):
-                                await asyncio.sleep(0.5)
-                    
-                    # Отправляем видео по одному, если есть
-                    if videos:
-                        for video in videos:
-                            await bot.send_video(user_id, video)
-                    
-                    # Отправляем текстовое сообщение
-                    await bot.send_message(user_id, message)
-                    
-                except Exception as e:
-                    logger.error(f"Ошибка отправки альбома пользователю {user_id}: {e}")
-            logger.info("Альбом создан и отправлен всем пользователям")
-            
-            # Помечаем все фото как отправленные пользователям
-            if files:
-                async with aiosqlite.connect(DATABASE_PATH) as db:
-                    await db.execute("""
-                        UPDATE album_files 
-                        SET sent_to_users = 1 
-                        WHERE file_type = 'photo'
-                    """)
-                    await db.commit()
-                logger.info("📸 Все фото помечены как отправленные пользователям")
+            return
+        
+        # Обычный режим - отправляем альбом всем пользователям
+        async with db_pool.acquire() as db:
+            async with db.execute("SELECT user_id FROM users") as cursor:
+                user_ids = [row[0] for row in await cursor.fetchall()]
+        
+        user_job_id = await create_delivery_job('album', {**album, 'message': message}, user_ids)
+        
+        # Админы и пользователи получают альбом одновременно, общий темп
+        # задает лимитер, а части каждому получателю уходят по порядку
+        admin_stats, user_stats = await asyncio.gather(
+            run_delivery_job(bot, admin_job_id),
+            run_delivery_job(bot, user_job_id)
+        )
+        logger.info(
+            f"Альбом: админам {admin_stats['sent']}/{admin_stats['total']}, "
+            f"пользователям {user_stats['sent']}/{user_stats['total']} "
+            f"({user_stats['rate']:.1f} сообщ./с)"
+        )
+        
+        logger.info("Альбом создан и отправлен всем пользователям")
         
+    except asyncio.CancelledError:
+        # /cancel_job снимает и задания доставки, иначе альбом дошлется после
+        # перезапуска; при остановке бота они как раз должны продолжиться
+        if not job_queue.is_closing:
+            for job_id in (admin_job_id, user_job_id):
+                if job_id is not None:
+                    await cancel_delivery_job(job_id)
+        raise
     except Exception as e:
         logger.error(f"Ошибка создания альбома: {e}")
+        raise
+
+
+async def send_new_photos_to_chat(bot: Bot, chat_id: int, photos, call):
+    """Отправить пользователю фото, которых у него еще нет
+    
+    photos - список пар (id, file_id). Каждая часть записывается в журнал
+    сразу после отправки, поэтому при сбое повторно уйдет не больше одной части.
+    """
+    # Отправляем фото частями по 10 штук (лимит Telegram для media_group)
+    for i in range(0, len(photos), 10):
+        photo_chunk = photos[i:i+10]
+        
+        if len(photo_chunk) == 1:
+            # Если одно фото, отправляем как обычное фото с подписью
+            await call(lambda: bot.send_photo(
+                chat_id, 
+                photo_chunk[0][1], 
+                caption="📸 Новое фото добавлено в альбом!"
+            ))
+        else:
+            # Если несколько фото, отправляем как альбом
+            media_group = [{"type": "photo", "media": photo[1]} for photo in photo_chunk]
+            # Добавляем подпись только к первому фото
+            media_group[0]["caption"] = f"📸 Добавлено {len(photo_chunk)} новых фото в альбом!"
+            await call(lambda: bot.send_media_group(chat_id, media_group))
+        
+        await record_photo_deliveries(chat_id, [photo[0] for photo in photo_chunk])
+    
+    logger.info(f"📸 Отправлено {len(photos)} фото пользователю {chat_id}")
 
 
 async def send_new_photos_to_users(bot: Bot):
-    """Автоматически отправить новые фото пользователям (каждый час)"""
+    """Автоматически отправить новые фото пользователям (каждый час)
+    
+    Каждому пользователю уходят только те фото, которых нет в журнале
+    доставки для него: упавшая отправка повторится в следующий запуск, а
+    присоединившиеся позже получат и ранние фото. Ошибки пробрасываются
+    дальше, чтобы задание send_new_photos завершилось как failed.
+    """
     try:
         # Проверяем, не активирован ли архивный режим
         if is_archive_mode():
             logger.info("📸 Архивный режим активирован, автоматическая отправка фото отключена")
             return
-        # Находим фото, которые еще не были отправлены пользователям
-        async with aiosqlite.connect(DATABASE_PATH) as db:
-            async with db.execute("""
-                SELECT id, file_id, file_type, user_id
-                FROM album_files
-                WHERE sent_to_users = 0 AND file_type = 'photo'
-                ORDER BY timestamp ASC
-            """) as cursor:
-                new_photos = await cursor.fetchall()
-        
-        if not new_photos:
-            logger.info("📸 Новых фото для отправки пользователям нет")
+        # Пока журнал не перенесен из sent_to_users, всем ушли бы старые фото
+        if not await is_background_migration_done('photo_deliveries_backfill'):
+            logger.info("📸 Журнал доставки фото еще заполняется, отправка отложена")
             return
         
-        logger.info(f"📸 Найдено {len(new_photos)} новых фото для отправки")
-        
-        # Получаем список всех пользователей
-        async with aiosqlite.connect(DATABASE_PATH) as db:
-            async with db.execute("SELECT user_id FROM users") as cursor:
-                user_ids = await cursor.fetchall()
+        # Одним запросом находим все пары (пользователь, фото), которых нет в журнале
+        async with db_pool.acquire() as db:
+            async with db.execute(HOT_QUERIES['missing_photos']) as cursor:
+                rows = await cursor.fetchall()
         
-        if not user_ids:
-            logger.warning("📸 Нет пользователей для отправки фото")
+        if not rows:
+            logger.info("📸 Новых фото для отправки пользователям нет")
             return
         
-        # Группируем фото по 10 штук для отправки альбомом
-        photo_file_ids = [photo[1] for photo in new_photos]
+        missing = {}
+        for user_id, photo_id, file_id in rows:
+            missing.setdefault(user_id, []).append((photo_id, file_id))
         
-        # Отправляем фото всем пользователям
-        for user_id_tuple in user_ids:
-            try:
-                user_id = user_id_tuple[0]
-                
-                # Отправляем фото частями по 10 штук (лимит Telegram для media_group)
-                for i in range(0, len(photo_file_ids), 10):
-                    photo_chunk = photo_file_ids[i:i+10]
-                    
-                    if len(photo_chunk) == 1:
-                        # Если одно фото, отправляем как обычное фото с подписью
-                        await bot.send_photo(
-                            user_id, 
-                            photo_chunk[0], 
-                            caption="📸 Новое фото добавлено в альбом!"
-                        )
-                    else:
-                        # Если несколько фото, отправляем как альбом
-                        media_group = [{"type": "photo", "media": photo} for photo in photo_chunk]
-                        # Добавляем подпись только к первому фото
-                        media_group[0]["caption"] = f"📸 Добавлено {len(photo_chunk)} новых фото в альбом!"
-                        await bot.send_media_group(user_id, media_group)
-                    
-                    # Увеличенная задержка между частями для избежания rate limiting
-                    if i + 10 < len(photo_file_ids):
-                        await asyncio.sleep(2.0)  # Увеличиваем до 2 секунд
-                
-                # Задержка между пользователями для избежания flood control
-                await asyncio.sleep(1.0)
-                
-                logger.info(f"📸 Отправлено {len(photo_file_ids)} фото пользователю {user_id}")
-                
-            except Exception as e:
-                logger.error(f"Ошибка отправки новых фото пользователю {user_id}: {e}")
-                # Если ошибка rate limiting, ждем дольше
-                if "Flood control exceeded" in str(e) or "Too Many Requests" in str(e):
-                    logger.info("⏳ Обнаружен rate limiting, ждем 5 секунд...")
-                    await asyncio.sleep(5.0)
+        logger.info(f"📸 Найдено {len(rows)} недоставленных фото для {len(missing)} пользователей")
         
-        # Помечаем фото как отправленные пользователям только в конце, когда все отправлено
-        async with aiosqlite.connect(DATABASE_PATH) as db:
-            photo_ids = [photo[0] for photo in new_photos]
-            placeholders = ','.join('?' * len(photo_ids))
-            await db.execute(f"""
-                UPDATE album_files 
-                SET sent_to_users = 1 
-                WHERE id IN ({placeholders})
-            """, photo_ids)
-            await db.commit()
+        async def send(chat_id, call):
+            await send_new_photos_to_chat(bot, chat_id, missing[chat_id], call)
+        
+        # Темп задает общий лимитер, фиксированные паузы не нужны
+        stats = await broadcast(missing, send)
         
-        logger.info(f"📸 Автоматическая отправка завершена: {len(new_photos)} фото отправлено {len(user_ids)} пользователям")
+        logger.info(
+            f"📸 Автоматическая отправка завершена: фото получили {stats['sent']} из {len(missing)} "
+            f"пользователей ({stats['rate']:.1f} сообщ./с)"
+        )
         
     except Exception as e:
         logger.error(f"Ошибка автоматической отправки новых фото: {e}")
+        raise
 
 
-# === RATE LIMITING ===
-user_messages = {}
-
-
-async def check_rate_limit(user_id: int) -> bool:
-    """Проверить rate limit для пользователя"""
-    now = datetime.now()
-    
-    if user_id not in user_messages:
-        user_messages[user_id] = []
-    
-    # Удаляем старые сообщения (старше минуты)
-    user_messages[user_id] = [
-        msg_time for msg_time in user_messages[user_id]
-        if (now - msg_time).seconds < 60
-    ]
-    
-    # Проверяем лимит
-    if len(user_messages[user_id]) >= 5:
-        return False
-    
-    # Добавляем текущее сообщение
-    user_messages[user_id].append(now)
-    return True
+register_sender('album', send_album_to_chat, concurrency=ALBUM_FANOUT_CONCURRENCY)
 
 
 # === ОБРАБОТЧИКИ ГОЛОСОВАНИЯ ===
 
 
+@timed_query
 async def save_song_request(user_id: int, track_text: str):
     """Сохранить предложение трека"""
     try:
-        async with aiosqlite.connect(DATABASE_PATH) as db:
-            await db.execute("""
-                INSERT INTO song_requests (user_id, track_text)
-                VALUES (?, ?)
-            """, (user_id, track_text))
-            await db.commit()
-            logger.info(f"Предложение трека сохранено: {user_id} - {track_text}")
+        # Запись уходит в общую пачку, ждем коммита
+        await write_queue.execute("""
+            INSERT INTO song_requests (user_id, track_text)
+            VALUES (?, ?)
+        """, (user_id, track_text))
+        logger.info(f"Предложение трека сохранено: {user_id} - {track_text}")
     except Exception as e:
         logger.error(f"Ошибка сохранения предложения трека: {e}")
         raise
 
 
-async def get_all_song_requests():
-    """Получить все предложения треков"""
-    try:
-        async with aiosqlite.connect(DATABASE_PATH) as db:
-            async with db.execute("""
-                SELECT sr.track_text, u.first_name, u.username, sr.timestamp
-                FROM song_requests sr
-                LEFT JOIN users u ON sr.user_id = u.user_id
-                ORDER BY sr.timestamp DESC
-            """) as cursor:
-                rows = await cursor.fetchall()
-                return rows
-    except Exception as e:
-        logger.error(f"Ошибка получения предложений треков: {e}")
-        return []
+# === РАБОТА С ВИШЛИСТОМ ===
+# Версия вишлиста растет при каждом изменении; готовый текст для гостей
+# хранится вместе с версией, из которой он собран
+_wishlist_version = 0
+_wishlist_text = None
+_wishlist_text_version = -1
 
 
-# === РАБОТА С ВИШЛИСТОМ ===
+def invalidate_wishlist():
+    """Отметить, что вишлист изменился: текст пересоберется при следующем показе"""
+    global _wishlist_version
+    _wishlist_version += 1
+
 
+@timed_query
 async def add_wishlist_item(item_text: str, admin_id: int):
     """Добавить элемент в вишлист"""
     try:
-        async with aiosqlite.connect(DATABASE_PATH) as db:
-            await db.execute("""
-                INSERT INTO wishlist_items (text, added_by)
-                VALUES (?, ?)
-            """, (item_text, admin_id))
-            await db.commit()
-            logger.info(f"Элемент вишлиста добавлен: {item_text} (админ {admin_id})")
-            return True
+        await write_queue.execute("""
+            INSERT INTO wishlist_items (text, added_by)
+            VALUES (?, ?)
+        """, (item_text, admin_id))
+        invalidate_wishlist()
+        logger.info(f"Элемент вишлиста добавлен: {item_text} (админ {admin_id})")
+        return True
     except Exception as e:
         logger.error(f"Ошибка добавления элемента вишлиста: {e}")
         return False
 
 
+@timed_query
 async def get_wishlist_items():
     """Получить все элементы вишлиста"""
     try:
-        async with aiosqlite.connect(DATABASE_PATH) as db:
+        async with db_pool.acquire() as db:
             async with db.execute("""
                 SELECT id, text, timestamp
                 FROM wishlist_items
@@ -851,37 +803,56 @@ async def get_wishlist_items():
         return []
 
 
+@timed_query
 async def delete_wishlist_item(item_id: int):
     """Удалить элемент из вишлиста"""
     try:
-        async with aiosqlite.connect(DATABASE_PATH) as db:
-            cursor = await db.execute("""
-                DELETE FROM wishlist_items WHERE id = ?
-            """, (item_id,))
-            await db.commit()
-            if cursor.rowcount > 0:
-                logger.info(f"Элемент вишлиста удален: ID {item_id}")
-                return True
-            else:
-                logger.warning(f"Элемент вишлиста не найден: ID {item_id}")
-                return False
+        deleted = await write_queue.execute("""
+            DELETE FROM wishlist_items WHERE id = ?
+        """, (item_id,))
+        if deleted is not None:
+            invalidate_wishlist()
+            logger.info(f"Элемент вишлиста удален: ID {item_id}")
+            return True
+        else:
+            logger.warning(f"Элемент вишлиста не найден: ID {item_id}")
+            return False
     except Exception as e:
         logger.error(f"Ошибка удаления элемента вишлиста: {e}")
         return False
 
 
 async def format_wishlist():
-    """Форматировать вишлист для отображения"""
-    items = await get_wishlist_items()
+    """Текст вишлиста для гостей (из памяти; после изменений собирается заново)"""
+    global _wishlist_text, _wishlist_text_version
     
-    if not items:
-        return "🎁 Вишлист Вики:\n\nЗдесь пока ничего нет 🫠\n\nГлавное - внимание и любовь! ❤️"
-    
-    wishlist_text = "🎁 Вишлист Вики:\n\n"
+    if _wishlist_text_version == _wishlist_version:
+        return _wishlist_text
     
-    for i, (item_id, text, timestamp) in enumerate(items, 1):
-        wishlist_text += f"{i}. {text}\n"
+    version = _wishlist_version
+    with DB_QUERY_SECONDS.time(helper="format_wishlist"):
+        async with db_pool.acquire() as db:
+            async with db.execute("""
+                SELECT text FROM wishlist_items ORDER BY timestamp ASC, id ASC
+            """) as cursor:
+                items = [row[0] for row in await cursor.fetchall()]
     
-    wishlist_text += "\nГлавное - внимание и любовь! ❤️"
+    if not items:
+        text = "🎁 Вишлист Вики:\n\nЗдесь пока ничего нет 🫠\n\nГлавное - внимание и любовь! ❤️"
+    else:
+        lines = [f"{i}. {item}" for i, item in enumerate(items, 1)]
+        text = "🎁 Вишлист Вики:\n\n" + "\n".join(lines) + "\n\nГлавное - внимание и любовь! ❤️"
     
-    return wishlist_text
+    # Если вишлист поменялся, пока мы читали, этот текст уже устарел
+    if version == _wishlist_version:
+        _wishlist_text, _wishlist_text_version = text, version
+    return text
+
+
+async def load_wishlist():
+    """Собрать текст вишлиста заранее (при запуске бота)"""
+    try:
+        invalidate_wishlist()
+        await format_wishlist()
+    except Exception as e:
+        logger.error(f"Ошибка загрузки вишлиста: {e}")
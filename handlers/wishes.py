@@ -18,7 +18,8 @@ from config.texts import (
     CANCEL_BUTTON,
     MAIN_MENU_BUTTON
 )
-from handlers.utils import add_user, is_archive_mode
+from handlers.utils import add_user
+from services.write_queue import write_queue
 
 router = Router()
 logger = logging.getLogger(__name__)
@@ -29,24 +30,9 @@ class WishStates(StatesGroup):
     waiting_for_wish = State()
 
 
-# Словарь для отслеживания пользователей, которые отправляют поздравления
-wish_collectors = {}
-
-
 async def start_wish_collection(message: Message, user_id: int, from_user=None, state: FSMContext = None):
     """Начать сбор поздравления"""
     try:
-        # Очищаем состояние альбома если пользователь был в процессе загрузки
-        from handlers.album import album_uploaders
-        if user_id in album_uploaders:
-            album_uploaders.pop(user_id, None)
-            logger.info(f"💌 Очищено состояние альбома для пользователя {user_id}")
-        
-        # Проверяем архивный режим
-        if is_archive_mode():
-            await message.answer("📦 Функция поздравлений недоступна в архивном режиме.")
-            return
-        
         # Используем from_user если передан, иначе message.from_user
         user_info = from_user or message.from_user
         
@@ -67,10 +53,7 @@ async def start_wish_collection(message: Message, user_id: int, from_user=None,
             reply_markup=builder.as_markup()
         )
         
-        # Отмечаем, что пользователь собирает поздравление
-        wish_collectors[user_id] = True
-        
-        # Устанавливаем состояние FSM
+        # Устанавливаем состояние FSM (оно же заменяет незаконченную загрузку в альбом)
         if state:
             await state.set_state(WishStates.waiting_for_wish)
             logger.info(f"💌 Состояние FSM установлено для пользователя {user_id}")
@@ -83,13 +66,14 @@ async def start_wish_collection(message: Message, user_id: int, from_user=None,
 
 
 @router.callback_query(F.data == "cancel_wish")
-async def cancel_wish(callback: CallbackQuery):
+async def cancel_wish(callback: CallbackQuery, state: FSMContext):
     """Отменить отправку поздравления"""
     try:
         user_id = callback.from_user.id
         
-        # Убираем пользователя из списка собирающих поздравления
-        wish_collectors.pop(user_id, None)
+        # Выходим из режима поздравления
+        if await state.get_state() == WishStates.waiting_for_wish.state:
+            await state.clear()
         
         # Создаем клавиатуру с кнопкой возврата в меню
         from handlers.menu import get_back_to_menu_keyboard
@@ -113,17 +97,10 @@ async def handle_text_wish(message: Message, state: FSMContext):
     try:
         user_id = message.from_user.id
         
-        # Проверяем, собирает ли пользователь поздравление
-        if user_id not in wish_collectors:
-            return
-        
         # Сохраняем поздравление в БД
         logger.info(f"🔍 DEBUG: Сохраняем поздравление от user_id={user_id}, from_user_id={message.from_user.id}")
         await save_wish(user_id, 'text', message.text)
         
-        # Убираем пользователя из списка собирающих
-        wish_collectors.pop(user_id, None)
-        
         # Очищаем состояние FSM
         await state.clear()
         
@@ -148,10 +125,6 @@ async def handle_photo_wish(message: Message, state: FSMContext):
     try:
         user_id = message.from_user.id
         
-        # Проверяем, собирает ли пользователь поздравление
-        if user_id not in wish_collectors:
-            return
-        
         # Получаем file_id самого большого фото
         photo = message.photo[-1]
         file_id = photo.file_id
@@ -159,8 +132,8 @@ async def handle_photo_wish(message: Message, state: FSMContext):
         # Сохраняем поздравление в БД
         await save_wish(user_id, 'photo', file_id)
         
-        # Убираем пользователя из списка собирающих
-        wish_collectors.pop(user_id, None)
+        # Очищаем состояние FSM
+        await state.clear()
         
         # Создаем клавиатуру с кнопкой возврата в меню
         from handlers.menu import get_back_to_menu_keyboard
@@ -183,17 +156,13 @@ async def handle_video_wish(message: Message, state: FSMContext):
     try:
         user_id = message.from_user.id
         
-        # Проверяем, собирает ли пользователь поздравление
-        if user_id not in wish_collectors:
-            return
-        
         file_id = message.video.file_id
         
         # Сохраняем поздравление в БД
         await save_wish(user_id, 'video', file_id)
         
-        # Убираем пользователя из списка собирающих
-        wish_collectors.pop(user_id, None)
+        # Очищаем состояние FSM
+        await state.clear()
         
         # Создаем клавиатуру с кнопкой возврата в меню
         from handlers.menu import get_back_to_menu_keyboard
@@ -216,17 +185,13 @@ async def handle_voice_wish(message: Message, state: FSMContext):
     try:
         user_id = message.from_user.id
         
-        # Проверяем, собирает ли пользователь поздравление
-        if user_id not in wish_collectors:
-            return
-        
         file_id = message.voice.file_id
         
         # Сохраняем поздравление в БД
         await save_wish(user_id, 'voice', file_id)
         
-        # Убираем пользователя из списка собирающих
-        wish_collectors.pop(user_id, None)
+        # Очищаем состояние FSM
+        await state.clear()
         
         # Создаем клавиатуру с кнопкой возврата в меню
         from handlers.menu import get_back_to_menu_keyboard
@@ -249,17 +214,13 @@ async def handle_sticker_wish(message: Message, state: FSMContext):
     try:
         user_id = message.from_user.id
         
-        # Проверяем, собирает ли пользователь поздравление
-        if user_id not in wish_collectors:
-            return
-        
         file_id = message.sticker.file_id
         
         # Сохраняем поздравление в БД
         await save_wish(user_id, 'sticker', file_id)
         
-        # Убираем пользователя из списка собирающих
-        wish_collectors.pop(user_id, None)
+        # Очищаем состояние FSM
+        await state.clear()
         
         # Создаем клавиатуру с кнопкой возврата в меню
         from handlers.menu import get_back_to_menu_keyboard
@@ -279,40 +240,30 @@ async def handle_sticker_wish(message: Message, state: FSMContext):
 async def save_wish(user_id: int, content_type: str, content: str):
     """Сохранить поздравление в БД"""
     try:
-        import aiosqlite
-        from config.settings import DATABASE_PATH
-        
-        async with aiosqlite.connect(DATABASE_PATH) as db:
-            await db.execute("""
-                INSERT INTO wishes (user_id, content_type, content, is_anonymous, delivered)
-                VALUES (?, ?, ?, 0, 0)
-            """, (user_id, content_type, content))
-            await db.commit()
+        # Запись уходит в общую пачку, ждем коммита
+        await write_queue.execute("""
+            INSERT INTO wishes (user_id, content_type, content, is_anonymous, delivered)
+            VALUES (?, ?, ?, 0, 0)
+        """, (user_id, content_type, content))
             
     except Exception as e:
         logger.error(f"Ошибка сохранения поздравления: {e}")
         raise
 
 
-@router.message(Command("cancel"))
-async def cmd_cancel(message: Message):
-    """Команда отмены"""
+@router.message(Command("cancel"), WishStates.waiting_for_wish)
+async def cmd_cancel(message: Message, state: FSMContext):
+    """Команда отмены поздравления (остальные случаи обрабатывает альбом)"""
     try:
-        user_id = message.from_user.id
+        await state.clear()
         
-        # Убираем пользователя из списка собирающих поздравления
-        if user_id in wish_collectors:
-            wish_collectors.pop(user_id, None)
-            
-            # Создаем клавиатуру с кнопкой возврата в меню
-            from handlers.menu import get_back_to_menu_keyboard
-            
-            await message.answer(
-                WISH_CANCELLED,
-                reply_markup=get_back_to_menu_keyboard()
-            )
-        else:
-            await message.answer("❌ Нет активных операций для отмены.")
+        # Создаем клавиатуру с кнопкой возврата в меню
+        from handlers.menu import get_back_to_menu_keyboard
+        
+        await message.answer(
+            WISH_CANCELLED,
+            reply_markup=get_back_to_menu_keyboard()
+        )
         
     except Exception as e:
         logger.error(f"Ошибка в cmd_cancel: {e}")
@@ -4,13 +4,13 @@ Telegram-бот для дня рождения Вики Ботнарь
 """
 import asyncio
 import logging
+import signal
 import sys
 from pathlib import Path
 
 from aiogram import Bot, Dispatcher
 from aiogram.client.default import DefaultBotProperties
 from aiogram.enums import ParseMode
-from aiogram.fsm.storage.memory import MemoryStorage
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from dotenv import load_dotenv
 
@@ -18,7 +18,11 @@ from config.settings import (
     BOT_TOKEN, 
     ERROR_LOG_PATH, 
     SCHEDULER_TIMEZONE,
-    ADMIN_IDS
+    ADMIN_IDS,
+    BOT_MODE,
+    WEBHOOK_URL,
+    WEBHOOK_PATH,
+    WEBHOOK_SECRET
 )
 from handlers import (
     start,
@@ -27,9 +31,23 @@ from handlers import (
     album,
     admin,
     utils,
-    songs
+    songs,
+    pagination
 )
-from handlers.utils import setup_scheduler_jobs, init_database
+from handlers.utils import setup_scheduler_jobs, init_database, load_start_photos, load_guest_count, load_wishlist
+from middlewares import setup_update_middlewares
+from middlewares.concurrency import UpdateConcurrencyMiddleware
+from middlewares.metrics import HandlerMetricsMiddleware, RequestMetricsMiddleware
+from middlewares.phase import PhaseMiddleware
+from middlewares.throttling import ThrottlingMiddleware
+from services.database import db_pool
+from services.delivery import resume_delivery_jobs
+from services.fsm_storage import SQLiteStorage
+from services.jobs import job_queue
+from services.metrics import instrument_scheduler
+from services.migrations import run_background_migrations
+from services.web import build_web_app, start_web_server
+from services.write_queue import write_queue
 
 
 async def setup_logging():
@@ -48,6 +66,15 @@ async def setup_logging():
     logging.getLogger('apscheduler').setLevel(logging.WARNING)
 
 
+async def wait_for_shutdown():
+    """Ждать SIGINT/SIGTERM (в режиме webhook некому поймать их за нас)"""
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    await stop.wait()
+
+
 async def main():
     """Главная функция запуска бота"""
     # Загружаем переменные окружения
@@ -57,19 +84,56 @@ async def main():
     await setup_logging()
     logger = logging.getLogger(__name__)
     
+    # Фоновые задачи, которые нужно остановить при выключении
+    background_tasks = []
+    
     try:
         # Инициализируем базу данных
         await init_database()
         
+        # Открываем пул соединений с БД для обработчиков
+        await db_pool.open()
+        
+        # Запускаем очередь пакетной записи (поздравления, альбом, треки)
+        await write_queue.start()
+        
+        # Стартовые фото читаются на каждое нажатие кнопки - держим их в памяти
+        await load_start_photos()
+        
+        # Счетчик гостей для кнопки "Я буду!" тоже живет в памяти
+        await load_guest_count()
+        
+        # Вишлист меняют только админы, гостям отдаем готовый текст
+        await load_wishlist()
+        
+        # Тяжелые миграции (бэкфиллы, индексы) идут пачками в фоне
+        background_tasks.append(asyncio.create_task(run_background_migrations()))
+        
         # Создаем бота и диспетчер
         bot = Bot(
             token=BOT_TOKEN,
             default=DefaultBotProperties(parse_mode=ParseMode.HTML)
         )
-        # Создаем диспетчер с хранилищем состояний
-        storage = MemoryStorage()
+        # Каждый запрос к Bot API попадает в метрики (/metrics)
+        bot.session.middleware(RequestMetricsMiddleware())
+        # Создаем диспетчер с хранилищем состояний (переживает перезапуск)
+        storage = SQLiteStorage()
         dp = Dispatcher(storage=storage)
         
+        # Цепочка обработки обновления, по порядку:
+        # разные чаты - параллельно, один чат - строго по порядку;
+        # ограничение частоты сообщений и нажатий кнопок (в том числе отказов по фазе);
+        # недоступное в текущей фазе события отсекается до FSM и обработчиков
+        setup_update_middlewares(
+            dp,
+            UpdateConcurrencyMiddleware(),
+            ThrottlingMiddleware(),
+            PhaseMiddleware()
+        )
+        
+        # Счетчики и время работы обработчиков всех роутеров
+        HandlerMetricsMiddleware().setup(dp)
+        
         # Проверяем подключение к Telegram API
         try:
             bot_info = await bot.get_me()
@@ -80,11 +144,14 @@ async def main():
         
         # Настраиваем scheduler
         scheduler = AsyncIOScheduler(timezone=SCHEDULER_TIMEZONE)
+        instrument_scheduler(scheduler)
         
         # Регистрируем роутеры (admin и songs первыми для FSM, wishes перед album)
         logger.info("Регистрируем роутеры...")
         dp.include_router(admin.router)
         logger.info("✅ admin.router зарегистрирован")
+        dp.include_router(pagination.router)
+        logger.info("✅ pagination.router зарегистрирован")
         dp.include_router(songs.router)
         logger.info("✅ songs.router зарегистрирован")
         dp.include_router(start.router)
@@ -105,28 +172,68 @@ async def main():
         
         # Настраиваем scheduled jobs
         await setup_scheduler_jobs(scheduler, bot)
+        scheduler.add_job(
+            storage.cleanup,
+            'interval',
+            hours=1,
+            id='fsm_cleanup',
+            timezone=SCHEDULER_TIMEZONE
+        )
+        
+        # Очередь долгих заданий (рассылки, альбом, поздравления) - до
+        # scheduler: задачи по расписанию ставятся в нее
+        await job_queue.start(bot)
         
         # Запускаем scheduler
         scheduler.start()
         
-        logger.info(f"Бот запущен! Администраторы: {ADMIN_IDS}")
+        # Дорабатываем рассылки, прерванные прошлым перезапуском
+        background_tasks.append(asyncio.create_task(resume_delivery_jobs(bot)))
         
-        # Удаляем webhook если он был установлен
-        await bot.delete_webhook(drop_pending_updates=True)
-        logger.info("🔄 Webhook удален, начинаем polling")
+        # Веб-сервер: /health и /metrics всегда, прием обновлений - в режиме webhook
+        web_runner = await start_web_server(build_web_app(dp, bot, scheduler))
+        
+        logger.info(f"Бот запущен! Администраторы: {ADMIN_IDS}")
         
-        # Запускаем бота
-        logger.info("🚀 Запускаем polling...")
-        await dp.start_polling(bot, polling_timeout=10)
+        if BOT_MODE == 'webhook':
+            # Telegram сам присылает обновления, без круговых запросов getUpdates
+            await bot.set_webhook(
+                f"{WEBHOOK_URL}{WEBHOOK_PATH}",
+                secret_token=WEBHOOK_SECRET,
+                allowed_updates=dp.resolve_used_update_types(),
+                drop_pending_updates=True
+            )
+            logger.info(f"🚀 Webhook установлен: {WEBHOOK_URL}{WEBHOOK_PATH}")
+            await wait_for_shutdown()
+        else:
+            # Удаляем webhook если он был установлен
+            await bot.delete_webhook(drop_pending_updates=True)
+            logger.info("🔄 Webhook удален, начинаем polling")
+            
+            # Запускаем бота
+            logger.info("🚀 Запускаем polling...")
+            await dp.start_polling(bot, polling_timeout=10)
         
     except Exception as e:
         logger.error(f"Ошибка при запуске бота: {e}")
         raise
     finally:
+        # Прерываем админское задание (рассылки дорабатываются после перезапуска)
+        await job_queue.close()
+        for task in background_tasks:
+            task.cancel()
+        await asyncio.gather(*background_tasks, return_exceptions=True)
+        if 'web_runner' in locals():
+            await web_runner.cleanup()
         if 'scheduler' in locals():
             scheduler.shutdown()
         if 'bot' in locals():
             await bot.session.close()
+        # Дописываем накопленные записи до закрытия соединений
+        if 'storage' in locals():
+            await storage.close()
+        await write_queue.close()
+        await db_pool.close()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,19 @@
+"""
+Middlewares package
+"""
+from aiogram import Dispatcher
+
+
+def setup_update_middlewares(dp: Dispatcher, *middlewares):
+    """Поставить middlewares в начало outer-middleware обновлений в указанном порядке
+
+    Встроенные middleware aiogram (контекст FSM и т.п.) остаются после них.
+    Порядок цепочки задается только здесь, одним вызовом.
+    """
+    existing = list(dp.update.outer_middleware)
+    for middleware in existing:
+        dp.update.outer_middleware.unregister(middleware)
+    for middleware in middlewares:
+        dp.update.outer_middleware.register(middleware)
+    for middleware in existing:
+        dp.update.outer_middleware.register(middleware)
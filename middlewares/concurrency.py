@@ -0,0 +1,66 @@
+"""
+Middleware конкурентной обработки обновлений с порядком внутри чата
+"""
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, Update
+
+from config.settings import UPDATE_MAX_CONCURRENCY
+
+logger = logging.getLogger(__name__)
+
+
+def get_update_chat_id(update: Update) -> Optional[int]:
+    """Чат (или пользователь), к которому относится обновление"""
+    event = update.event
+    chat = getattr(event, 'chat', None)
+    if chat is None and getattr(event, 'message', None) is not None:
+        chat = event.message.chat
+    if chat is not None:
+        return chat.id
+    user = getattr(event, 'from_user', None)
+    return user.id if user else None
+
+
+class UpdateConcurrencyMiddleware(BaseMiddleware):
+    """Обновления разных чатов обрабатываются параллельно (не больше
+    max_concurrent одновременно), обновления одного чата - строго по очереди
+
+    Должен стоять первым среди outer-middleware обновлений: тогда и чтение
+    состояния FSM для следующего обновления чата произойдет только после
+    того, как предыдущее обработано.
+    """
+
+    def __init__(self, max_concurrent: int = UPDATE_MAX_CONCURRENCY):
+        self._semaphore = asyncio.Semaphore(max_concurrent)
+        # chat_id -> [lock, число обновлений, ожидающих или держащих lock]
+        self._chats = {}
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        chat_id = get_update_chat_id(event) if isinstance(event, Update) else None
+        if chat_id is None:
+            async with self._semaphore:
+                return await handler(event, data)
+
+        entry = self._chats.get(chat_id)
+        if entry is None:
+            entry = self._chats[chat_id] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            # Сначала очередь своего чата, потом общий слот: ожидающие
+            # чаты не занимают места тех, кто может работать
+            async with entry[0]:
+                async with self._semaphore:
+                    return await handler(event, data)
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._chats[chat_id]
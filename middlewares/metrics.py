@@ -0,0 +1,80 @@
+"""
+Middleware, которые собирают метрики обработчиков и запросов к Bot API
+"""
+import time
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware, Bot, Dispatcher
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import TelegramMethod
+from aiogram.methods.base import Response, TelegramType
+from aiogram.types import TelegramObject
+
+from services.metrics import (
+    HANDLER_UPDATES,
+    HANDLER_SECONDS,
+    API_REQUESTS,
+    API_SECONDS
+)
+
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    """Считает обновления и время работы каждого обработчика
+
+    Стоит во внутренних middleware диспетчера, поэтому видит только
+    обновления, для которых нашелся обработчик (после фазы, throttling и
+    FSM). Роутер - модуль обработчика (menu, admin, ...).
+    """
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        callback = getattr(data.get('handler'), 'callback', None)
+        router = getattr(callback, '__module__', 'unknown').rsplit('.', 1)[-1]
+        name = getattr(callback, '__name__', 'unknown')
+
+        started = time.perf_counter()
+        status = 'ok'
+        try:
+            return await handler(event, data)
+        except Exception:
+            status = 'error'
+            raise
+        finally:
+            HANDLER_SECONDS.observe(time.perf_counter() - started, router=router, handler=name)
+            HANDLER_UPDATES.inc(router=router, handler=name, status=status)
+
+    def setup(self, dp: Dispatcher):
+        """Поставить middleware на все типы событий диспетчера (и вложенных роутеров)"""
+        for event_name, observer in dp.observers.items():
+            if event_name not in ('update', 'error'):
+                observer.middleware(self)
+
+
+class RequestMetricsMiddleware(BaseRequestMiddleware):
+    """Считает запросы к Bot API, их время и ответы 429 по методам"""
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: Bot,
+        method: TelegramMethod[TelegramType]
+    ) -> Response[TelegramType]:
+        api_method = method.__api_method__
+        started = time.perf_counter()
+        status = 'ok'
+        try:
+            return await make_request(bot, method)
+        except TelegramRetryAfter:
+            status = '429'
+            raise
+        except Exception:
+            status = 'error'
+            raise
+        finally:
+            API_SECONDS.observe(time.perf_counter() - started, method=api_method)
+            API_REQUESTS.inc(method=api_method, status=status)
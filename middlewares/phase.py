@@ -0,0 +1,109 @@
+"""
+Middleware, которое пускает к обработчикам только то, что доступно в текущей фазе события
+"""
+import logging
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from aiogram import BaseMiddleware
+from aiogram.types import CallbackQuery, Message, TelegramObject, Update
+from aiogram.utils.keyboard import InlineKeyboardBuilder
+
+from config.settings import ADMIN_IDS
+from config.texts import ARCHIVE_MODE, ARCHIVE_START, ARCHIVE_MENU_BUTTONS, ALBUM_NOT_READY
+from services.event_calendar import Phase, event_calendar
+
+logger = logging.getLogger(__name__)
+
+# Кнопки, которые открываются только с наступлением фазы: callback_data -> (фаза, текст отказа)
+CALLBACK_MIN_PHASE = {
+    'upload_photos': (Phase.PARTY, ALBUM_NOT_READY),
+}
+
+# В архивном режиме остаются только кнопки, которым не нужно ничего менять
+# (тексты - в ARCHIVE_MENU_BUTTONS)
+ARCHIVE_MENU_CALLBACKS = {
+    "🔮 Вика-гадалка": "fortune",
+    "🎁 Вишлист": "wishlist",
+}
+ARCHIVE_CALLBACKS = set(ARCHIVE_MENU_CALLBACKS.values())
+
+# Команды со своим ответом в архивном режиме: команда -> текст. Остальные
+# сообщения идут к обработчикам, как и до перехода в архив
+ARCHIVE_COMMANDS = {
+    '/start': ARCHIVE_START,
+}
+
+
+def build_archive_keyboard():
+    """Клавиатура с кнопками, доступными в архивном режиме"""
+    builder = InlineKeyboardBuilder()
+    for row in ARCHIVE_MENU_BUTTONS:
+        for button_text in row:
+            builder.button(text=button_text, callback_data=ARCHIVE_MENU_CALLBACKS[button_text])
+    builder.adjust(2)
+    return builder.as_markup()
+
+
+ARCHIVE_KEYBOARD = build_archive_keyboard()
+
+
+def get_command(message: Message) -> Optional[str]:
+    """Команда сообщения без аргументов и @имени бота (None - не команда)"""
+    words = (message.text or "").split(maxsplit=1)
+    if not words or not words[0].startswith("/"):
+        return None
+    return words[0].split("@", 1)[0]
+
+
+def get_denial(event: TelegramObject, phase: Phase) -> Optional[str]:
+    """Текст отказа, если событие недоступно в фазе phase, иначе None"""
+    if phase == Phase.ARCHIVE:
+        if isinstance(event, CallbackQuery):
+            return None if event.data in ARCHIVE_CALLBACKS else ARCHIVE_MODE
+        if isinstance(event, Message):
+            return ARCHIVE_COMMANDS.get(get_command(event))
+        return None
+
+    if isinstance(event, CallbackQuery) and event.data in CALLBACK_MIN_PHASE:
+        min_phase, text = CALLBACK_MIN_PHASE[event.data]
+        if phase < min_phase:
+            return text
+    return None
+
+
+class PhaseMiddleware(BaseMiddleware):
+    """Отвечает на недоступные в текущей фазе сообщения и кнопки сам
+
+    Стоит в outer-middleware обновлений после ThrottlingMiddleware (отказы
+    тоже ограничены по частоте) и до чтения состояния FSM, поэтому отказ не
+    трогает БД. Админы проходят в любой фазе. В архивном режиме к отказу
+    прикладываются оставшиеся кнопки.
+    """
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        inner = event.event if isinstance(event, Update) else event
+        user = getattr(inner, 'from_user', None)
+        if user is None or user.id in ADMIN_IDS:
+            return await handler(event, data)
+
+        phase = event_calendar.phase
+        text = get_denial(inner, phase)
+        if text is None:
+            return await handler(event, data)
+
+        reply_markup = ARCHIVE_KEYBOARD if phase == Phase.ARCHIVE else None
+        try:
+            if isinstance(inner, CallbackQuery):
+                await inner.answer()
+                if isinstance(inner.message, Message):
+                    await inner.message.answer(text, reply_markup=reply_markup)
+            elif isinstance(inner, Message):
+                await inner.answer(text, reply_markup=reply_markup)
+        except Exception as e:
+            logger.error(f"Ошибка ответа на недоступное в фазе {phase.name} действие: {e}")
+        return None
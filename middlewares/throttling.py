@@ -0,0 +1,80 @@
+"""
+Middleware ограничения частоты сообщений и нажатий кнопок
+"""
+import logging
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import CallbackQuery, Message, TelegramObject, Update
+
+from config.settings import ADMIN_IDS
+from config.texts import RATE_LIMIT_MESSAGE
+from services.rate_limit import RateLimiter
+
+logger = logging.getLogger(__name__)
+
+
+class ThrottlingMiddleware(BaseMiddleware):
+    """Отбрасывает сообщения и callback'и сверх RATE_LIMIT_MESSAGES за RATE_LIMIT_WINDOW
+
+    Админы не ограничиваются. Альбом (media group) считается одним
+    сообщением. О превышении лимита пользователь узнает один раз, остальные
+    лишние события молча игнорируются. Стоит в outer-middleware обновлений
+    перед PhaseMiddleware, так что лимит распространяется и на отказы
+    недоступных в текущей фазе действий.
+    """
+
+    # Сколько последних media group помнить
+    MAX_MEDIA_GROUPS = 1000
+
+    def __init__(self, limiter: RateLimiter = None):
+        self.limiter = limiter if limiter is not None else RateLimiter()
+        # media_group_id -> пропущена ли группа
+        self._media_groups = OrderedDict()
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        inner = event.event if isinstance(event, Update) else event
+        if not isinstance(inner, (Message, CallbackQuery)):
+            return await handler(event, data)
+        user = inner.from_user
+        if user is None or user.id in ADMIN_IDS:
+            return await handler(event, data)
+
+        media_group_id = inner.media_group_id if isinstance(inner, Message) else None
+        if media_group_id and media_group_id in self._media_groups:
+            if self._media_groups[media_group_id]:
+                return await handler(event, data)
+            return None
+
+        allowed, retry_after, first_rejection = self.limiter.hit(user.id)
+
+        if media_group_id:
+            self._media_groups[media_group_id] = allowed
+            if len(self._media_groups) > self.MAX_MEDIA_GROUPS:
+                self._media_groups.popitem(last=False)
+
+        if allowed:
+            return await handler(event, data)
+
+        if first_rejection:
+            logger.info(f"⏰ Пользователь {user.id} превысил лимит сообщений, ждать {retry_after:.0f} с")
+            try:
+                if isinstance(inner, CallbackQuery):
+                    await inner.answer(RATE_LIMIT_MESSAGE.strip(), show_alert=True)
+                else:
+                    await inner.answer(RATE_LIMIT_MESSAGE)
+            except Exception as e:
+                logger.error(f"Ошибка уведомления о лимите сообщений: {e}")
+        elif isinstance(inner, CallbackQuery):
+            # Кнопка должна перестать "крутиться", даже если нажатие отброшено
+            try:
+                await inner.answer()
+            except Exception:
+                pass
+        return None
@@ -0,0 +1,118 @@
+"""
+Рассылка сообщений множеству чатов с ограниченной конкурентностью
+"""
+import asyncio
+import logging
+import time
+
+from config.settings import BROADCAST_CONCURRENCY, BROADCAST_PROGRESS_INTERVAL
+from services.metrics import BROADCAST_PENDING
+from services.outbound import outbound_limiter
+
+logger = logging.getLogger(__name__)
+
+
+def format_broadcast_progress(stats: dict, title: str = "📣 Рассылка") -> str:
+    """Текст статуса рассылки для админа"""
+    done = stats['sent'] + stats['failed']
+    text = (
+        f"{title}: {done}/{stats['total']}\n"
+        f"✅ Отправлено: {stats['sent']}\n"
+        f"❌ Ошибок: {stats['failed']}\n"
+        f"🔁 Повторов после flood control: {stats['retries']}\n"
+        f"⚡ Скорость: {stats['rate']:.1f} сообщ./с (лимит {stats['limit']:.0f})"
+    )
+    if stats['finished']:
+        text += f"\n⏱ Время: {stats['elapsed']:.1f} с"
+    return text
+
+
+async def broadcast(chat_ids, send, concurrency: int = BROADCAST_CONCURRENCY,
+                    limiter=outbound_limiter, on_progress=None,
+                    progress_interval: float = BROADCAST_PROGRESS_INTERVAL) -> dict:
+    """Разослать что-то по списку чатов
+
+    send(chat_id, call) - корутинная функция, которая отправляет всё нужное
+    одному чату; каждый запрос к API она оборачивает в
+    call(lambda: bot.send_...), чтобы он прошел через общий лимитер. Чаты
+    обрабатываются concurrency воркерами. on_progress(stats) вызывается раз в
+    progress_interval секунд и в конце. Возвращает итоговую статистику;
+    rate в ней - фактическое число успешных запросов к API в секунду.
+    """
+    chat_ids = list(chat_ids)
+    started = time.monotonic()
+    stats = {
+        'total': len(chat_ids),
+        'sent': 0,
+        'failed': 0,
+        'retries': 0,
+        'requests': 0,
+        'rate': 0.0,
+        'limit': limiter.current_rate,
+        'elapsed': 0.0,
+        'finished': False,
+    }
+
+    def on_retry(retry_after):
+        stats['retries'] += 1
+
+    def refresh_timing():
+        stats['elapsed'] = time.monotonic() - started
+        stats['rate'] = stats['requests'] / stats['elapsed'] if stats['elapsed'] > 0 else 0.0
+        stats['limit'] = limiter.current_rate
+
+    async def report_progress():
+        if not on_progress:
+            return
+        refresh_timing()
+        try:
+            await on_progress(dict(stats))
+        except Exception as e:
+            logger.warning(f"Ошибка обновления статуса рассылки: {e}")
+
+    pending = iter(chat_ids)
+    # Сколько чатов этой рассылки еще висит в общей метрике очереди
+    unprocessed = len(chat_ids)
+    BROADCAST_PENDING.inc(unprocessed)
+
+    async def worker():
+        nonlocal unprocessed
+        for chat_id in pending:
+            async def call(request, chat_id=chat_id):
+                result = await limiter.call(chat_id, request, on_retry=on_retry)
+                stats['requests'] += 1
+                return result
+
+            try:
+                await send(chat_id, call)
+                stats['sent'] += 1
+            except Exception as e:
+                stats['failed'] += 1
+                logger.error(f"Ошибка рассылки в чат {chat_id}: {e}")
+            unprocessed -= 1
+            BROADCAST_PENDING.dec()
+
+    async def reporter():
+        while True:
+            await asyncio.sleep(progress_interval)
+            await report_progress()
+
+    reporter_task = asyncio.create_task(reporter()) if on_progress else None
+    try:
+        await asyncio.gather(*(worker() for _ in range(max(1, min(concurrency, len(chat_ids))))))
+    finally:
+        if reporter_task:
+            reporter_task.cancel()
+        # Прерванная рассылка не должна навсегда остаться в очереди
+        BROADCAST_PENDING.dec(unprocessed)
+
+    stats['finished'] = True
+    refresh_timing()
+    await report_progress()
+
+    logger.info(
+        f"📣 Рассылка завершена: {stats['sent']}/{stats['total']} за {stats['elapsed']:.1f} с "
+        f"({stats['requests']} запросов, {stats['rate']:.1f} сообщ./с при лимите {stats['limit']:.1f}, "
+        f"ошибок {stats['failed']}, повторов {stats['retries']})"
+    )
+    return stats
@@ -0,0 +1,59 @@
+"""
+Ограниченный по размеру кэш с временем жизни записей
+"""
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+    """Словарь, записи которого живут ttl секунд, а размер не больше maxsize
+
+    Просроченные записи выбрасываются при обращении, а при переполнении -
+    самые давно записанные.
+    """
+
+    _MISSING = object()
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        # key -> (value, expires_at); порядок - по времени записи
+        self._data = OrderedDict()
+
+    def __len__(self) -> int:
+        self._evict(time.monotonic())
+        return len(self._data)
+
+    def __contains__(self, key) -> bool:
+        return self.get(key, self._MISSING) is not self._MISSING
+
+    def get(self, key, default=None):
+        item = self._data.get(key)
+        if item is None:
+            return default
+        value, expires_at = item
+        if expires_at <= time.monotonic():
+            del self._data[key]
+            return default
+        return value
+
+    def set(self, key, value, ttl: float = None):
+        now = time.monotonic()
+        self._data.pop(key, None)
+        self._data[key] = (value, now + (self.ttl if ttl is None else ttl))
+        self._evict(now)
+
+    def pop(self, key, default=None):
+        value = self.get(key, default)
+        self._data.pop(key, None)
+        return value
+
+    def clear(self):
+        self._data.clear()
+
+    def _evict(self, now: float):
+        while self._data:
+            key, (_, expires_at) = next(iter(self._data.items()))
+            if expires_at > now and len(self._data) <= self.maxsize:
+                break
+            del self._data[key]
@@ -0,0 +1,118 @@
+"""
+Пул долгоживущих соединений с базой данных
+"""
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+
+import aiosqlite
+
+from config.settings import (
+    DATABASE_PATH,
+    DATABASE_POOL_SIZE,
+    DATABASE_CACHE_SIZE_KB,
+    DATABASE_MMAP_SIZE,
+    DATABASE_BUSY_TIMEOUT_MS
+)
+
+logger = logging.getLogger(__name__)
+
+
+async def configure_connection(db: aiosqlite.Connection):
+    """Применить PRAGMA, которые действуют только в рамках соединения
+
+    journal_mode=WAL хранится в самом файле БД и включается в init_database,
+    остальное нужно выставлять каждому соединению.
+    """
+    # FULL: коммит в WAL синхронизируется с диском до возврата, иначе запись,
+    # которую бот уже подтвердил, могла бы пропасть при отключении питания.
+    # fsync один на пачку очереди записи, а не на строку
+    await db.execute("PRAGMA synchronous = FULL")
+    await db.execute(f"PRAGMA cache_size = -{int(DATABASE_CACHE_SIZE_KB)}")
+    await db.execute(f"PRAGMA mmap_size = {int(DATABASE_MMAP_SIZE)}")
+    await db.execute("PRAGMA temp_store = MEMORY")
+    await db.execute(f"PRAGMA busy_timeout = {int(DATABASE_BUSY_TIMEOUT_MS)}")
+
+
+async def explain_query_plan(db: aiosqlite.Connection, sql: str, params: tuple = ()) -> list:
+    """Получить план запроса (строки detail из EXPLAIN QUERY PLAN)"""
+    async with db.execute(f"EXPLAIN QUERY PLAN {sql}", params) as cursor:
+        return [row[3] for row in await cursor.fetchall()]
+
+
+class DatabasePool:
+    """Ограниченный пул соединений aiosqlite
+
+    Каждое соединение aiosqlite держит свой рабочий поток и файловый дескриптор,
+    поэтому соединения открываются один раз при старте и переиспользуются всеми
+    обработчиками вместо connect() на каждое обновление.
+    """
+
+    def __init__(self, path=DATABASE_PATH, size: int = DATABASE_POOL_SIZE):
+        self.path = path
+        self.size = size
+        self._connections = []
+        self._idle = None
+
+    @property
+    def is_open(self) -> bool:
+        """Открыт ли пул"""
+        return self._idle is not None
+
+    async def open(self):
+        """Открыть все соединения пула"""
+        if self.is_open:
+            return
+
+        idle = asyncio.Queue()
+        try:
+            for _ in range(self.size):
+                db = await aiosqlite.connect(self.path)
+                self._connections.append(db)
+                await configure_connection(db)
+                idle.put_nowait(db)
+        except Exception:
+            await self._close_connections()
+            raise
+
+        self._idle = idle
+        logger.info(f"🗄 Пул соединений с БД открыт ({self.size} соединений)")
+
+    async def close(self):
+        """Закрыть все соединения пула"""
+        if not self.is_open:
+            return
+
+        self._idle = None
+        await self._close_connections()
+        logger.info("🗄 Пул соединений с БД закрыт")
+
+    async def _close_connections(self):
+        for db in self._connections:
+            try:
+                await db.close()
+            except Exception as e:
+                logger.error(f"Ошибка закрытия соединения с БД: {e}")
+        self._connections = []
+
+    @asynccontextmanager
+    async def acquire(self):
+        """Взять соединение из пула на время блока async with"""
+        idle = self._idle
+        if idle is None:
+            raise RuntimeError("Пул соединений с БД не открыт")
+
+        db = await idle.get()
+        try:
+            yield db
+        finally:
+            # Незавершенная транзакция не должна достаться следующему обработчику
+            try:
+                if db.in_transaction:
+                    await db.rollback()
+            except Exception as e:
+                logger.error(f"Ошибка отката транзакции при возврате соединения: {e}")
+            idle.put_nowait(db)
+
+
+db_pool = DatabasePool()
@@ -0,0 +1,204 @@
+"""
+Персистентные задания доставки (рассылки, альбом, новые фото)
+
+Каждое задание хранит список получателей со статусом, числом попыток и
+последней ошибкой. После перезапуска незавершенные задания дорабатываются
+только для тех, кто еще не получил сообщение. Доставка "хотя бы один раз":
+если бот упадет между отправкой и записью статуса, этот получатель получит
+сообщение повторно.
+"""
+import asyncio
+import json
+import logging
+import time
+from collections import namedtuple
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError
+
+from config.settings import BROADCAST_CONCURRENCY, DELIVERY_MAX_ATTEMPTS, DELIVERY_RETRY_DELAY
+from services.broadcast import broadcast
+from services.database import db_pool
+from services.write_queue import write_queue
+
+logger = logging.getLogger(__name__)
+
+Sender = namedtuple("Sender", ["send", "concurrency"])
+
+# Зарегистрированные виды заданий: kind -> Sender
+SENDERS = {}
+
+
+def register_sender(kind: str, send, concurrency: int = BROADCAST_CONCURRENCY):
+    """Зарегистрировать вид задания
+
+    send(bot, chat_id, payload, call) отправляет всё одному получателю, каждый
+    запрос к API оборачивая в call(...).
+    """
+    SENDERS[kind] = Sender(send, concurrency)
+
+
+async def create_delivery_job(kind: str, payload: dict, chat_ids, extra_statements=()) -> int:
+    """Создать задание со списком получателей
+
+    extra_statements - пары (sql, params), которые выполняются в той же
+    транзакции (например, пометить файлы как взятые в рассылку).
+    """
+    if kind not in SENDERS:
+        raise ValueError(f"Неизвестный вид задания доставки: {kind}")
+
+    results = await write_queue.transaction([
+        ("INSERT INTO delivery_jobs (kind, payload) VALUES (?, ?)",
+         (kind, json.dumps(payload, ensure_ascii=False))),
+        # last_insert_rowid() - id задания из предыдущего запроса этой же
+        # транзакции; подзапрос вычисляется один раз, до вставки получателей
+        ("""
+            INSERT OR IGNORE INTO delivery_recipients (job_id, chat_id)
+            SELECT (SELECT last_insert_rowid()), value FROM json_each(?)
+        """, (json.dumps(list(chat_ids)),)),
+        *extra_statements,
+    ])
+    job_id = results[0].lastrowid
+
+    logger.info(f"📬 Создано задание доставки #{job_id} ({kind})")
+    return job_id
+
+
+def _is_permanent_error(error: Exception) -> bool:
+    """Ошибки, после которых повторять доставку бессмысленно"""
+    return isinstance(error, (TelegramForbiddenError, TelegramBadRequest))
+
+
+async def run_delivery_job(bot: Bot, job_id: int, on_progress=None) -> dict:
+    """Доставить задание всем получателям, которые его еще не получили
+
+    Получатели с временной ошибкой пробуются снова в этом же запуске, с
+    растущей паузой, пока не кончатся DELIVERY_MAX_ATTEMPTS попыток.
+    """
+    async with db_pool.acquire() as db:
+        async with db.execute(
+            "SELECT kind, payload FROM delivery_jobs WHERE id = ?", (job_id,)
+        ) as cursor:
+            job = await cursor.fetchone()
+        if not job:
+            raise ValueError(f"Задание доставки #{job_id} не найдено")
+
+        async with db.execute("""
+            SELECT chat_id, attempts FROM delivery_recipients
+            WHERE job_id = ? AND status = 'pending'
+        """, (job_id,)) as cursor:
+            recipients = dict(await cursor.fetchall())
+
+    kind, payload = job[0], json.loads(job[1])
+    sender = SENDERS[kind]
+    started = time.monotonic()
+    # Получатели с временной ошибкой, у которых еще остались попытки
+    retry = set()
+
+    async def send(chat_id, call):
+        attempts = recipients[chat_id] = recipients[chat_id] + 1
+        try:
+            await sender.send(bot, chat_id, payload, call)
+        except Exception as e:
+            final = attempts >= DELIVERY_MAX_ATTEMPTS or _is_permanent_error(e)
+            if not final:
+                retry.add(chat_id)
+            await write_queue.execute("""
+                UPDATE delivery_recipients
+                SET status = ?, attempts = ?, last_error = ?, updated_at = CURRENT_TIMESTAMP
+                WHERE job_id = ? AND chat_id = ?
+            """, ('failed' if final else 'pending', attempts, str(e)[:500], job_id, chat_id))
+            raise
+        await write_queue.execute("""
+            UPDATE delivery_recipients
+            SET status = 'sent', attempts = ?, last_error = NULL, updated_at = CURRENT_TIMESTAMP
+            WHERE job_id = ? AND chat_id = ?
+        """, (attempts, job_id, chat_id))
+
+    def merge(total: dict, round_stats: dict) -> dict:
+        """Итог всех попыток: повторно доставленные перестают считаться ошибками"""
+        merged = dict(round_stats)
+        for name in ('sent', 'retries', 'requests'):
+            merged[name] = total[name] + round_stats[name]
+        merged['total'] = total['total']
+        merged['failed'] = total['failed'] - round_stats['sent']
+        merged['elapsed'] = time.monotonic() - started
+        merged['rate'] = merged['requests'] / merged['elapsed'] if merged['elapsed'] > 0 else 0.0
+        return merged
+
+    logger.info(f"📬 Задание #{job_id} ({kind}): осталось {len(recipients)} получателей")
+    stats = await broadcast(list(recipients), send, concurrency=sender.concurrency, on_progress=on_progress)
+
+    delay = DELIVERY_RETRY_DELAY
+    while retry:
+        chat_ids = list(retry)
+        retry.clear()
+        logger.info(f"📬 Задание #{job_id} ({kind}): повтор для {len(chat_ids)} получателей через {delay} с")
+        await asyncio.sleep(delay)
+        delay *= 2
+
+        async def report_round(round_stats, total=stats):
+            await on_progress(merge(total, round_stats))
+
+        round_stats = await broadcast(chat_ids, send, concurrency=sender.concurrency,
+                                      on_progress=report_round if on_progress else None)
+        stats = merge(stats, round_stats)
+
+    # Закрываем задание, если не осталось получателей для повторной попытки
+    finished = await write_queue.execute("""
+        UPDATE delivery_jobs
+        SET status = 'done', finished_at = CURRENT_TIMESTAMP
+        WHERE id = ? AND status != 'done' AND NOT EXISTS (
+            SELECT 1 FROM delivery_recipients
+            WHERE job_id = ? AND status = 'pending'
+        )
+    """, (job_id, job_id)) is not None
+
+    if finished:
+        logger.info(f"📬 Задание #{job_id} ({kind}) завершено")
+    else:
+        logger.warning(f"📬 Задание #{job_id} ({kind}) не завершено: часть статусов не записалась, повторим после перезапуска")
+
+    return stats
+
+
+async def cancel_delivery_job(job_id: int):
+    """Отменить задание: оставшиеся получатели помечаются как failed"""
+    await write_queue.transaction([
+        ("""
+            UPDATE delivery_recipients
+            SET status = 'failed', last_error = 'cancelled', updated_at = CURRENT_TIMESTAMP
+            WHERE job_id = ? AND status = 'pending'
+        """, (job_id,)),
+        ("""
+            UPDATE delivery_jobs
+            SET status = 'done', finished_at = CURRENT_TIMESTAMP
+            WHERE id = ? AND status != 'done'
+        """, (job_id,)),
+    ])
+    logger.info(f"📬 Задание доставки #{job_id} отменено")
+
+
+async def resume_delivery_jobs(bot: Bot):
+    """Доработать задания, прерванные перезапуском бота"""
+    try:
+        async with db_pool.acquire() as db:
+            async with db.execute(
+                "SELECT id FROM delivery_jobs WHERE status != 'done' ORDER BY id"
+            ) as cursor:
+                job_ids = [row[0] for row in await cursor.fetchall()]
+
+        if not job_ids:
+            return
+
+        logger.info(f"📬 Возобновляем {len(job_ids)} незавершенных заданий доставки")
+        for job_id in job_ids:
+            try:
+                await run_delivery_job(bot, job_id)
+            except Exception as e:
+                logger.error(f"Ошибка возобновления задания доставки #{job_id}: {e}")
+
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        logger.error(f"Ошибка возобновления заданий доставки: {e}")
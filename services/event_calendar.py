@@ -0,0 +1,114 @@
+"""
+Календарь события: даты из настроек и текущая фаза (до ДР, тусовка, альбом, архив)
+
+Даты разбираются один раз при импорте, «сегодня» считается в часовом поясе
+SCHEDULER_TIMEZONE. Фаза и таймер до ДР меняются только в полночь, поэтому
+они вычисляются один раз за сутки, а проверки в обработчиках - это чтение
+атрибута и сравнение с временем следующей полуночи.
+"""
+import time
+from datetime import date, datetime, timedelta
+from enum import IntEnum
+from zoneinfo import ZoneInfo
+
+from config.settings import (
+    BIRTHDAY_DATE,
+    ARCHIVE_DATE,
+    ALBUM_DELAY_DAYS,
+    SCHEDULER_TIMEZONE
+)
+
+
+class Phase(IntEnum):
+    """Фазы события по порядку: можно сравнивать (phase >= Phase.PARTY)"""
+    PRE_PARTY = 1  # До дня рождения
+    PARTY = 2      # День рождения и неделя после него: поздравления открыты, фото загружаются
+    ALBUM = 3      # Альбом собран и разослан
+    ARCHIVE = 4    # Архивный режим
+
+
+class EventCalendar:
+    """Даты события и фаза на сегодня"""
+
+    def __init__(self, birthday: str = BIRTHDAY_DATE, archive: str = ARCHIVE_DATE,
+                 album_delay_days: int = ALBUM_DELAY_DAYS, timezone: str = SCHEDULER_TIMEZONE):
+        self._tz = ZoneInfo(timezone)
+        self._birthday = date.fromisoformat(birthday)
+        self._album_date = self._birthday + timedelta(days=album_delay_days)
+        self._archive_date = date.fromisoformat(archive)
+        # Состояние на сегодня и момент (time.time()), когда его пора пересчитать
+        self._today = None
+        self._days_until_birthday = None
+        self._phase = None
+        self._refresh_at = 0.0
+
+    @property
+    def tz(self) -> ZoneInfo:
+        return self._tz
+
+    @property
+    def birthday(self) -> date:
+        return self._birthday
+
+    @property
+    def album_date(self) -> date:
+        return self._album_date
+
+    @property
+    def archive_date(self) -> date:
+        return self._archive_date
+
+    @property
+    def today(self) -> date:
+        """Сегодняшняя дата в часовом поясе события"""
+        self._ensure_fresh()
+        return self._today
+
+    @property
+    def days_until_birthday(self) -> int:
+        self._ensure_fresh()
+        return self._days_until_birthday
+
+    @property
+    def phase(self) -> Phase:
+        self._ensure_fresh()
+        return self._phase
+
+    @property
+    def is_after_birthday(self) -> bool:
+        """Наступил ли день рождения (сам день тоже считается)"""
+        return self.phase >= Phase.PARTY
+
+    @property
+    def is_archive_mode(self) -> bool:
+        return self.phase == Phase.ARCHIVE
+
+    def phase_on(self, day: date) -> Phase:
+        """Фаза события в указанный день"""
+        if day >= self._archive_date:
+            return Phase.ARCHIVE
+        if day >= self._album_date:
+            return Phase.ALBUM
+        if day >= self._birthday:
+            return Phase.PARTY
+        return Phase.PRE_PARTY
+
+    def at(self, day: date, hhmm: str = "00:00") -> datetime:
+        """Момент времени в часовом поясе события (для планировщика)"""
+        hours, minutes = map(int, hhmm.split(":"))
+        return datetime(day.year, day.month, day.day, hours, minutes, tzinfo=self._tz)
+
+    def _ensure_fresh(self):
+        if time.time() >= self._refresh_at:
+            self._refresh()
+
+    def _refresh(self):
+        now = datetime.now(self._tz)
+        today = now.date()
+        self._today = today
+        self._days_until_birthday = (self._birthday - today).days
+        self._phase = self.phase_on(today)
+        self._refresh_at = self.at(today + timedelta(days=1)).timestamp()
+
+
+event_calendar = EventCalendar()
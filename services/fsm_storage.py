@@ -0,0 +1,158 @@
+"""
+Хранилище состояний FSM в SQLite рядом с bot.db
+
+Состояния переживают перезапуск бота: гость, который загружал фото или
+писал поздравление, продолжит с того же места. Чтение идет через LRU-кэш,
+запись - через очередь пакетной записи, заброшенные состояния удаляются
+по TTL.
+"""
+import asyncio
+import json
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
+
+from config.settings import FSM_CACHE_SIZE, FSM_STATE_TTL
+from services.database import db_pool
+from services.write_queue import write_queue
+
+logger = logging.getLogger(__name__)
+
+
+class _Record:
+    """Состояние и данные одного ключа в кэше"""
+
+    __slots__ = ("state", "data", "updated_at", "pending")
+
+    def __init__(self, state: Optional[str] = None, data: Dict[str, Any] = None,
+                 updated_at: float = 0.0):
+        self.state = state
+        self.data = data or {}
+        self.updated_at = updated_at
+        # Последняя еще не записанная в БД запись
+        self.pending = None
+
+
+class SQLiteStorage(BaseStorage):
+    """FSM-хранилище в таблице fsm_states
+
+    Args:
+        pool: Пул соединений для чтения
+        queue: Очередь записи, через которую изменения уходят в БД пачками
+        cache_size: Сколько ключей держать в памяти
+        ttl: Через сколько секунд без изменений состояние считается заброшенным
+    """
+
+    def __init__(self, pool=db_pool, queue=write_queue,
+                 cache_size: int = FSM_CACHE_SIZE, ttl: float = FSM_STATE_TTL):
+        self.pool = pool
+        self.queue = queue
+        self.cache_size = cache_size
+        self.ttl = ttl
+        self._cache = OrderedDict()
+
+    @staticmethod
+    def _key(key: StorageKey) -> str:
+        return f"{key.bot_id}:{key.chat_id}:{key.user_id}:{key.thread_id or ''}:{key.destiny}"
+
+    async def _get(self, key: StorageKey) -> _Record:
+        db_key = self._key(key)
+        record = self._cache.get(db_key)
+        if record is not None:
+            self._cache.move_to_end(db_key)
+            return record
+
+        async with self.pool.acquire() as db:
+            async with db.execute(
+                "SELECT state, data, updated_at FROM fsm_states WHERE key = ?", (db_key,)
+            ) as cursor:
+                row = await cursor.fetchone()
+
+        # Пока читали, ключ мог появиться в кэше - он свежее
+        record = self._cache.get(db_key)
+        if record is None:
+            record = _Record(row[0], json.loads(row[1]), row[2]) if row else _Record()
+            self._remember(db_key, record)
+        return record
+
+    def _remember(self, db_key: str, record: _Record):
+        self._cache[db_key] = record
+        self._cache.move_to_end(db_key)
+        if len(self._cache) <= self.cache_size:
+            return
+        # Выбрасываем самые старые записи, уже сохраненные в БД
+        for old_key in list(self._cache):
+            if len(self._cache) <= self.cache_size:
+                break
+            old = self._cache[old_key]
+            if old_key != db_key and (old.pending is None or old.pending.done()):
+                del self._cache[old_key]
+
+    def _write_back(self, db_key: str, record: _Record):
+        record.updated_at = time.time()
+        if record.state is None and not record.data:
+            sql, params = "DELETE FROM fsm_states WHERE key = ?", (db_key,)
+        else:
+            sql = """
+                INSERT INTO fsm_states (key, state, data, updated_at) VALUES (?, ?, ?, ?)
+                ON CONFLICT (key) DO UPDATE SET
+                    state = excluded.state, data = excluded.data, updated_at = excluded.updated_at
+            """
+            params = (db_key, record.state, json.dumps(record.data, ensure_ascii=False), record.updated_at)
+
+        future = self.queue.submit(sql, params)
+        future.add_done_callback(self._log_write_error)
+        record.pending = future
+        self._remember(db_key, record)
+
+    @staticmethod
+    def _log_write_error(future: asyncio.Future):
+        if not future.cancelled() and future.exception():
+            logger.error(f"Ошибка сохранения состояния FSM: {future.exception()}")
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        record = await self._get(key)
+        record.state = state.state if isinstance(state, State) else state
+        self._write_back(self._key(key), record)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        return (await self._get(key)).state
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        record = await self._get(key)
+        record.data = data.copy()
+        self._write_back(self._key(key), record)
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        return (await self._get(key)).data.copy()
+
+    async def cleanup(self) -> int:
+        """Удалить состояния, не менявшиеся дольше ttl. Возвращает число удаленных"""
+        try:
+            deadline = time.time() - self.ttl
+            for db_key in [k for k, r in self._cache.items() if r.updated_at and r.updated_at < deadline]:
+                del self._cache[db_key]
+
+            results = await self.queue.transaction([
+                ("DELETE FROM fsm_states WHERE updated_at < ?", (deadline,))
+            ])
+            removed = results[0].rowcount
+
+            if removed:
+                logger.info(f"🧹 Удалено заброшенных состояний FSM: {removed}")
+            return removed
+
+        except Exception as e:
+            logger.error(f"Ошибка очистки состояний FSM: {e}")
+            return 0
+
+    async def close(self) -> None:
+        """Дождаться записи всех изменений"""
+        pending = [r.pending for r in self._cache.values() if r.pending and not r.pending.done()]
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+        self._cache.clear()
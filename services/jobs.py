@@ -0,0 +1,313 @@
+"""
+Очередь долгих админских заданий (рассылки, альбом, поздравления)
+
+Команда админа только ставит задание в очередь и сразу отвечает; задания
+выполняются по одному в фоне. Состояние, прогресс и результат хранятся в
+таблице admin_jobs, так что их видно через /jobs и после перезапуска.
+Одинаковое задание нельзя поставить, пока предыдущее не закончилось.
+"""
+import asyncio
+import json
+import logging
+import sqlite3
+import time
+from collections import namedtuple
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest
+
+from services.database import db_pool
+from services.metrics import ADMIN_JOBS_QUEUED
+from services.write_queue import write_queue
+
+logger = logging.getLogger(__name__)
+
+JobKind = namedtuple("JobKind", ["run", "title", "format_progress"])
+
+# Зарегистрированные виды заданий: kind -> JobKind
+JOB_KINDS = {}
+
+STATUS_ICONS = {
+    'queued': '🕓',
+    'running': '⚙️',
+    'done': '✅',
+    'failed': '❌',
+    'cancelled': '🚫',
+    'interrupted': '⏸',
+}
+
+
+def register_job(kind: str, run, title: str, format_progress=None):
+    """Зарегистрировать вид задания
+
+    run(bot, params, report) выполняет задание и возвращает короткий текст
+    результата; report(progress) - корутина для сообщения прогресса (словарь
+    со статистикой рассылки или любыми полями). Если задан format_progress,
+    каждый отчет о прогрессе также правит статусное сообщение задания
+    текстом format_progress(progress).
+    """
+    JOB_KINDS[kind] = JobKind(run, title, format_progress)
+
+
+def format_job(job: dict) -> str:
+    """Строка задания для /jobs"""
+    kind = JOB_KINDS.get(job['kind'])
+    title = kind.title if kind else job['kind']
+    line = f"{STATUS_ICONS.get(job['status'], '•')} #{job['id']} {title} - {job['status']}"
+
+    progress = job.get('progress') or {}
+    if 'total' in progress:
+        done = progress.get('sent', 0) + progress.get('failed', 0)
+        line += f"\n    {done}/{progress['total']}, {progress.get('rate', 0):.1f} сообщ./с"
+    if job.get('result'):
+        line += f"\n    {job['result']}"
+    if job.get('error'):
+        line += f"\n    Ошибка: {job['error']}"
+    return line
+
+
+class JobQueue:
+    """Персистентная очередь админских заданий с одним исполнителем"""
+
+    def __init__(self, pool=db_pool):
+        self.pool = pool
+        self._queue = None
+        self._worker_task = None
+        self._bot = None
+        self._closing = False
+        # Выполняющееся задание: (job_id, task)
+        self._current = None
+        # Прогресс выполняющегося задания (в БД пишется тот же словарь)
+        self._progress = {}
+
+    @property
+    def is_running(self) -> bool:
+        return self._worker_task is not None
+
+    @property
+    def is_closing(self) -> bool:
+        """Идет остановка бота: прерванное задание не считается отмененным"""
+        return self._closing
+
+    def qsize(self) -> int:
+        """Количество заданий, ожидающих исполнителя"""
+        return self._queue.qsize() if self._queue else 0
+
+    async def start(self, bot: Bot):
+        """Запустить исполнителя
+
+        Задания, которые выполнялись при остановке, помечаются как
+        interrupted (рассылки сами доработаются через задания доставки),
+        а стоявшие в очереди ставятся обратно.
+        """
+        if self.is_running:
+            return
+
+        self._bot = bot
+        self._closing = False
+        self._queue = asyncio.Queue()
+
+        results = await write_queue.transaction([("""
+            UPDATE admin_jobs
+            SET status = 'interrupted', finished_at = CURRENT_TIMESTAMP
+            WHERE status = 'running'
+        """, ())])
+        interrupted = results[0].rowcount
+        async with self.pool.acquire() as db:
+            async with db.execute(
+                "SELECT id FROM admin_jobs WHERE status = 'queued' ORDER BY id"
+            ) as cursor:
+                queued = [row[0] for row in await cursor.fetchall()]
+
+        for job_id in queued:
+            self._queue.put_nowait(job_id)
+        if interrupted or queued:
+            logger.info(f"🗂 Админские задания: прервано {interrupted}, возвращено в очередь {len(queued)}")
+
+        self._worker_task = asyncio.create_task(self._worker(), name="admin-jobs")
+
+    async def close(self):
+        """Остановить исполнителя; выполняющееся задание станет interrupted"""
+        if not self.is_running:
+            return
+
+        self._closing = True
+        self._worker_task.cancel()
+        await asyncio.gather(self._worker_task, return_exceptions=True)
+        self._worker_task = None
+
+    async def submit(self, kind: str, params: dict = None, created_by: int = None,
+                     chat_id: int = None, status_message_id: int = None) -> tuple:
+        """Поставить задание в очередь
+
+        status_message_id - сообщение в chat_id, которое правится по ходу
+        выполнения. Возвращает (job_id, created): если такое же задание уже в
+        очереди или выполняется, новое не создается и возвращается id
+        существующего.
+        """
+        if kind not in JOB_KINDS:
+            raise ValueError(f"Неизвестный вид задания: {kind}")
+        if not self.is_running:
+            raise RuntimeError("Очередь админских заданий не запущена")
+
+        params = params or {}
+        params_json = json.dumps(params, ensure_ascii=False, sort_keys=True)
+        dedupe_key = f"{kind}:{params_json}"
+
+        try:
+            job_id = await write_queue.execute("""
+                INSERT INTO admin_jobs (kind, params, dedupe_key, created_by, chat_id, status_message_id)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, (kind, params_json, dedupe_key, created_by, chat_id, status_message_id))
+        except sqlite3.IntegrityError:
+            async with self.pool.acquire() as db:
+                async with db.execute("""
+                    SELECT id FROM admin_jobs
+                    WHERE dedupe_key = ? AND status IN ('queued', 'running')
+                """, (dedupe_key,)) as existing:
+                    row = await existing.fetchone()
+            if row:
+                return row[0], False
+            raise
+
+        self._queue.put_nowait(job_id)
+        logger.info(f"🗂 Задание #{job_id} ({kind}) поставлено в очередь")
+        return job_id, True
+
+    async def cancel(self, job_id: int) -> bool:
+        """Отменить задание из очереди или выполняющееся. False - нечего отменять"""
+        if self._current and self._current[0] == job_id:
+            self._current[1].cancel()
+            return True
+
+        cancelled = await write_queue.execute("""
+            UPDATE admin_jobs
+            SET status = 'cancelled', finished_at = CURRENT_TIMESTAMP
+            WHERE id = ? AND status = 'queued'
+        """, (job_id,))
+        return cancelled is not None
+
+    async def get(self, job_id: int) -> dict:
+        """Задание по id (None, если не найдено)"""
+        jobs = await self._select("WHERE id = ?", (job_id,))
+        return jobs[0] if jobs else None
+
+    async def list_jobs(self, recent: int = 5) -> list:
+        """Активные задания и несколько последних завершенных"""
+        active = await self._select("WHERE status IN ('queued', 'running') ORDER BY id", ())
+        finished = await self._select(
+            "WHERE status NOT IN ('queued', 'running') ORDER BY id DESC LIMIT ?", (recent,)
+        )
+        return active + finished
+
+    async def _select(self, where: str, params: tuple) -> list:
+        async with self.pool.acquire() as db:
+            async with db.execute(f"""
+                SELECT id, kind, params, status, progress, result, error, created_at, started_at, finished_at
+                FROM admin_jobs {where}
+            """, params) as cursor:
+                rows = await cursor.fetchall()
+
+        jobs = []
+        for row in rows:
+            job = {
+                'id': row[0], 'kind': row[1], 'params': json.loads(row[2]), 'status': row[3],
+                'progress': json.loads(row[4]) if row[4] else {}, 'result': row[5], 'error': row[6],
+                'created_at': row[7], 'started_at': row[8], 'finished_at': row[9],
+            }
+            # Для выполняющегося задания свежий прогресс лежит в памяти
+            if self._current and self._current[0] == job['id'] and self._progress:
+                job['progress'] = dict(self._progress)
+            jobs.append(job)
+        return jobs
+
+    async def _worker(self):
+        while True:
+            job_id = await self._queue.get()
+            try:
+                await self._run(job_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Ошибка исполнителя админских заданий (#{job_id}): {e}")
+
+    async def _run(self, job_id: int):
+        claimed = await write_queue.execute("""
+            UPDATE admin_jobs
+            SET status = 'running', started_at = CURRENT_TIMESTAMP
+            WHERE id = ? AND status = 'queued'
+        """, (job_id,))
+        if claimed is None:
+            # Задание отменили, пока оно ждало в очереди
+            return
+        async with self.pool.acquire() as db:
+            async with db.execute(
+                "SELECT kind, params, chat_id, status_message_id FROM admin_jobs WHERE id = ?", (job_id,)
+            ) as cursor:
+                kind, params, chat_id, status_message_id = await cursor.fetchone()
+
+        job_kind = JOB_KINDS.get(kind)
+        if job_kind is None:
+            # Задание из очереди, вид которого убрали из кода: иначе оно
+            # навсегда осталось бы running и держало свой ключ дедупликации
+            logger.error(f"Неизвестный вид админского задания #{job_id}: {kind}")
+            await self._finish(job_id, 'failed', None, 'unknown kind')
+            return
+        started = time.monotonic()
+        self._progress = {}
+
+        async def report(progress: dict):
+            self._progress = dict(progress)
+            await write_queue.execute(
+                "UPDATE admin_jobs SET progress = ? WHERE id = ?",
+                (json.dumps(self._progress, ensure_ascii=False), job_id)
+            )
+            if job_kind.format_progress and chat_id and status_message_id:
+                try:
+                    await self._bot.edit_message_text(
+                        job_kind.format_progress(self._progress),
+                        chat_id=chat_id, message_id=status_message_id
+                    )
+                except TelegramBadRequest:
+                    # Текст не изменился с прошлого обновления
+                    pass
+
+        status, result, error = 'done', None, None
+        task = asyncio.create_task(job_kind.run(self._bot, json.loads(params), report))
+        self._current = (job_id, task)
+        try:
+            result = await asyncio.shield(task)
+        except asyncio.CancelledError:
+            # Остановка бота отменяет исполнителя, /cancel_job - только задание
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+            status = 'interrupted' if self._closing else 'cancelled'
+            if self._closing:
+                await self._finish(job_id, status, result, error)
+                raise
+        except Exception as e:
+            status, error = 'failed', str(e)[:500]
+            logger.error(f"Ошибка админского задания #{job_id} ({kind}): {e}")
+        finally:
+            self._current = None
+
+        await self._finish(job_id, status, result, error)
+        logger.info(f"🗂 Задание #{job_id} ({kind}): {status} за {time.monotonic() - started:.1f} с")
+
+        if chat_id:
+            text = format_job(await self.get(job_id))
+            try:
+                await self._bot.send_message(chat_id, text)
+            except TelegramBadRequest as e:
+                logger.warning(f"Не удалось сообщить о завершении задания #{job_id}: {e}")
+
+    async def _finish(self, job_id: int, status: str, result, error):
+        await write_queue.execute("""
+            UPDATE admin_jobs
+            SET status = ?, result = ?, error = ?, finished_at = CURRENT_TIMESTAMP
+            WHERE id = ?
+        """, (status, result, error, job_id))
+
+
+job_queue = JobQueue()
+ADMIN_JOBS_QUEUED.set_function(job_queue.qsize)
@@ -0,0 +1,284 @@
+"""
+Метрики бота в текстовом формате Prometheus (отдаются веб-сервером на /metrics)
+
+Счетчики и гистограммы живут в памяти процесса и обновляются прямо в
+горячем пути: одно обращение к словарю и пара сложений, без блокировок
+(все происходит в одном event loop). Prometheus сам считает по ним
+скорости и перцентили.
+"""
+import abc
+import functools
+import logging
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+from apscheduler.events import (
+    EVENT_JOB_SUBMITTED,
+    EVENT_JOB_EXECUTED,
+    EVENT_JOB_ERROR,
+    EVENT_JOB_MISSED
+)
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Границы корзин гистограмм, секунды
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+DB_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+JOB_BUCKETS = (0.1, 0.5, 1.0, 5.0, 15.0, 30.0, 60.0, 300.0, 900.0, 3600.0)
+
+
+def _format_value(value) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return str(value) if isinstance(value, int) else repr(float(value))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(pairs) -> str:
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+class _Metric(abc.ABC):
+    """Общая часть метрик: имя, описание и значения по наборам меток"""
+
+    type = None
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        # Значения меток (в порядке labelnames) -> значение метрики
+        self._values = {}
+
+    def _reset(self):
+        """Метрика без меток видна с нуля еще до первого изменения"""
+        if not self.labelnames:
+            self._values[()] = 0
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    @abc.abstractmethod
+    def _samples(self):
+        """(суффикс имени, пары меток, значение) для вывода"""
+
+    def render(self) -> list:
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.type}",
+        ]
+        for suffix, pairs, value in self._samples():
+            lines.append(f"{self.name}{suffix}{_format_labels(pairs)} {_format_value(value)}")
+        return lines
+
+
+class Counter(_Metric):
+    """Счетчик, который только растет"""
+
+    type = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        super().__init__(name, documentation, labelnames)
+        self._reset()
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def _samples(self):
+        for key, value in self._values.items():
+            yield "", list(zip(self.labelnames, key)), value
+
+
+class Gauge(_Metric):
+    """Текущее значение: задается явно или читается функцией при каждом сборе"""
+
+    type = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        super().__init__(name, documentation, labelnames)
+        self._function = None
+        self._reset()
+
+    def set(self, value, **labels):
+        self._values[self._key(labels)] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set_function(self, function):
+        """Брать значение (для метрики без меток) из function() в момент сбора"""
+        self._function = function
+
+    def _samples(self):
+        if self._function is not None:
+            try:
+                yield "", [], self._function()
+            except Exception as e:
+                logger.warning(f"Не удалось получить значение метрики {self.name}: {e}")
+            return
+        for key, value in self._values.items():
+            yield "", list(zip(self.labelnames, key)), value
+
+
+class Histogram(_Metric):
+    """Распределение длительностей по корзинам плюс сумма и количество"""
+
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (),
+                 buckets: tuple = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        state = self._values.get(key)
+        if state is None:
+            # [попадания в каждую корзину и в +Inf, сумма, количество]
+            state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        state[0][bisect_left(self.buckets, value)] += 1
+        state[1] += value
+        state[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Замерить время блока with"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def _samples(self):
+        for key, (counts, total, count) in self._values.items():
+            pairs = list(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, hits in zip(self.buckets + (float("inf"),), counts):
+                cumulative += hits
+                yield "_bucket", pairs + [("le", _format_value(bound))], cumulative
+            yield "_sum", pairs, total
+            yield "_count", pairs, count
+
+
+class MetricsRegistry:
+    """Все метрики процесса в порядке регистрации"""
+
+    def __init__(self):
+        self._metrics = {}
+
+    def _register(self, metric: _Metric) -> _Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"Метрика {metric.name} уже зарегистрирована")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: tuple = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: tuple = ()) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: tuple = (),
+                  buckets: tuple = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        """Все метрики в текстовом формате Prometheus"""
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
+
+# === ОБРАБОТЧИКИ ОБНОВЛЕНИЙ ===
+HANDLER_UPDATES = metrics.counter(
+    "bot_handler_updates_total", "Обновления, дошедшие до обработчика",
+    ("router", "handler", "status")
+)
+HANDLER_SECONDS = metrics.histogram(
+    "bot_handler_seconds", "Время работы обработчика", ("router", "handler")
+)
+
+# === БАЗА ДАННЫХ ===
+DB_QUERY_SECONDS = metrics.histogram(
+    "bot_db_query_seconds", "Время работы хелпера БД", ("helper",), buckets=DB_BUCKETS
+)
+WRITE_QUEUE_DEPTH = metrics.gauge(
+    "bot_write_queue_depth", "Записи, ожидающие коммита в очереди записи"
+)
+
+# === TELEGRAM BOT API ===
+API_REQUESTS = metrics.counter(
+    "bot_api_requests_total", "Запросы к Bot API (status: ok, 429, error)",
+    ("method", "status")
+)
+API_SECONDS = metrics.histogram(
+    "bot_api_request_seconds", "Время запроса к Bot API", ("method",)
+)
+
+# === РАССЫЛКИ И ЗАДАНИЯ ===
+BROADCAST_PENDING = metrics.gauge(
+    "bot_broadcast_pending", "Чаты, которые идущие рассылки еще не обработали"
+)
+ADMIN_JOBS_QUEUED = metrics.gauge(
+    "bot_admin_jobs_queued", "Админские задания, ожидающие исполнителя"
+)
+SCHEDULER_JOBS = metrics.counter(
+    "bot_scheduler_jobs_total", "Запуски задач планировщика (status: ok, error, missed)",
+    ("job", "status")
+)
+SCHEDULER_JOB_SECONDS = metrics.histogram(
+    "bot_scheduler_job_seconds", "Время выполнения задачи планировщика", ("job",),
+    buckets=JOB_BUCKETS
+)
+
+
+def timed_query(func):
+    """Декоратор хелпера БД: время каждого вызова - в bot_db_query_seconds"""
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        with DB_QUERY_SECONDS.time(helper=func.__name__):
+            return await func(*args, **kwargs)
+    return wrapper
+
+
+def instrument_scheduler(scheduler):
+    """Считать запуски и длительность задач планировщика
+
+    Длительность - от передачи задачи исполнителю до ее завершения.
+    """
+    # (id задачи, плановое время запуска) -> момент передачи исполнителю
+    started = {}
+
+    def on_submitted(event):
+        for run_time in event.scheduled_run_times:
+            started[(event.job_id, run_time)] = time.perf_counter()
+
+    def on_finished(event):
+        if event.code == EVENT_JOB_MISSED:
+            SCHEDULER_JOBS.inc(job=event.job_id, status="missed")
+            return
+        began = started.pop((event.job_id, event.scheduled_run_time), None)
+        if began is not None:
+            SCHEDULER_JOB_SECONDS.observe(time.perf_counter() - began, job=event.job_id)
+        SCHEDULER_JOBS.inc(
+            job=event.job_id, status="error" if event.code == EVENT_JOB_ERROR else "ok"
+        )
+
+    scheduler.add_listener(on_submitted, EVENT_JOB_SUBMITTED)
+    scheduler.add_listener(on_finished, EVENT_JOB_EXECUTED | EVENT_JOB_ERROR | EVENT_JOB_MISSED)
@@ -0,0 +1,506 @@
+"""
+Версионные миграции схемы БД (по PRAGMA user_version)
+"""
+import asyncio
+import logging
+from collections import namedtuple
+
+from config.settings import BACKGROUND_MIGRATION_BATCH_SIZE, BACKGROUND_MIGRATION_PAUSE
+from services.database import db_pool
+
+logger = logging.getLogger(__name__)
+
+Migration = namedtuple("Migration", ["version", "description", "apply"])
+BackgroundMigration = namedtuple("BackgroundMigration", ["name", "description", "step"])
+
+
+# === МИГРАЦИИ ===
+async def _add_column_if_missing(db, table: str, column: str, definition: str):
+    """Добавить колонку в таблицу, созданную до появления миграций"""
+    async with db.execute(f"PRAGMA table_info({table})") as cursor:
+        column_names = [column_info[1] for column_info in await cursor.fetchall()]
+
+    if column not in column_names:
+        logger.info(f"Добавляем поле {column} в таблицу {table}")
+        await db.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+
+async def migration_0001_base_schema(db):
+    """Базовая схема (для старых БД досоздает недостающие поля)"""
+    # Таблица пользователей
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS users (
+            user_id INTEGER PRIMARY KEY,
+            username TEXT,
+            first_name TEXT,
+            last_name TEXT,
+            remembers_vika BOOLEAN DEFAULT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+    # Таблица поздравлений
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS wishes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            content_type TEXT,
+            content TEXT,
+            is_anonymous BOOLEAN DEFAULT 0,
+            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            delivered BOOLEAN DEFAULT 0,
+            FOREIGN KEY (user_id) REFERENCES users (user_id)
+        )
+    """)
+
+    # Таблица файлов альбома
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS album_files (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            file_id TEXT,
+            file_type TEXT,
+            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            sent_to_users BOOLEAN DEFAULT 0,
+            FOREIGN KEY (user_id) REFERENCES users (user_id)
+        )
+    """)
+
+    # Таблица предложений треков
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS song_requests (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            track_text TEXT,
+            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (user_id)
+        )
+    """)
+
+    # Таблица подтверждения участия
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS guest_confirmations (
+            user_id INTEGER PRIMARY KEY,
+            confirmed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+    # Таблица элементов вишлиста
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS wishlist_items (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            text TEXT NOT NULL,
+            added_by INTEGER,
+            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (added_by) REFERENCES users (user_id)
+        )
+    """)
+
+    # Таблица стартовых фото
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS start_photos (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            response_type TEXT,  -- 'yes' или 'no'
+            file_id TEXT,
+            caption TEXT,
+            is_active BOOLEAN DEFAULT 1,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+    # Поля, которые раньше добавлялись проверкой PRAGMA table_info на каждом старте
+    await _add_column_if_missing(db, "users", "remembers_vika", "BOOLEAN DEFAULT NULL")
+    await _add_column_if_missing(db, "album_files", "sent_to_users", "BOOLEAN DEFAULT 0")
+
+
+async def migration_0002_hot_query_indexes(db):
+    """Индексы под горячие запросы
+
+    На заполненных таблицах индекс строится долго, а эта транзакция держит
+    запуск бота, поэтому сами индексы строит фоновая миграция
+    hot_query_indexes (см. HOT_QUERY_INDEXES).
+    """
+
+
+async def migration_0003_background_migrations(db):
+    """Журнал завершенных фоновых миграций"""
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS background_migrations (
+            name TEXT PRIMARY KEY,
+            completed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+
+async def migration_0004_delivery_jobs(db):
+    """Задания доставки с учетом каждого получателя"""
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS delivery_jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind TEXT NOT NULL,
+            payload TEXT NOT NULL,  -- JSON
+            status TEXT NOT NULL DEFAULT 'pending',  -- 'pending' или 'done'
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            finished_at TIMESTAMP
+        )
+    """)
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS delivery_recipients (
+            job_id INTEGER NOT NULL,
+            chat_id INTEGER NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',  -- 'pending', 'sent' или 'failed'
+            attempts INTEGER NOT NULL DEFAULT 0,
+            last_error TEXT,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (job_id, chat_id),
+            FOREIGN KEY (job_id) REFERENCES delivery_jobs (id)
+        ) WITHOUT ROWID
+    """)
+    await db.execute("""
+        CREATE INDEX IF NOT EXISTS idx_delivery_jobs_unfinished
+        ON delivery_jobs (id)
+        WHERE status != 'done'
+    """)
+
+
+async def migration_0005_photo_deliveries(db):
+    """Журнал доставки фото каждому пользователю"""
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS photo_deliveries (
+            user_id INTEGER NOT NULL,
+            photo_id INTEGER NOT NULL,
+            delivered_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (user_id, photo_id)
+        ) WITHOUT ROWID
+    """)
+    await db.execute("""
+        CREATE INDEX IF NOT EXISTS idx_photo_deliveries_photo
+        ON photo_deliveries (photo_id)
+    """)
+    # Фото пользователям теперь выбираются по журналу, а не по sent_to_users;
+    # индекс idx_album_files_photos строит фоновая миграция hot_query_indexes
+    await db.execute("DROP INDEX IF EXISTS idx_album_files_unsent_photos")
+
+
+async def migration_0006_fsm_states(db):
+    """Состояния FSM, переживающие перезапуск"""
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS fsm_states (
+            key TEXT PRIMARY KEY,
+            state TEXT,
+            data TEXT NOT NULL DEFAULT '{}',
+            updated_at REAL NOT NULL
+        ) WITHOUT ROWID
+    """)
+    await db.execute("""
+        CREATE INDEX IF NOT EXISTS idx_fsm_states_updated_at
+        ON fsm_states (updated_at)
+    """)
+
+
+async def migration_0007_admin_jobs(db):
+    """Очередь долгих админских заданий"""
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS admin_jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind TEXT NOT NULL,
+            params TEXT NOT NULL DEFAULT '{}',  -- JSON
+            dedupe_key TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'queued',  -- queued, running, done, failed, cancelled, interrupted
+            progress TEXT,  -- JSON
+            result TEXT,
+            error TEXT,
+            created_by INTEGER,
+            chat_id INTEGER,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            started_at TIMESTAMP,
+            finished_at TIMESTAMP
+        )
+    """)
+    # Одно и то же задание не может стоять в очереди или выполняться дважды
+    await db.execute("""
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_admin_jobs_active
+        ON admin_jobs (dedupe_key)
+        WHERE status IN ('queued', 'running')
+    """)
+
+
+async def migration_0008_stats_counters(db):
+    """Счетчики для /stats и /users, которые ведут триггеры"""
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS stats_counters (
+            name TEXT PRIMARY KEY,
+            value INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+
+    # Начальные значения - один полный подсчет
+    await db.execute("""
+        INSERT OR REPLACE INTO stats_counters (name, value) VALUES
+            ('users', (SELECT COUNT(*) FROM users)),
+            ('remembers_vika', (SELECT COUNT(*) FROM users WHERE remembers_vika = 1)),
+            ('not_remembers_vika', (SELECT COUNT(*) FROM users WHERE remembers_vika = 0)),
+            ('wishes', (SELECT COUNT(*) FROM wishes)),
+            ('album_files', (SELECT COUNT(*) FROM album_files)),
+            ('song_requests', (SELECT COUNT(*) FROM song_requests)),
+            ('guest_confirmations', (SELECT COUNT(*) FROM guest_confirmations))
+    """)
+
+    # Пользователи: общее число и ответы на "помнишь Вику?"
+    await db.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_users_count_insert AFTER INSERT ON users
+        BEGIN
+            UPDATE stats_counters SET value = value + CASE name
+                WHEN 'users' THEN 1
+                WHEN 'remembers_vika' THEN NEW.remembers_vika IS 1
+                WHEN 'not_remembers_vika' THEN NEW.remembers_vika IS 0
+            END
+            WHERE name IN ('users', 'remembers_vika', 'not_remembers_vika');
+        END
+    """)
+    await db.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_users_count_delete AFTER DELETE ON users
+        BEGIN
+            UPDATE stats_counters SET value = value - CASE name
+                WHEN 'users' THEN 1
+                WHEN 'remembers_vika' THEN OLD.remembers_vika IS 1
+                WHEN 'not_remembers_vika' THEN OLD.remembers_vika IS 0
+            END
+            WHERE name IN ('users', 'remembers_vika', 'not_remembers_vika');
+        END
+    """)
+    await db.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_users_count_update
+        AFTER UPDATE OF remembers_vika ON users
+        WHEN OLD.remembers_vika IS NOT NEW.remembers_vika
+        BEGIN
+            UPDATE stats_counters SET value = value + CASE name
+                WHEN 'remembers_vika' THEN (NEW.remembers_vika IS 1) - (OLD.remembers_vika IS 1)
+                WHEN 'not_remembers_vika' THEN (NEW.remembers_vika IS 0) - (OLD.remembers_vika IS 0)
+            END
+            WHERE name IN ('remembers_vika', 'not_remembers_vika');
+        END
+    """)
+
+    # Остальные таблицы считаются целиком (имя счетчика совпадает с таблицей)
+    for table in ('wishes', 'album_files', 'song_requests', 'guest_confirmations'):
+        await db.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS trg_{table}_count_insert AFTER INSERT ON {table}
+            BEGIN
+                UPDATE stats_counters SET value = value + 1 WHERE name = '{table}';
+            END
+        """)
+        await db.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS trg_{table}_count_delete AFTER DELETE ON {table}
+            BEGIN
+                UPDATE stats_counters SET value = value - 1 WHERE name = '{table}';
+            END
+        """)
+
+
+async def migration_0009_guest_list_index(db):
+    """Индекс для постраничного списка гостей (по времени подтверждения)"""
+    await db.execute("""
+        CREATE INDEX IF NOT EXISTS idx_guest_confirmations_confirmed_at
+        ON guest_confirmations (confirmed_at, user_id)
+    """)
+
+
+async def migration_0010_drop_song_requests_timestamp_index(db):
+    """Индекс из миграции 2 обслуживал список треков по времени; теперь
+    список листается по id (PRIMARY KEY), и индекс только замедляет вставки"""
+    await db.execute("DROP INDEX IF EXISTS idx_song_requests_timestamp")
+
+
+async def migration_0011_admin_job_status_message(db):
+    """Сообщение со статусом задания, которое правится по ходу выполнения"""
+    await db.execute("ALTER TABLE admin_jobs ADD COLUMN status_message_id INTEGER")
+
+
+# Миграции применяются строго по возрастанию версии; номер - это user_version после миграции
+MIGRATIONS = [
+    Migration(1, "Базовая схема", migration_0001_base_schema),
+    Migration(2, "Индексы под горячие запросы", migration_0002_hot_query_indexes),
+    Migration(3, "Журнал фоновых миграций", migration_0003_background_migrations),
+    Migration(4, "Задания доставки", migration_0004_delivery_jobs),
+    Migration(5, "Журнал доставки фото", migration_0005_photo_deliveries),
+    Migration(6, "Состояния FSM", migration_0006_fsm_states),
+    Migration(7, "Очередь админских заданий", migration_0007_admin_jobs),
+    Migration(8, "Счетчики статистики", migration_0008_stats_counters),
+    Migration(9, "Индекс списка гостей", migration_0009_guest_list_index),
+    Migration(10, "Удаление индекса треков по времени", migration_0010_drop_song_requests_timestamp_index),
+    Migration(11, "Статусное сообщение админских заданий", migration_0011_admin_job_status_message),
+]
+
+# === ФОНОВЫЕ МИГРАЦИИ ===
+# Индексы на таблицах, где к моменту миграции уже могут быть данные
+# (миграции 2 и 5): имя -> запрос
+HOT_QUERY_INDEXES = {
+    'idx_wishes_undelivered': """
+        CREATE INDEX IF NOT EXISTS idx_wishes_undelivered
+        ON wishes (id)
+        WHERE delivered = 0
+    """,
+    'idx_wishes_user_id': """
+        CREATE INDEX IF NOT EXISTS idx_wishes_user_id
+        ON wishes (user_id)
+    """,
+    'idx_album_files_photos': """
+        CREATE INDEX IF NOT EXISTS idx_album_files_photos
+        ON album_files (file_type, timestamp, file_id)
+    """,
+}
+
+
+async def build_hot_query_indexes(db, batch_size: int) -> bool:
+    """Построить недостающие индексы под горячие запросы
+
+    SQLite строит индекс одним запросом, поэтому пачка здесь - один индекс:
+    между индексами писатель и обработчики успевают взять блокировку.
+    """
+    async with db.execute("SELECT name FROM sqlite_master WHERE type = 'index'") as cursor:
+        existing = {row[0] for row in await cursor.fetchall()}
+    missing = [sql for name, sql in HOT_QUERY_INDEXES.items() if name not in existing]
+    if not missing:
+        return True
+
+    await db.execute(missing[0])
+    return len(missing) == 1
+
+
+async def backfill_photo_deliveries(db, batch_size: int) -> bool:
+    """Перенести старый флаг sent_to_users в журнал доставки фото
+
+    Фото, разосланные до появления журнала, считаются доставленными всем
+    текущим пользователям. Берутся только фото без единой записи в журнале,
+    поэтому после перезапуска бэкфилл продолжается с того же места.
+    """
+    async with db.execute("SELECT COUNT(*) FROM users") as cursor:
+        users_count = (await cursor.fetchone())[0]
+    if not users_count:
+        return True
+
+    # batch_size - примерное число строк журнала за пачку
+    photos_per_batch = max(1, batch_size // users_count)
+    async with db.execute("""
+        SELECT id FROM album_files a
+        WHERE a.sent_to_users = 1 AND a.file_type = 'photo'
+        AND NOT EXISTS (SELECT 1 FROM photo_deliveries d WHERE d.photo_id = a.id)
+        ORDER BY id
+        LIMIT ?
+    """, (photos_per_batch,)) as cursor:
+        photo_ids = [row[0] for row in await cursor.fetchall()]
+    if not photo_ids:
+        return True
+
+    placeholders = ','.join('?' * len(photo_ids))
+    await db.execute(f"""
+        INSERT OR IGNORE INTO photo_deliveries (photo_id, user_id)
+        SELECT a.id, u.user_id
+        FROM album_files a CROSS JOIN users u
+        WHERE a.id IN ({placeholders})
+    """, photo_ids)
+    return False
+
+
+# Тяжелые миграции (бэкфиллы, перестроение индексов), которые выполняются
+# пачками уже после запуска бота. step(db, batch_size) возвращает True, когда
+# работа закончена; после каждой пачки делается commit и пауза.
+BACKGROUND_MIGRATIONS = [
+    BackgroundMigration(
+        "hot_query_indexes",
+        "Индексы под горячие запросы",
+        build_hot_query_indexes
+    ),
+    BackgroundMigration(
+        "photo_deliveries_backfill",
+        "Журнал доставки фото из флага sent_to_users",
+        backfill_photo_deliveries
+    ),
+]
+
+
+# === ВЫПОЛНЕНИЕ МИГРАЦИЙ ===
+async def get_schema_version(db) -> int:
+    """Текущая версия схемы"""
+    async with db.execute("PRAGMA user_version") as cursor:
+        return (await cursor.fetchone())[0]
+
+
+async def run_migrations(db) -> int:
+    """Применить все недостающие миграции одной транзакцией
+
+    Если схема актуальна, всё сводится к чтению PRAGMA user_version.
+    Возвращает итоговую версию схемы.
+    """
+    current_version = await get_schema_version(db)
+    pending = [migration for migration in MIGRATIONS if migration.version > current_version]
+
+    if not pending:
+        return current_version
+
+    target_version = pending[-1].version
+    logger.info(f"🧱 Схема БД v{current_version}, применяем миграции до v{target_version}")
+
+    await db.execute("BEGIN IMMEDIATE")
+    try:
+        for migration in pending:
+            logger.info(f"🧱 Миграция {migration.version}: {migration.description}")
+            await migration.apply(db)
+        await db.execute(f"PRAGMA user_version = {int(target_version)}")
+        await db.commit()
+    except Exception:
+        await db.rollback()
+        raise
+
+    logger.info(f"🧱 Схема БД обновлена до v{target_version}")
+    return target_version
+
+
+async def is_background_migration_done(name: str, pool=db_pool) -> bool:
+    """Завершена ли фоновая миграция"""
+    async with pool.acquire() as db:
+        async with db.execute(
+            "SELECT 1 FROM background_migrations WHERE name = ?", (name,)
+        ) as cursor:
+            return await cursor.fetchone() is not None
+
+
+async def run_background_migrations(pool=db_pool, batch_size: int = BACKGROUND_MIGRATION_BATCH_SIZE,
+                                    pause: float = BACKGROUND_MIGRATION_PAUSE):
+    """Выполнить незавершенные фоновые миграции пачками, не блокируя polling"""
+    if not BACKGROUND_MIGRATIONS:
+        return
+
+    try:
+        async with pool.acquire() as db:
+            async with db.execute("SELECT name FROM background_migrations") as cursor:
+                completed = {row[0] for row in await cursor.fetchall()}
+
+        for migration in BACKGROUND_MIGRATIONS:
+            if migration.name in completed:
+                continue
+
+            logger.info(f"🧱 Фоновая миграция {migration.name}: {migration.description}")
+            batches = 0
+            done = False
+            while not done:
+                async with pool.acquire() as db:
+                    done = await migration.step(db, batch_size)
+                    if done:
+                        await db.execute(
+                            "INSERT OR IGNORE INTO background_migrations (name) VALUES (?)",
+                            (migration.name,)
+                        )
+                    await db.commit()
+                batches += 1
+                # Отдаем соединение и event loop обработчикам между пачками
+                await asyncio.sleep(pause)
+
+            logger.info(f"🧱 Фоновая миграция {migration.name} завершена ({batches} пачек)")
+
+    except asyncio.CancelledError:
+        logger.info("🧱 Фоновые миграции прерваны, продолжим при следующем запуске")
+        raise
+    except Exception as e:
+        logger.error(f"Ошибка фоновой миграции: {e}")
@@ -0,0 +1,209 @@
+"""
+Ограничение скорости исходящих запросов к Telegram Bot API
+"""
+import asyncio
+import logging
+import time
+from collections import deque
+
+from aiogram.exceptions import TelegramRetryAfter
+
+from config.settings import (
+    TELEGRAM_GLOBAL_RATE,
+    TELEGRAM_PER_CHAT_RATE,
+    TELEGRAM_MAX_RETRIES,
+    TELEGRAM_MIN_GLOBAL_RATE,
+    TELEGRAM_RATE_BACKOFF,
+    TELEGRAM_RATE_RECOVERY,
+    TELEGRAM_GLOBAL_FLOOD_CHATS,
+    TELEGRAM_GLOBAL_FLOOD_WINDOW
+)
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """Корзина токенов с резервированием
+
+    Токены могут уходить в минус: каждый вызов acquire() резервирует слот и
+    спит ровно до его наступления, поэтому конкурентные отправители
+    обслуживаются по очереди без циклов опроса.
+    """
+
+    def __init__(self, rate: float, capacity: float = 1):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def reserve(self) -> float:
+        """Зарезервировать токен. Возвращает, сколько секунд ждать"""
+        now = time.monotonic()
+        self._refill(now)
+        self._tokens -= 1
+        return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+    async def acquire(self):
+        """Дождаться токена"""
+        delay = self.reserve()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def set_rate(self, rate: float):
+        """Поменять скорость, не теряя накопленные токены"""
+        self._refill(time.monotonic())
+        self.rate = rate
+
+    def pause(self, seconds: float):
+        """Не выдавать токены ближайшие seconds секунд"""
+        self._refill(time.monotonic())
+        self._tokens = min(self._tokens, 1 - seconds * self.rate)
+
+    def is_idle(self) -> bool:
+        """Корзина полная - о ней можно забыть"""
+        self._refill(time.monotonic())
+        return self._tokens >= self.capacity
+
+
+class OutboundLimiter:
+    """Адаптивный лимит отправки: глобальная корзина и корзина на каждый чат
+
+    Telegram разрешает около 30 сообщений в секунду на бота и около одного
+    сообщения в секунду в один чат. На flood control (TelegramRetryAfter)
+    чат ставится на паузу ровно на retry_after. Глобальная скорость
+    уменьшается в TELEGRAM_RATE_BACKOFF раз, только если за flood_window
+    секунд 429 получили flood_chats разных чатов (одиночные 429 относятся
+    к своему чату), и возвращается к global_rate со скоростью
+    TELEGRAM_RATE_RECOVERY сообщ./с за каждую прошедшую секунду.
+    """
+
+    # Сколько корзин чатов держать, прежде чем выбросить простаивающие
+    MAX_IDLE_CHAT_BUCKETS = 1000
+    # Окно (в секундах), по которому считается фактическая скорость
+    RATE_WINDOW = 10
+
+    def __init__(self, global_rate: float = TELEGRAM_GLOBAL_RATE,
+                 per_chat_rate: float = TELEGRAM_PER_CHAT_RATE,
+                 max_retries: int = TELEGRAM_MAX_RETRIES,
+                 min_global_rate: float = TELEGRAM_MIN_GLOBAL_RATE,
+                 backoff: float = TELEGRAM_RATE_BACKOFF,
+                 recovery: float = TELEGRAM_RATE_RECOVERY,
+                 flood_chats: int = TELEGRAM_GLOBAL_FLOOD_CHATS,
+                 flood_window: float = TELEGRAM_GLOBAL_FLOOD_WINDOW):
+        self.max_global_rate = global_rate
+        self.min_global_rate = min(min_global_rate, global_rate)
+        self.backoff = backoff
+        self.recovery = recovery
+        self.flood_chats = flood_chats
+        self.flood_window = flood_window
+        self.global_bucket = TokenBucket(global_rate)
+        self.per_chat_rate = per_chat_rate
+        self.max_retries = max_retries
+        self._chat_buckets = {}
+        self._sent_at = deque()
+        # Недавние 429: (время, chat_id)
+        self._floods = deque()
+        # Сниженная скорость и момент снижения (от него считается восстановление)
+        self._reduced_rate = global_rate
+        self._reduced_at = 0.0
+
+    def reset(self):
+        """Забыть подстройку скорости и состояние чатов"""
+        self.global_bucket = TokenBucket(self.max_global_rate)
+        self._chat_buckets = {}
+        self._sent_at.clear()
+        self._floods.clear()
+        self._reduced_rate = self.max_global_rate
+
+    @property
+    def current_rate(self) -> float:
+        """Текущий глобальный лимит после подстройки"""
+        self._recover(time.monotonic())
+        return self.global_bucket.rate
+
+    def achieved_rate(self) -> float:
+        """Фактическая скорость успешных запросов за последние RATE_WINDOW секунд"""
+        self._trim_sent(time.monotonic())
+        return len(self._sent_at) / self.RATE_WINDOW
+
+    def _trim_sent(self, now: float):
+        while self._sent_at and now - self._sent_at[0] > self.RATE_WINDOW:
+            self._sent_at.popleft()
+
+    def _on_success(self):
+        now = time.monotonic()
+        self._sent_at.append(now)
+        self._trim_sent(now)
+
+    def _recover(self, now: float):
+        """Вернуть глобальную скорость к лимиту пропорционально прошедшему времени"""
+        if self.global_bucket.rate >= self.max_global_rate:
+            return
+        rate = min(self.max_global_rate, self._reduced_rate + (now - self._reduced_at) * self.recovery)
+        if rate > self.global_bucket.rate:
+            self.global_bucket.set_rate(rate)
+
+    def _on_flood(self, chat_id: int, retry_after: float):
+        self._chat_bucket(chat_id).pause(retry_after)
+
+        now = time.monotonic()
+        self._floods.append((now, chat_id))
+        while now - self._floods[0][0] > self.flood_window:
+            self._floods.popleft()
+        if len({flood_chat for _, flood_chat in self._floods}) < self.flood_chats:
+            return
+
+        # Много разных чатов сразу - это лимит на бота, а не на отдельный чат
+        self._floods.clear()
+        self._recover(now)
+        rate = max(self.min_global_rate, self.global_bucket.rate / self.backoff)
+        if rate < self.global_bucket.rate:
+            self.global_bucket.set_rate(rate)
+            self._reduced_rate, self._reduced_at = rate, now
+            logger.warning(f"⏳ Глобальный лимит снижен до {rate:.1f} сообщ./с")
+
+    def _chat_bucket(self, chat_id: int) -> TokenBucket:
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            if len(self._chat_buckets) >= self.MAX_IDLE_CHAT_BUCKETS:
+                self._chat_buckets = {
+                    key: value for key, value in self._chat_buckets.items()
+                    if not value.is_idle()
+                }
+            bucket = TokenBucket(self.per_chat_rate)
+            self._chat_buckets[chat_id] = bucket
+        return bucket
+
+    async def call(self, chat_id: int, request, on_retry=None):
+        """Выполнить запрос к чату с учетом лимитов
+
+        request - функция без аргументов, возвращающая корутину (её можно
+        вызвать повторно). on_retry(retry_after) вызывается перед каждым
+        повтором после flood control.
+        """
+        attempt = 0
+        while True:
+            # Сначала ждем свой чат, чтобы не занимать глобальный слот впустую
+            await self._chat_bucket(chat_id).acquire()
+            self._recover(time.monotonic())
+            await self.global_bucket.acquire()
+            try:
+                result = await request()
+            except TelegramRetryAfter as e:
+                self._on_flood(chat_id, e.retry_after)
+                attempt += 1
+                if attempt > self.max_retries:
+                    raise
+                logger.warning(f"⏳ Flood control для чата {chat_id}, повтор через {e.retry_after} с")
+                if on_retry:
+                    on_retry(e.retry_after)
+                continue
+            self._on_success()
+            return result
+
+
+outbound_limiter = OutboundLimiter()
@@ -0,0 +1,59 @@
+"""
+Ограничение частоты входящих сообщений от пользователей (GCRA)
+"""
+import time
+from collections import OrderedDict
+
+from config.settings import RATE_LIMIT_MESSAGES, RATE_LIMIT_WINDOW, RATE_LIMIT_MAX_USERS
+
+
+class RateLimiter:
+    """Generic Cell Rate Algorithm: limit событий за window секунд на ключ
+
+    Для каждого ключа хранится одно число - теоретическое время прибытия
+    (TAT) следующего события по монотонным часам. Ключи, у которых TAT уже
+    в прошлом, ничем не отличаются от новых и выбрасываются; сверх max_keys
+    выбрасываются давно не писавшие.
+    """
+
+    def __init__(self, limit: int = RATE_LIMIT_MESSAGES, window: float = RATE_LIMIT_WINDOW,
+                 max_keys: int = RATE_LIMIT_MAX_USERS):
+        self.interval = window / limit
+        self.tolerance = self.interval * (limit - 1)
+        self.max_keys = max_keys
+        # key -> [tat, notified]; порядок - от давно обновленных к свежим
+        self._entries = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def hit(self, key) -> tuple:
+        """Учесть событие
+
+        Возвращает (allowed, retry_after, first_rejection): разрешено ли
+        событие, через сколько секунд будет разрешено следующее и впервые ли
+        ключ упёрся в лимит (чтобы предупредить пользователя один раз).
+        """
+        now = time.monotonic()
+        self._evict(now)
+
+        entry = self._entries.get(key)
+        tat = max(entry[0], now) if entry else now
+
+        if tat - now > self.tolerance:
+            retry_after = tat - self.tolerance - now
+            first_rejection = not entry[1]
+            entry[1] = True
+            return False, retry_after, first_rejection
+
+        self._entries[key] = [tat + self.interval, False]
+        self._entries.move_to_end(key)
+        return True, 0.0, False
+
+    def _evict(self, now: float):
+        # Слева лежат давно обновленные ключи: у них TAT скорее всего прошел
+        while self._entries:
+            key, (tat, _) = next(iter(self._entries.items()))
+            if tat > now and len(self._entries) < self.max_keys:
+                break
+            del self._entries[key]
@@ -0,0 +1,83 @@
+"""
+Встроенный aiohttp-сервер: приём webhook от Telegram, /health и /metrics
+"""
+import logging
+import time
+
+from aiohttp import web
+from aiogram import Bot, Dispatcher
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler
+
+from config.settings import (
+    BOT_MODE,
+    WEBHOOK_PATH,
+    WEBHOOK_SECRET,
+    WEB_SERVER_HOST,
+    WEB_SERVER_PORT
+)
+from services.database import db_pool
+from services.metrics import CONTENT_TYPE, metrics
+from services.write_queue import write_queue
+
+logger = logging.getLogger(__name__)
+
+
+class BackgroundRequestHandler(SimpleRequestHandler):
+    """Обработчик webhook, который отвечает Telegram сразу, а обновление
+    обрабатывает в фоне (лимит одновременных обновлений задает
+    UpdateConcurrencyMiddleware)"""
+
+    def __init__(self, dispatcher: Dispatcher, bot: Bot, **kwargs):
+        super().__init__(dispatcher, bot, handle_in_background=True, **kwargs)
+
+    async def _background_feed_update(self, bot: Bot, update):
+        try:
+            await super()._background_feed_update(bot, update)
+        except Exception as e:
+            logger.error(f"Ошибка обработки обновления из webhook: {e}")
+
+
+def build_web_app(dp: Dispatcher, bot: Bot, scheduler=None) -> web.Application:
+    """Собрать веб-приложение: /health и /metrics всегда, webhook - в режиме webhook"""
+    app = web.Application()
+    started = time.monotonic()
+
+    async def health(request: web.Request) -> web.Response:
+        checks = {
+            'database': db_pool.is_open,
+            'write_queue': write_queue.is_running,
+            'scheduler': scheduler.running if scheduler else True,
+        }
+        healthy = all(checks.values())
+        return web.json_response({
+            'status': 'ok' if healthy else 'degraded',
+            'mode': BOT_MODE,
+            'uptime': round(time.monotonic() - started, 1),
+            'write_queue_size': write_queue.qsize(),
+            **checks,
+        }, status=200 if healthy else 503)
+
+    async def metrics_endpoint(request: web.Request) -> web.Response:
+        return web.Response(text=metrics.render(), headers={'Content-Type': CONTENT_TYPE})
+
+    app.router.add_get('/health', health)
+    app.router.add_get('/metrics', metrics_endpoint)
+
+    if BOT_MODE == 'webhook':
+        BackgroundRequestHandler(
+            dispatcher=dp,
+            bot=bot,
+            secret_token=WEBHOOK_SECRET
+        ).register(app, path=WEBHOOK_PATH)
+
+    return app
+
+
+async def start_web_server(app: web.Application) -> web.AppRunner:
+    """Запустить веб-сервер на WEB_SERVER_HOST:WEB_SERVER_PORT"""
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, WEB_SERVER_HOST, WEB_SERVER_PORT)
+    await site.start()
+    logger.info(f"🌐 Веб-сервер запущен на {WEB_SERVER_HOST}:{WEB_SERVER_PORT}")
+    return runner
@@ -0,0 +1,200 @@
+"""
+Очередь записи в БД с единственным писателем
+
+Все записи во время работы бота идут через write_queue: так за блокировку
+записи SQLite не соревнуются несколько соединений пула. Напрямую пишут
+только миграции схемы (до запуска очереди) и фоновые миграции, которые
+сами делят работу на короткие пачки.
+"""
+import asyncio
+import logging
+from collections import namedtuple
+
+from config.settings import WRITE_QUEUE_FLUSH_INTERVAL, WRITE_QUEUE_MAX_BATCH
+from services.database import db_pool
+from services.metrics import WRITE_QUEUE_DEPTH
+
+logger = logging.getLogger(__name__)
+
+# Итог одного запроса транзакции
+WriteResult = namedtuple("WriteResult", ["lastrowid", "rowcount"])
+
+
+class _PendingWrite:
+    """Одна отложенная запись (один или несколько запросов) и ожидающий её future"""
+
+    __slots__ = ("statements", "future")
+
+    def __init__(self, statements: list, future: asyncio.Future):
+        self.statements = statements
+        self.future = future
+
+
+class WriteQueue:
+    """Очередь записей, которые один писатель коммитит пачками
+
+    Вместо commit (и fsync) на каждую строку писатель собирает все записи,
+    пришедшие за flush_interval секунд (но не больше max_batch), и коммитит
+    их одной транзакцией. execute() возвращается только после коммита (с
+    synchronous=FULL - уже на диске), так что обработчик может подтверждать
+    сохранение пользователю.
+    """
+
+    def __init__(self, pool=db_pool, flush_interval: float = WRITE_QUEUE_FLUSH_INTERVAL,
+                 max_batch: int = WRITE_QUEUE_MAX_BATCH):
+        self.pool = pool
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self._queue = None
+        self._batch_full = None
+        self._writer_task = None
+
+    @property
+    def is_running(self) -> bool:
+        """Запущен ли писатель"""
+        return self._writer_task is not None
+
+    def qsize(self) -> int:
+        """Количество записей, ожидающих коммита"""
+        return self._queue.qsize() if self._queue else 0
+
+    async def start(self):
+        """Запустить задачу-писателя"""
+        if self.is_running:
+            return
+
+        self._queue = asyncio.Queue()
+        self._batch_full = asyncio.Event()
+        self._writer_task = asyncio.create_task(self._writer(), name="db-write-queue")
+        logger.info("✍️ Очередь записи в БД запущена")
+
+    async def close(self):
+        """Дописать все накопленные записи и остановить писателя"""
+        if not self.is_running:
+            return
+
+        task = self._writer_task
+        self._writer_task = None
+        self._queue.put_nowait(None)
+        self._batch_full.set()
+        await task
+        logger.info("✍️ Очередь записи в БД остановлена, все записи сохранены")
+
+    def submit(self, sql: str, params: tuple = ()) -> asyncio.Future:
+        """Поставить запись в очередь
+
+        Возвращает future, который завершается списком WriteResult (по одному
+        на запрос) после коммита пачки или исключением, если именно эта
+        запись не прошла.
+        """
+        return self._put([(sql, tuple(params))])
+
+    def _put(self, statements: list) -> asyncio.Future:
+        if not self.is_running:
+            raise RuntimeError("Очередь записи в БД не запущена")
+
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait(_PendingWrite(statements, future))
+        if self._queue.qsize() >= self.max_batch:
+            self._batch_full.set()
+        return future
+
+    async def execute(self, sql: str, params: tuple = ()) -> int:
+        """Записать строку и дождаться коммита
+
+        Возвращает lastrowid (None, если запрос не изменил ни одной строки,
+        например INSERT ... ON CONFLICT DO NOTHING или UPDATE без совпадений).
+        """
+        result = (await self.submit(sql, params))[0]
+        return result.lastrowid if result.rowcount else None
+
+    async def transaction(self, statements) -> list:
+        """Выполнить пары (sql, params) одной транзакцией: все или ничего
+
+        Возвращает WriteResult для каждого запроса.
+        """
+        return await self._put([(sql, tuple(params)) for sql, params in statements])
+
+    async def _writer(self):
+        """Единственный писатель: собирает пачки и коммитит их"""
+        stopping = False
+        while not stopping:
+            first = await self._queue.get()
+            if first is None:
+                break
+
+            # Даем набежать остальным записям, но не дольше flush_interval
+            if self._queue.qsize() < self.max_batch - 1:
+                try:
+                    await asyncio.wait_for(self._batch_full.wait(), self.flush_interval)
+                except asyncio.TimeoutError:
+                    pass
+            self._batch_full.clear()
+
+            batch = [first]
+            while len(batch) < self.max_batch and not self._queue.empty():
+                item = self._queue.get_nowait()
+                if item is None:
+                    stopping = True
+                    continue
+                batch.append(item)
+
+            await self._write_batch(batch)
+
+        # При остановке дописываем всё, что успели поставить в очередь
+        remaining = []
+        while not self._queue.empty():
+            item = self._queue.get_nowait()
+            if item is not None:
+                remaining.append(item)
+        for i in range(0, len(remaining), self.max_batch):
+            await self._write_batch(remaining[i:i + self.max_batch])
+
+    async def _write_batch(self, batch: list):
+        """Закоммитить пачку одной транзакцией"""
+        try:
+            async with self.pool.acquire() as db:
+                try:
+                    results = [await self._execute_item(db, item) for item in batch]
+                    await db.commit()
+                except Exception as e:
+                    await db.rollback()
+                    logger.warning(f"Пачка из {len(batch)} записей не прошла ({e}), пишем по одной")
+                    await self._write_one_by_one(db, batch)
+                    return
+        except Exception as e:
+            logger.error(f"Ошибка записи пачки в БД: {e}")
+            for item in batch:
+                if not item.future.done():
+                    item.future.set_exception(e)
+            return
+
+        for item, result in zip(batch, results):
+            if not item.future.done():
+                item.future.set_result(result)
+
+    @staticmethod
+    async def _execute_item(db, item: _PendingWrite) -> list:
+        results = []
+        for sql, params in item.statements:
+            cursor = await db.execute(sql, params)
+            results.append(WriteResult(cursor.lastrowid, cursor.rowcount))
+        return results
+
+    async def _write_one_by_one(self, db, batch: list):
+        """Записать пачку построчно, чтобы ошибка одной строки не роняла остальные"""
+        for item in batch:
+            try:
+                result = await self._execute_item(db, item)
+                await db.commit()
+            except Exception as e:
+                await db.rollback()
+                if not item.future.done():
+                    item.future.set_exception(e)
+                continue
+            if not item.future.done():
+                item.future.set_result(result)
+
+
+write_queue = WriteQueue()
+WRITE_QUEUE_DEPTH.set_function(write_queue.qsize)
@@ -0,0 +1,70 @@
+"""
+Общие фикстуры тестов: настройки из окружения и свежая БД на каждый тест
+"""
+import asyncio
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+import pytest
+
+# config.settings читает окружение при импорте, поэтому оно задается до
+# импорта модулей бота
+os.environ.setdefault("BOT_TOKEN", "123456:TEST")
+os.environ.setdefault("ADMIN_IDS", "1,2")
+os.environ["DATABASE_PATH"] = str(Path(tempfile.mkdtemp()) / "bot.db")
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from handlers import utils  # noqa: E402
+from services.database import db_pool  # noqa: E402
+from services.jobs import job_queue  # noqa: E402
+from services.write_queue import write_queue  # noqa: E402
+
+
+class FakeBot:
+    """Бот без сети: запоминает отправленные сообщения"""
+
+    def __init__(self):
+        self.sent = []
+        self.edited = []
+
+    async def send_message(self, chat_id, text, **kwargs):
+        self.sent.append((chat_id, text))
+
+    async def edit_message_text(self, text, chat_id=None, message_id=None, **kwargs):
+        self.edited.append((chat_id, message_id, text))
+
+
+@pytest.fixture
+def bot() -> FakeBot:
+    return FakeBot()
+
+
+@pytest.fixture
+def database_path(tmp_path, monkeypatch) -> Path:
+    """Путь к пустой БД теста; пул и init_database смотрят на нее"""
+    path = tmp_path / "bot.db"
+    monkeypatch.setattr(utils, "DATABASE_PATH", path)
+    monkeypatch.setattr(db_pool, "path", path)
+    return path
+
+
+@pytest.fixture
+def run_with_database(database_path):
+    """Выполнить корутину scenario() на свежей БД с пулом и очередью записи"""
+    def run(scenario):
+        async def main():
+            await utils.init_database()
+            await db_pool.open()
+            await write_queue.start()
+            try:
+                return await scenario()
+            finally:
+                await job_queue.close()
+                await write_queue.close()
+                await db_pool.close()
+
+        return asyncio.run(main())
+
+    return run
@@ -0,0 +1,85 @@
+"""
+Задания доставки: возобновление после перезапуска только для оставшихся
+"""
+import asyncio
+
+import pytest
+
+from services.database import db_pool
+from services.delivery import (
+    SENDERS,
+    Sender,
+    create_delivery_job,
+    resume_delivery_jobs,
+    run_delivery_job
+)
+
+
+async def send_text(bot, chat_id: int, payload: dict, call):
+    await call(lambda: bot.send_message(chat_id, payload['text']))
+
+
+@pytest.fixture(autouse=True)
+def text_sender(monkeypatch):
+    # Один воркер: получатели обходятся по порядку chat_id
+    monkeypatch.setitem(SENDERS, 'text', Sender(send_text, 1))
+
+
+class StuckBot:
+    """Бот, который зависает на отправке в stuck_chat_id (как при остановке)"""
+
+    def __init__(self, stuck_chat_id: int):
+        self.stuck_chat_id = stuck_chat_id
+        self.sent = []
+        self.stuck = asyncio.Event()
+
+    async def send_message(self, chat_id, text, **kwargs):
+        if chat_id == self.stuck_chat_id:
+            self.stuck.set()
+            await asyncio.sleep(3600)
+        self.sent.append((chat_id, text))
+
+
+async def _recipients(job_id: int) -> dict:
+    async with db_pool.acquire() as db:
+        async with db.execute(
+            "SELECT chat_id, status FROM delivery_recipients WHERE job_id = ? ORDER BY chat_id", (job_id,)
+        ) as cursor:
+            return dict(await cursor.fetchall())
+
+
+async def _job_status(job_id: int) -> str:
+    async with db_pool.acquire() as db:
+        async with db.execute("SELECT status FROM delivery_jobs WHERE id = ?", (job_id,)) as cursor:
+            return (await cursor.fetchone())[0]
+
+
+def test_create_links_recipients_to_their_job(run_with_database):
+    async def scenario():
+        first = await create_delivery_job('text', {'text': 'a'}, [1, 2])
+        second = await create_delivery_job('text', {'text': 'b'}, [3])
+        return await _recipients(first), await _recipients(second)
+
+    assert run_with_database(scenario) == ({1: 'pending', 2: 'pending'}, {3: 'pending'})
+
+
+def test_resume_sends_only_to_pending_recipients(run_with_database, bot):
+    async def scenario():
+        job_id = await create_delivery_job('text', {'text': 'привет'}, [101, 102, 103])
+
+        # Первый запуск прерывается на втором получателе
+        stuck_bot = StuckBot(stuck_chat_id=102)
+        task = asyncio.create_task(run_delivery_job(stuck_bot, job_id))
+        await asyncio.wait_for(stuck_bot.stuck.wait(), timeout=5)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        assert stuck_bot.sent == [(101, 'привет')]
+        assert await _job_status(job_id) == 'pending'
+
+        await resume_delivery_jobs(bot)
+        return job_id, await _recipients(job_id), await _job_status(job_id)
+
+    job_id, recipients, status = run_with_database(scenario)
+    assert sorted(bot.sent) == [(102, 'привет'), (103, 'привет')]
+    assert recipients == {101: 'sent', 102: 'sent', 103: 'sent'}
+    assert status == 'done'
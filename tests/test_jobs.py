@@ -0,0 +1,73 @@
+"""
+Очередь админских заданий: дедупликация и отмена
+"""
+import asyncio
+
+import pytest
+
+from services.jobs import JOB_KINDS, JobKind, job_queue
+
+
+async def run_forever(bot, params, report):
+    await report({'step': 1})
+    await asyncio.sleep(3600)
+
+
+@pytest.fixture(autouse=True)
+def slow_job(monkeypatch):
+    monkeypatch.setitem(JOB_KINDS, 'slow', JobKind(run_forever, "Долгое задание", None))
+
+
+async def wait_for_status(job_id: int, status: str) -> dict:
+    for _ in range(200):
+        job = await job_queue.get(job_id)
+        if job['status'] == status:
+            return job
+        await asyncio.sleep(0.01)
+    raise AssertionError(f"Задание #{job_id} не перешло в {status}: {job['status']}")
+
+
+def test_same_job_is_not_queued_twice(run_with_database, bot):
+    async def scenario():
+        await job_queue.start(bot)
+        first = await job_queue.submit('slow', {'text': 'a'})
+        duplicate = await job_queue.submit('slow', {'text': 'a'})
+        other = await job_queue.submit('slow', {'text': 'b'})
+        return first, duplicate, other
+
+    (first_id, created), (duplicate_id, duplicate_created), (other_id, _) = run_with_database(scenario)
+    assert created and not duplicate_created
+    assert duplicate_id == first_id
+    assert other_id != first_id
+
+
+def test_cancel_queued_and_running_jobs(run_with_database, bot):
+    async def scenario():
+        await job_queue.start(bot)
+        running_id, _ = await job_queue.submit('slow', {'text': 'a'})
+        queued_id, _ = await job_queue.submit('slow', {'text': 'b'})
+        await wait_for_status(running_id, 'running')
+
+        assert await job_queue.cancel(queued_id)
+        assert (await job_queue.get(queued_id))['status'] == 'cancelled'
+        assert await job_queue.cancel(running_id)
+        running = await wait_for_status(running_id, 'cancelled')
+        assert running['progress'] == {'step': 1}
+
+        # Нечего отменять, а ключ дедупликации освободился
+        assert not await job_queue.cancel(queued_id)
+        _, created = await job_queue.submit('slow', {'text': 'a'})
+        assert created
+
+    run_with_database(scenario)
+
+
+def test_close_interrupts_running_job(run_with_database, bot):
+    async def scenario():
+        await job_queue.start(bot)
+        job_id, _ = await job_queue.submit('slow', {'text': 'a'})
+        await wait_for_status(job_id, 'running')
+        await job_queue.close()
+        return await job_queue.get(job_id)
+
+    assert run_with_database(scenario)['status'] == 'interrupted'
@@ -0,0 +1,121 @@
+"""
+Миграции схемы: с пустой и со старой (v0) БД до последней версии
+"""
+import asyncio
+
+import aiosqlite
+
+from services.database import db_pool
+from services.migrations import (
+    BACKGROUND_MIGRATIONS,
+    HOT_QUERY_INDEXES,
+    MIGRATIONS,
+    get_schema_version,
+    run_background_migrations,
+    run_migrations
+)
+
+LATEST_VERSION = MIGRATIONS[-1].version
+
+
+async def _names(db, object_type: str) -> set:
+    async with db.execute(
+        "SELECT name FROM sqlite_master WHERE type = ?", (object_type,)
+    ) as cursor:
+        return {row[0] for row in await cursor.fetchall()}
+
+
+async def _columns(db, table: str) -> set:
+    async with db.execute(f"PRAGMA table_info({table})") as cursor:
+        return {row[1] for row in await cursor.fetchall()}
+
+
+async def _create_legacy_schema(db):
+    """Схема бота до появления миграций: без remembers_vika и sent_to_users"""
+    await db.execute("""
+        CREATE TABLE users (
+            user_id INTEGER PRIMARY KEY,
+            username TEXT,
+            first_name TEXT,
+            last_name TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    await db.execute("""
+        CREATE TABLE album_files (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            file_id TEXT,
+            file_type TEXT,
+            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    await db.executemany(
+        "INSERT INTO users (user_id, first_name) VALUES (?, ?)",
+        [(10, "Аня"), (11, "Боря"), (12, "Вера")]
+    )
+    await db.execute("INSERT INTO album_files (user_id, file_id, file_type) VALUES (10, 'f1', 'photo')")
+    await db.commit()
+
+
+def test_fresh_database_migrates_to_latest(database_path):
+    async def scenario():
+        async with aiosqlite.connect(database_path) as db:
+            assert await get_schema_version(db) == 0
+            assert await run_migrations(db) == LATEST_VERSION
+            assert await get_schema_version(db) == LATEST_VERSION
+
+            tables = await _names(db, "table")
+            assert {
+                'users', 'wishes', 'album_files', 'delivery_jobs', 'delivery_recipients',
+                'photo_deliveries', 'fsm_states', 'admin_jobs', 'stats_counters',
+                'background_migrations'
+            } <= tables
+            assert 'status_message_id' in await _columns(db, "admin_jobs")
+            assert 'idx_song_requests_timestamp' not in await _names(db, "index")
+
+            # Повторный запуск ничего не применяет
+            assert await run_migrations(db) == LATEST_VERSION
+
+    asyncio.run(scenario())
+
+
+def test_legacy_database_keeps_data(database_path):
+    async def scenario():
+        async with aiosqlite.connect(database_path) as db:
+            await _create_legacy_schema(db)
+            assert await run_migrations(db) == LATEST_VERSION
+
+            assert {'remembers_vika'} <= await _columns(db, "users")
+            assert {'sent_to_users'} <= await _columns(db, "album_files")
+            async with db.execute(
+                "SELECT value FROM stats_counters WHERE name IN ('users', 'album_files') ORDER BY name"
+            ) as cursor:
+                assert [row[0] for row in await cursor.fetchall()] == [1, 3]
+
+    asyncio.run(scenario())
+
+
+def test_background_migrations_build_indexes_and_backfill(database_path):
+    async def scenario():
+        async with aiosqlite.connect(database_path) as db:
+            await _create_legacy_schema(db)
+            await run_migrations(db)
+            await db.execute("UPDATE album_files SET sent_to_users = 1")
+            await db.commit()
+
+        await db_pool.open()
+        try:
+            await run_background_migrations(db_pool, batch_size=2, pause=0)
+            async with db_pool.acquire() as db:
+                assert set(HOT_QUERY_INDEXES) <= await _names(db, "index")
+                async with db.execute("SELECT name FROM background_migrations") as cursor:
+                    completed = {row[0] for row in await cursor.fetchall()}
+                assert completed == {migration.name for migration in BACKGROUND_MIGRATIONS}
+                # Фото, разосланное до журнала, считается доставленным всем
+                async with db.execute("SELECT COUNT(*) FROM photo_deliveries") as cursor:
+                    assert (await cursor.fetchone())[0] == 3
+        finally:
+            await db_pool.close()
+
+    asyncio.run(scenario())
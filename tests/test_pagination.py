@@ -0,0 +1,34 @@
+"""
+Курсоры постраничных списков: ключ строки -> callback_data -> параметры запроса
+"""
+from handlers.admin import guest_key, parse_guest_key
+from handlers.pagination import LIST_VIEWS, ListPage, decode_cursor, encode_cursor
+
+
+def test_integer_key_round_trip():
+    view = LIST_VIEWS['song_requests']
+    row = (1234, "Трек", "Аня", "anya", "2025-01-01 12:00:00")
+
+    cursor = encode_cursor(view, row)
+    assert cursor == "1234"
+    assert view.parse_key(decode_cursor(cursor)) == (1234,)
+
+
+def test_guest_key_round_trip():
+    view = LIST_VIEWS['guests']
+    row = ("2025-03-08 19:05:42", 777, "Аня", None, "anya")
+
+    cursor = encode_cursor(view, row)
+    assert cursor == "20250308190542_777"
+    assert tuple(view.parse_key(decode_cursor(cursor))) == ("2025-03-08 19:05:42", 777)
+    assert parse_guest_key(guest_key(row)) == ("2025-03-08 19:05:42", 777)
+
+
+def test_cursor_fits_callback_data():
+    view = LIST_VIEWS['guests']
+    cursor = encode_cursor(view, ("2025-03-08 19:05:42", 2 ** 40, None, None, None))
+    packed = ListPage(view='guests', direction='next', cursor=cursor, page=99).pack()
+
+    # Telegram ограничивает callback_data 64 байтами
+    assert len(packed.encode()) <= 64
+    assert ListPage.unpack(packed).cursor == cursor
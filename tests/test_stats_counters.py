@@ -0,0 +1,31 @@
+"""
+Счетчики статистики: триггеры и пересчет после расхождения
+"""
+from handlers import utils
+from services.write_queue import write_queue
+
+
+def test_triggers_keep_counters(run_with_database):
+    async def scenario():
+        await utils.add_user(10, "anya", "Аня")
+        await utils.add_user(11, "borya", "Боря")
+        await utils.save_user_choice(10, True)
+        return await utils.get_stats_counters()
+
+    counters = run_with_database(scenario)
+    assert counters['users'] == 2
+    assert counters['remembers_vika'] == 1
+    assert counters['not_remembers_vika'] == 0
+
+
+def test_repair_reports_and_fixes_drift(run_with_database):
+    async def scenario():
+        await utils.add_user(10, "anya", "Аня")
+        await write_queue.execute("UPDATE stats_counters SET value = 42 WHERE name = 'users'")
+        drift = await utils.repair_stats_counters()
+        return drift, await utils.get_stats_counters(), await utils.repair_stats_counters()
+
+    drift, counters, second_drift = run_with_database(scenario)
+    assert drift == {'users': (42, 1)}
+    assert counters['users'] == 1
+    assert second_drift == {}